@@ -1,8 +1,14 @@
 #!/usr/bin/python
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class FoodsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'foods'
+
+    # Importing nutritracker.indexes registers its system check.
+    def ready(self):
+        from nutritracker.indexes import ensure_indexes_after_migrate
+        post_migrate.connect(ensure_indexes_after_migrate, sender=self)
@@ -0,0 +1,43 @@
+#!/usr/bin/python
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from foods.models import Food, food_name_index
+from nutritracker.utils import food_search_q_term
+
+
+class Command(BaseCommand):
+    help = ("Times local food searches against the foods collection two ways: the chained food_name icontains "
+            "filter local search falls back to while the trigram index is first built, and the in-memory trigram "
+            "index.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("queries", nargs="*", default=["chedd", "yog", "bread", "whole wheat", "ogurt", "nut butter"],
+                            help="search queries to time")
+        parser.add_argument("--repetitions", type=int, default=10, help="number of times to run each search")
+
+    def handle(self, *args, **options):
+        repetitions = options["repetitions"]
+
+        # The trigram index is built here in the foreground, and timed
+        # separately so it doesn't skew the per-query numbers.
+        start_time = time.perf_counter()
+        food_name_index.build()
+        build_time = time.perf_counter() - start_time
+        self.stdout.write(f"built trigram index over {len(food_name_index.names)} foods in {build_time * 1000:.1f}ms")
+
+        icontains_search = lambda search_query: list(
+            Food.objects.filter(food_search_q_term(search_query)).order_by('food_name', '_id'))
+        trigram_search = lambda search_query: food_name_index.search(search_query)
+
+        self.stdout.write(f"{'query':<20}{'method':<16}{'matches':>10}{'ms/search':>12}")
+        for search_query in options["queries"]:
+            for method_name, search_callable in (("icontains", icontains_search),
+                                                 ("trigram index", trigram_search)):
+                start_time = time.perf_counter()
+                for _ in range(repetitions):
+                    results = search_callable(search_query)
+                elapsed_ms = (time.perf_counter() - start_time) * 1000 / repetitions
+                self.stdout.write(f"{search_query:<20}{method_name:<16}{len(results):>10}{elapsed_ms:>12.2f}")
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from foods.models import Food
+from nutritracker.utils import title_case
+
+
+class Command(BaseCommand):
+    help = ("Times title casing a corpus of food names: with title_case()'s memoization bypassed, memoized starting "
+            "from an empty cache, and memoized with the cache already warm. The corpus is synthetic, built to look "
+            "like FoodData Central descriptions, unless --from-db is given.")
+
+    # FDC descriptions are either comma-separated SR Legacy style names, such as
+    # "Cheese, cheddar, sharp, sliced", or upper case Branded ones.
+    vocabulary = ("almond", "apple", "bagel", "bar", "barbecue", "bean", "beef", "blueberry", "boneless", "bread",
+                  "breast", "broccoli", "brown", "butter", "canned", "carrot", "cereal", "cheddar", "cheese", "chicken",
+                  "chips", "chocolate", "chopped", "cinnamon", "cooked", "corn", "cracker", "cream", "crispy", "diced",
+                  "dried", "drained", "egg", "enriched", "fat", "free", "fresh", "fried", "frozen", "garlic", "grain",
+                  "granola", "greek", "ground", "ham", "honey", "juice", "lean", "lemon", "low", "milk", "mix",
+                  "mozzarella", "multigrain", "nonfat", "oat", "oil", "olive", "onion", "orange", "organic", "pasta",
+                  "peanut", "pepper", "plain", "pork", "potato", "raw", "reduced", "rice", "roasted", "salad", "salted",
+                  "sauce", "sharp", "shredded", "sliced", "smoked", "soup", "sour", "spinach", "strawberry", "sugar",
+                  "sweet", "tomato", "turkey", "unsalted", "vanilla", "vegetable", "wheat", "white", "whole", "yogurt")
+
+    connectives = ("and", "with", "in", "of", "or", "w/", "&", "'n'")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--names", type=int, default=100000, help="number of names in the corpus")
+        parser.add_argument("--distinct", type=int, default=20000,
+                            help="number of distinct names among them; page views show the popular foods over and "
+                                 "over, so they're drawn with Zipf-like frequencies")
+        parser.add_argument("--from-db", action="store_true",
+                            help="use the names of the foods in the foods collection as the corpus instead")
+
+    def handle(self, *args, **options):
+        if options["from_db"]:
+            corpus = [food_doc.get('food_name', '').lower()
+                      for food_doc in Food.objects.mongo_find({}, {'food_name': True})]
+        else:
+            corpus = self._synthetic_corpus(options["names"], options["distinct"])
+        if not corpus:
+            self.stdout.write("no names to title case")
+            return
+
+        uncached_title_case = title_case.__wrapped__
+
+        def uncached():
+            for food_name in corpus:
+                uncached_title_case(food_name)
+
+        def memoized():
+            for food_name in corpus:
+                title_case(food_name)
+
+        def memoized_cold():
+            title_case.cache_clear()
+            memoized()
+
+        self.stdout.write(f"{len(corpus)} names, {len(set(corpus))} distinct")
+        self.stdout.write(f"{'method':<24}{'ms/run':>10}{'names/s':>14}")
+        for method_name, method_callable in (("uncached", uncached),
+                                             ("memoized, cold cache", memoized_cold),
+                                             ("memoized, warm cache", memoized)):
+            start_time = time.perf_counter()
+            method_callable()
+            elapsed = time.perf_counter() - start_time
+            self.stdout.write(f"{method_name:<24}{elapsed * 1000:>10.2f}{len(corpus) / elapsed:>14,.0f}")
+        cache_info = title_case.cache_info()
+        self.stdout.write(f"cache: {cache_info.hits} hits, {cache_info.misses} misses, {cache_info.currsize} entries")
+
+    def _synthetic_corpus(self, number_of_names, number_of_distinct):
+        random_obj = random.Random(0)
+        distinct_names = list()
+        for _ in range(number_of_distinct):
+            if random_obj.random() < 0.6:
+                words = random_obj.sample(self.vocabulary, random_obj.randint(2, 6))
+                if random_obj.random() < 0.3:
+                    words.insert(random_obj.randint(1, len(words) - 1), random_obj.choice(self.connectives))
+                food_name = " ".join(words).upper()
+            else:
+                clauses = [" ".join(random_obj.sample(self.vocabulary, random_obj.randint(1, 2)))
+                           for _ in range(random_obj.randint(1, 4))]
+                food_name = ", ".join(clauses)
+            distinct_names.append(food_name.lower())
+        weights = [1 / rank for rank in range(1, number_of_distinct + 1)]
+        return random_obj.choices(distinct_names, weights, k=number_of_names)
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+
+import pymongo.errors
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nutritracker.indexes import declared_indexes, ensure_index, index_status
+
+
+class Command(BaseCommand):
+    help = ("Creates the MongoDB indexes declared in the Meta classes of the project's models, replacing any that "
+            "differ from their declarations. With --check, only reports the ones that are missing or differ. With "
+            "--stats, also reports how often each index in those models' collections has been used since the "
+            "server started, flagging unused and undeclared ones.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="report absent indexes without creating them, "
+                                                                 "and exit with an error if there are any")
+        parser.add_argument("--stats", action="store_true", help="report index usage from $indexStats")
+
+    def handle(self, *args, **options):
+        absent_count = 0
+        declared_names = dict()
+        for model, index_name, index_keys, index_options in declared_indexes():
+            declared_names.setdefault(model._meta.db_table, (model, set()))[1].add(index_name)
+            if options["check"]:
+                status = index_status(model, index_name, index_keys, index_options)
+                absent_count += status != 'present'
+                self.stdout.write(f"index '{index_name}' on '{model._meta.db_table}' is {status}")
+                continue
+            try:
+                status = ensure_index(model, index_name, index_keys, index_options)
+            except pymongo.errors.DuplicateKeyError as exception:
+                raise CommandError(f"can't create unique index '{index_name}' on '{model._meta.db_table}', the "
+                                   f"collection has duplicate values: {exception.details.get('errmsg')}")
+            self.stdout.write(f"index '{index_name}' on '{model._meta.db_table}' "
+                              + {'present': "is present", 'missing': "was created", 'different': "was replaced"}[status])
+
+        if options["stats"]:
+            for db_table, (model, index_names) in declared_names.items():
+                self._write_index_stats(model, index_names)
+
+        if options["check"] and absent_count:
+            raise CommandError(f"{absent_count} declared indexes are missing or differ from their declarations")
+
+    # $indexStats counts are per server and reset when it restarts, so an
+    # index showing as unused may only be unused recently.
+    def _write_index_stats(self, model, index_names):
+        db_table = model._meta.db_table
+        try:
+            index_stats_docs = list(model.objects.mongo_aggregate([{'$indexStats': {}}]))
+        except (pymongo.errors.OperationFailure, NotImplementedError) as exception:
+            self.stderr.write(f"unable to retrieve $indexStats for '{db_table}': {exception}")
+            return
+        for index_stats_doc in sorted(index_stats_docs, key=lambda index_stats_doc: index_stats_doc['name']):
+            index_name = index_stats_doc['name']
+            accesses = index_stats_doc['accesses']
+            notes = list()
+            if index_name != '_id_' and index_name not in index_names:
+                notes.append("undeclared")
+            if not accesses['ops']:
+                notes.append("unused")
+            self.stdout.write(f"index '{index_name}' on '{db_table}': {accesses['ops']} uses since "
+                              f"{accesses['since']:%Y-%m-%d %H:%M}" + (f" ({', '.join(notes)})" if notes else ""))
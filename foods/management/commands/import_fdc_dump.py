@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+import io
+import zipfile
+
+from pymongo import UpdateOne
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from foods.models import Food, result_counts
+from recipes.models import refresh_recipe_totals
+from nutritracker.utils import Food_Detailed, iterate_json_array
+
+
+class Command(BaseCommand):
+    help = ("Loads foods into the foods collection from FoodData Central JSON dump files (the SR Legacy and Branded "
+            "downloads from fdc.nal.usda.gov, either the .zip or the extracted .json), replacing any food already "
+            "stored with the same fdc_id. The files are read incrementally, so they needn't fit in memory, and no "
+            "network access is needed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("dump_files", nargs="+", help="paths to FDC JSON dump files, .json or .zip")
+        parser.add_argument("--batch-size", type=int, default=1000, help="number of foods per bulk write")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        verbosity = options["verbosity"]
+
+        # Upserting on fdc_id is only fast with an index on fdc_id.
+        call_command("ensure_indexes", verbosity=0, stdout=io.StringIO())
+
+        counts = {'read': 0, 'skipped': 0, 'inserted': 0, 'updated': 0}
+        for dump_file in options["dump_files"]:
+            updates = list()
+            fdc_ids = list()
+            with self._open_dump_file(dump_file) as dump_fh:
+                for food_json_obj in iterate_json_array(dump_fh):
+                    counts['read'] += 1
+                    if not Food_Detailed.is_usable_json_object(food_json_obj):
+                        counts['skipped'] += 1
+                        continue
+                    # The dumps hold the same food objects the FDC API
+                    # returns, so they're mapped the same way foods_fdc_import
+                    # maps them.
+                    food_doc = Food_Detailed.from_fdc_json_obj(food_json_obj).to_model_cls_args()
+                    updates.append(UpdateOne({'fdc_id': food_doc['fdc_id']}, {'$set': food_doc}, upsert=True))
+                    fdc_ids.append(food_doc['fdc_id'])
+                    if len(updates) == batch_size:
+                        self._write_batch(updates, fdc_ids, counts)
+                        updates = list()
+                        fdc_ids = list()
+                        if verbosity >= 2:
+                            self.stdout.write(f"{dump_file}: {counts['read']} foods read")
+            if updates:
+                self._write_batch(updates, fdc_ids, counts)
+        # Tells the web app's processes to recount the foods collection.
+        result_counts.invalidate(Food)
+        self.stdout.write(f"{counts['read']} foods read, {counts['inserted']} inserted, {counts['updated']} updated, "
+                          f"{counts['skipped']} skipped as unusable")
+
+    def _open_dump_file(self, dump_file):
+        try:
+            if not zipfile.is_zipfile(dump_file):
+                return open(dump_file, "r", encoding="utf-8")
+            zip_file = zipfile.ZipFile(dump_file)
+        except OSError as exception:
+            raise CommandError(f"unable to open {dump_file}: {exception.strerror}")
+        json_members = [member for member in zip_file.namelist() if member.endswith(".json")]
+        if len(json_members) != 1:
+            raise CommandError(f"expected {dump_file} to contain exactly one .json file, found {len(json_members)}")
+        return io.TextIOWrapper(zip_file.open(json_members[0]), encoding="utf-8")
+
+    # Recipes that use the batch's foods by reference have their stored
+    # totals summed again from the foods as they are now.
+    def _write_batch(self, updates, fdc_ids, counts):
+        # Unordered, so the server can apply the batch in parallel and one bad
+        # document doesn't stop the rest.
+        result = Food.objects.mongo_bulk_write(updates, ordered=False)
+        counts['inserted'] += result.upserted_count
+        counts['updated'] += result.matched_count
+        refresh_recipe_totals(fdc_ids)
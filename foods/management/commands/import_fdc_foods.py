@@ -0,0 +1,51 @@
+#!/usr/bin/python
+
+import io
+
+from pymongo import UpdateOne
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from foods.models import Food, result_counts
+from recipes.models import refresh_recipe_totals
+# Importing the views configures Fdc_Api_Contacter's session and response
+# cache from the environment, same as for the web app.
+from foods.views import FDC_API_KEY
+from nutritracker.utils import Fdc_Api_Contacter
+
+
+class Command(BaseCommand):
+    help = ("Looks foods up by FDC ID through the FoodData Central API and stores them in the foods collection, "
+            "replacing any food already stored with the same fdc_id. The IDs are looked up in batches, several foods "
+            "per request.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("fdc_ids", nargs="+", type=int, help="FDC IDs of the foods to import")
+
+    def handle(self, *args, **options):
+        call_command("ensure_indexes", verbosity=0, stdout=io.StringIO())
+
+        api_contacter = Fdc_Api_Contacter(FDC_API_KEY)
+        updates = list()
+        fdc_ids = list()
+        for fdc_id, food_obj in api_contacter.look_up_fdc_ids(options["fdc_ids"]).items():
+            if food_obj is None:
+                self.stderr.write(f"No such FDC ID in the FoodData Central database: {fdc_id}")
+                continue
+            elif food_obj is False:
+                self.stderr.write(f"The food with FDC ID {fdc_id} has no usable serving size data, skipping")
+                continue
+            food_doc = food_obj.to_model_cls_args()
+            updates.append(UpdateOne({'fdc_id': food_doc['fdc_id']}, {'$set': food_doc}, upsert=True))
+            fdc_ids.append(food_doc['fdc_id'])
+        if not updates:
+            self.stdout.write("0 foods imported")
+            return
+        result = Food.objects.mongo_bulk_write(updates, ordered=False)
+        # Tells the web app's processes to recount the foods collection.
+        result_counts.invalidate(Food)
+        # Recipes that use these foods by reference are brought up to date.
+        refresh_recipe_totals(fdc_ids)
+        self.stdout.write(f"{len(updates)} foods imported, {result.upserted_count} inserted, "
+                          f"{result.matched_count} updated")
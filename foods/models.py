@@ -2,12 +2,42 @@
 
 from djongo import models
 
+from nutritracker.utils import title_case, food_search_q_term, food_content_hash, Trigram_Index, Result_Count_Cache, \
+        Mongo_Generation_Store
 
-class Food(models.Model):
+
+# Remembers the fdc_id and food_content_hash() of a food as it was loaded, so
+# that saving it only refreshes the nutrient totals of the recipes that use it
+# when its contents changed. Foods loaded with deferred fields, or not loaded
+# at all, are taken to have changed.
+class food_content_tracking:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        food_model_obj = super().from_db(db, field_names, values)
+        food_model_obj._note_saved_content()
+        return food_model_obj
+
+    def _note_saved_content(self):
+        self._saved_content = (None if self.get_deferred_fields()
+                               else (self.fdc_id, food_content_hash(self.__dict__)))
+
+    # The FDC IDs whose recipes' totals a save changes.
+    def _changed_fdc_ids(self):
+        saved_content = getattr(self, '_saved_content', None)
+        if saved_content is None:
+            return (self.fdc_id,)
+        saved_fdc_id, saved_content_hash = saved_content
+        if saved_fdc_id != self.fdc_id:
+            return (saved_fdc_id, self.fdc_id)
+        return () if saved_content_hash == food_content_hash(self.__dict__) else (self.fdc_id,)
+
+
+class Food(food_content_tracking, models.Model):
     _id                    = models.ObjectIdField(primary_key=True)
     fdc_id                 = models.PositiveIntegerField(     default=0,  verbose_name="Food Data Central ID")
     nt_hash_id             = models.PositiveIntegerField(     default=0,  verbose_name="Nutritracker hash ID")
     food_name              = models.CharField(max_length=200, default="", verbose_name="Food name")
+    display_name           = models.CharField(max_length=200, default="", verbose_name="Food name, title cased")
     serving_size           = models.FloatField(               default=1,  verbose_name="Serving size")
     serving_units          = models.CharField(max_length=30,  default="", verbose_name="Serving units")
     energy_kcal            = models.PositiveSmallIntegerField(default=0,  verbose_name="Energy (kcal)")
@@ -37,7 +67,113 @@ class Food(models.Model):
     zinc_mg                = models.PositiveSmallIntegerField(default=0,  verbose_name="Zinc (mg)")
     copper_mg              = models.PositiveSmallIntegerField(default=0,  verbose_name="Copper (mg)")
 
+    objects = models.DjongoManager()
+
     class Meta:
         managed = False
         db_table = 'foods'
         app_label = 'foods'
+        # This model is unmanaged, so these are never created by a migration;
+        # `./manage.py ensure_indexes` creates them.
+        indexes = [models.Index(fields=['food_name', '_id'], name='food_name'),
+                   models.Index(fields=['fdc_id'], name='fdc_id')]
+
+    # Options for `./manage.py ensure_indexes` to pass to create_index(),
+    # which Django's Index has no way to express. Foods added by hand have no
+    # FDC ID and are stored with fdc_id 0, so only positive ones are unique.
+    index_options = {'fdc_id': {'unique': True, 'partialFilterExpression': {'fdc_id': {'$gt': 0}}}}
+
+    # Title casing is done once here rather than every time the food is
+    # displayed; see Food_Row.
+    def save(self, *args, **kwargs):
+        self.display_name = title_case(self.food_name.lower())
+        super().save(*args, **kwargs)
+        food_name_index.add(self._id, self.food_name, result_counts.invalidate(Food))
+        changed_fdc_ids = self._changed_fdc_ids()
+        self._note_saved_content()
+        if changed_fdc_ids:
+            _refresh_recipe_totals(changed_fdc_ids)
+
+    def delete(self, *args, **kwargs):
+        mongodb_id, fdc_id = self._id, self.fdc_id
+        retval = super().delete(*args, **kwargs)
+        food_name_index.remove(mongodb_id, result_counts.invalidate(Food))
+        _refresh_recipe_totals((fdc_id,))
+        return retval
+
+
+# See recipes.models.refresh_recipe_totals(). That module imports this one,
+# so it's imported when it's first needed rather than at the top.
+def _refresh_recipe_totals(fdc_ids):
+    from recipes.models import refresh_recipe_totals
+    return refresh_recipe_totals(fdc_ids)
+
+
+# Returns the set of the given FDC IDs that are in the foods collection. It's
+# one query, answered from the fdc_id index without reading any documents.
+# The $gt matches the index's partial filter, which MongoDB requires to use it.
+def fdc_ids_in_db(fdc_ids):
+    return {food_doc['fdc_id'] for food_doc in Food.objects.mongo_find({'fdc_id': {'$in': list(fdc_ids), '$gt': 0}},
+                                                                        {'fdc_id': True, '_id': False})}
+
+
+# The shared backing store for Fdc_Api_Contacter's response cache; see
+# Mongo_Response_Store.
+class Fdc_Response(models.Model):
+    _id        = models.CharField(max_length=200, primary_key=True)
+    response   = models.JSONField(default=None, null=True)
+    expires_at = models.DateTimeField()
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        managed = False
+        db_table = 'fdc_responses'
+        app_label = 'foods'
+        indexes = [models.Index(fields=['expires_at'], name='expires_at')]
+
+    # Options for `./manage.py ensure_indexes` to pass to create_index(),
+    # which Django's Index has no way to express. With expireAfterSeconds=0
+    # the server deletes each document once its expires_at time has passed.
+    index_options = {'expires_at': {'expireAfterSeconds': 0}}
+
+
+# One document per collection, counting the writes to it; see
+# nutritracker.utils.Result_Count_Cache.
+class Result_Count_Generation(models.Model):
+    _id        = models.CharField(max_length=200, primary_key=True)
+    generation = models.PositiveIntegerField(default=0)
+
+    objects = models.DjongoManager()
+
+    class Meta:
+        managed = False
+        db_table = 'result_count_generations'
+        app_label = 'foods'
+
+
+# The counts of matching documents the foods and recipes list views paginate
+# by. Anything that adds or removes documents calls result_counts.invalidate()
+# with the model afterward.
+result_counts = Result_Count_Cache(generation_store=Mongo_Generation_Store(Result_Count_Generation))
+
+
+# The substring search index over every food in the foods collection, keyed
+# by _id. It's shared by the foods and recipes apps, and rebuilt when the foods
+# generation in result_counts' store moves on without this process: it checks
+# the generation at most every 10 seconds, and rebuilds at most once a minute.
+food_name_index = Trigram_Index(lambda: ((food_doc['_id'], food_doc['food_name'])
+                                         for food_doc in Food.objects.mongo_find({}, {'food_name': True})),
+                                lambda: result_counts.generation_store.get(Food._meta.db_table),
+                                generation_ttl=10, rebuild_interval=60)
+
+
+# The _ids of the foods matching a local search, ranked by food_name_index, or
+# if it's still being built for the first time, in name order straight from
+# the database by the same matching rule.
+def search_food_ids(search_query):
+    ranked_mongodb_ids = food_name_index.search(search_query)
+    if ranked_mongodb_ids is None:
+        food_model_objs = Food.objects.filter(food_search_q_term(search_query)).order_by('food_name', '_id')
+        ranked_mongodb_ids = [food_model_obj._id for food_model_obj in food_model_objs.only('_id')]
+    return ranked_mongodb_ids
@@ -1,19 +1,33 @@
 #!/usr/bin/python
 
 import os
+import math
+import functools
 import html
 import random
 import re
 import urllib.parse
 import json
+import io
+import tempfile
+import threading
+import zipfile
+import http.server
 
+from asgiref.sync import async_to_sync
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test.client import RequestFactory
 from django.test import TestCase, tag
 
-from .models import Food
+from .models import Food, Fdc_Response, Result_Count_Generation, result_counts, food_name_index, search_food_ids
 from .views import foods, foods_fdc_id, foods_local_search, foods_local_search_results, foods_fdc_search, \
-        foods_fdc_search_results, foods_fdc_search_fdc_id, foods_fdc_import
-from nutritracker.utils import Food_Stub, Food_Detailed
+        foods_fdc_search_results, foods_fdc_search_fdc_id, foods_fdc_import, foods_fdc_search_results_detailed
+from nutritracker.indexes import check_indexes
+from nutritracker.utils import Food_Stub, Food_Detailed, Fdc_Api_Contacter, Fdc_Response_Cache, Mongo_Response_Store, \
+        Async_Fdc_Api_Contacter, Result_Count_Cache, Mongo_Generation_Store, Trigram_Index, food_search_q_term, \
+        iterate_json_array
 
 
 food_params_to_nutrient_names = {
@@ -109,9 +123,6 @@ class Mock_Fdc_Api_Contacter:
     with open("./testing_data/search_by_keywords.json", "r") as search_by_keywords_fh:
         search_by_keywords_data = json.loads(search_by_keywords_fh.read())
 
-    with open("./testing_data/number_of_search_results.json", "r") as number_of_search_results_fh:
-        number_of_search_results_data = json.loads(number_of_search_results_fh.read())
-
     look_up_fdc_id_data = dict()
 
     for filename in os.listdir("./testing_data/"):
@@ -124,15 +135,15 @@ class Mock_Fdc_Api_Contacter:
     def __init__(self, unneeded_api_key):
         pass
 
-    def number_of_search_results(self, query):
-        return len(self.number_of_search_results_data['foods'])
-
     def search_by_keywords(self, query, page_size=25, page_number=1):
         results_list = list()
         for result_obj in self.search_by_keywords_data['foods']:
             results_list.append(Food_Stub.from_fdc_json_obj(result_obj))
         return results_list
 
+    def search_with_total(self, query, page_size=25, page_number=1):
+        return self.search_by_keywords(query, page_size, page_number), self.search_by_keywords_data['totalHits']
+
     def look_up_fdc_id(self, fdc_id):
         if fdc_id not in self.look_up_fdc_id_data:
             return None
@@ -152,6 +163,10 @@ class foods_test_case(TestCase):
             food_model_obj.save()
             self.food_names.append(html.escape(food_model_obj.food_name, quote=True))
         self.food_names.sort()
+        # A rebuild a previous test started could otherwise land partway
+        # through this one.
+        food_name_index.wait()
+        food_name_index.build()
         self.request_factory = RequestFactory()
 
     def tearDown(self):
@@ -174,6 +189,32 @@ class test_foods(foods_test_case):
                     f"'{food_name[indexes[i - 1]]}', '{food_name[indexes[i]]}', " \
                     f"'{food_name[indexes[i + 1]]}' disordered"
 
+    def test_foods_normal_case_calories(self):
+        request = self.request_factory.get("/foods/")
+        content = foods(request).content.decode('utf-8')
+        for food_argd in food_model_objs_argds:
+            food_name = html.escape(food_argd['food_name'], quote=True)
+            calories = food_argd.get('energy_kcal', 0)
+            food_calories_re = re.compile(f">{re.escape(food_name)}<.*\n.*Calories: {calories}\n")
+            assert food_calories_re.search(content), \
+                    f"output of foods.views.foods() doesn't contain '>{food_name}<' followed by 'Calories: " \
+                    f"{calories}' on the next line"
+
+    def test_foods_normal_case_display_name(self):
+        food_model_obj = Food(food_name="organic greek yogurt with honey 'n' oats", serving_size=170,
+                              serving_units="g")
+        food_model_obj.save()
+        display_name = "Organic Greek Yogurt with Honey 'n' Oats"
+        food_doc = Food.objects.mongo_find_one({'_id': food_model_obj._id})
+        assert food_doc['display_name'] == display_name, \
+                f"saving a Food with food_name '{food_model_obj.food_name}' stores display_name " \
+                f"'{food_doc['display_name']}' rather than '{display_name}'"
+        request = self.request_factory.get("/foods/")
+        content = foods(request).content.decode('utf-8')
+        assert f">{html.escape(display_name, quote=True)}<" in content, \
+                f"output of foods.views.foods() doesn't show the food named '{food_model_obj.food_name}' by its " \
+                f"display_name '{display_name}'"
+
     def test_foods_pagination_normal_case(self):
         request = self.request_factory.get("/foods/", data={'page_number': 1, 'page_size': 10})
         content = foods(request).content.decode('utf-8')
@@ -188,6 +229,55 @@ class test_foods(foods_test_case):
                "output of foods.views.foods() with params {'page_number': 1, 'page_size': 10} "\
                "doesn't contain pagination link to page 2"
 
+    def test_foods_pagination_normal_case_second_page(self):
+        request = self.request_factory.get("/foods/", data={'page_number': 2, 'page_size': 10})
+        content = foods(request).content.decode('utf-8')
+        for food_name in self.food_names[10:]:
+            assert food_name in content, f"'{food_name}' not in output of foods.views.foods() "\
+                                         f"with params {{'page_number': 2, 'page_size': 10}}"
+        for food_name in self.food_names[:10]:
+            assert food_name not in content, f"'{food_name}' in output of foods.views.foods() with "\
+                                             f"params {{'page_number': 2, 'page_size': 10}} when it "\
+                                             "shouldn't be; pagination went wrong"
+        assert '<a href="/foods/?page_size=10&page_number=1">1</a>' in content, \
+               "output of foods.views.foods() with params {'page_number': 2, 'page_size': 10} "\
+               "doesn't contain pagination link to page 1"
+
+    def test_foods_cursor_pagination_normal_case(self):
+        request = self.request_factory.get("/foods/", data={'page_size': 10, 'after': ''})
+        content = foods(request).content.decode('utf-8')
+        for food_name in self.food_names[:10]:
+            assert food_name in content, f"'{food_name}' not in output of foods.views.foods() "\
+                                         f"with params {{'page_size': 10, 'after': ''}}"
+        next_link_match = re.search(r'<a href="/foods/\?page_size=10&after=([^"]+)">Next »</a>', content)
+        assert next_link_match, "output of foods.views.foods() with params {'page_size': 10, 'after': ''} "\
+                                "doesn't contain a pagination link to the next page"
+        cursor = urllib.parse.unquote(next_link_match.group(1))
+        request = self.request_factory.get("/foods/", data={'page_size': 10, 'after': cursor})
+        content = foods(request).content.decode('utf-8')
+        for food_name in self.food_names[10:]:
+            assert food_name in content, f"'{food_name}' not in output of foods.views.foods() "\
+                                         f"with params {{'page_size': 10, 'after': '{cursor}'}}"
+        for food_name in self.food_names[:10]:
+            assert food_name not in content, f"'{food_name}' in output of foods.views.foods() with "\
+                                             f"params {{'page_size': 10, 'after': '{cursor}'}} when it "\
+                                             "shouldn't be; cursor pagination went wrong"
+        assert "»</a>" not in content and '">« Previous</a>' in content, \
+                f"output of foods.views.foods() with params {{'page_size': 10, 'after': '{cursor}'}} should "\
+                "link to the previous page but not to a next page"
+
+    def test_foods_cursor_pagination_error_case_bad_cursor(self):
+        request = self.request_factory.get("/foods/", data={'page_size': 10, 'after': 'bogus'})
+        content = foods(request).content.decode('utf-8')
+        assert "value for after is not a valid pagination cursor; received &#x27;bogus&#x27;" in content, \
+                "calling foods() with params {'page_size': 10, 'after': 'bogus'} did not produce the correct error"
+
+    def test_foods_pagination_error_case_zero_page_size(self):
+        request = self.request_factory.get("/foods/", data={'page_number': 1, 'page_size': 0})
+        content = foods(request).content.decode('utf-8')
+        assert "value for page_size must be an integer greater than or equal to 1; received &#x27;0&#x27;" in content, \
+                "calling foods() with params {'page_number': 1, 'page_size': 0} did not produce the correct error"
+
     def test_foods_pagination_error_case_bad_arg(self):
         request = self.request_factory.get("/foods/", data={'page_number': 'one', 'page_size': 10})
         content = foods(request).content.decode('utf-8')
@@ -252,9 +342,16 @@ class test_foods_fdc_id(foods_test_case):
         second_fdc_id = second_food_argd["fdc_id"]
         second_food_model_obj = Food.objects.get(fdc_id=second_fdc_id)
         second_food_model_obj.fdc_id = first_fdc_id
-        second_food_model_obj.save()
-        request = self.request_factory.get(f"/foods/{first_fdc_id}/")
-        response = foods_fdc_id(request, first_fdc_id)
+        # The unique fdc_id index prevents duplicates, so this simulates a
+        # collection from before it existed.
+        Food.objects.mongo_drop_index('fdc_id')
+        try:
+            second_food_model_obj.save()
+            request = self.request_factory.get(f"/foods/{first_fdc_id}/")
+            response = foods_fdc_id(request, first_fdc_id)
+        finally:
+            second_food_model_obj.delete()
+            call_command("ensure_indexes", stdout=io.StringIO())
         content = response.content.decode('utf-8')
         assert response.status_code == 500, "returned content from calling foods_fdc_id() with an fdc_id that occurs " \
                 "twice in the data store doesn't return a response with status_code == 500"
@@ -293,7 +390,9 @@ class test_foods_local_search_results(foods_test_case):
         cgi_query_string = urllib.parse.urlencode(cgi_data)
         request = self.request_factory.get("/foods/local_search_results/", data=cgi_data)
         content = foods_local_search_results(request).content.decode('utf-8')
-        bread_re = re.compile("bread", re.I)
+        # Foods where the keyword begins a word rank ahead of mid-word
+        # matches, so 'Cornbread' comes after the breads.
+        bread_re = re.compile(r"\bbread", re.I)
         matching_food_names = sorted([html.escape(food_argd["food_name"]) for food_argd in food_model_objs_argds
                                                                               if bread_re.search(food_argd["food_name"])])
         assert matching_food_names[0] in content, f"calling foods_local_search(request) with CGI params " \
@@ -304,6 +403,34 @@ class test_foods_local_search_results(foods_test_case):
                 "output of foods.views.foods() with params " \
                 f"{cgi_query_string} doesn't contain pagination link to page 2"
 
+    def test_foods_local_search_results_normal_case_word_prefixes(self):
+        cgi_data = {'search_query': 'whe BRE', 'page_number': 1, 'page_size': 25}
+        cgi_query_string = urllib.parse.urlencode(cgi_data)
+        request = self.request_factory.get("/foods/local_search_results/", data=cgi_data)
+        content = foods_local_search_results(request).content.decode('utf-8')
+        assert "Whole Wheat Bread" in content, f"calling foods_local_search_results(request) with CGI params " \
+                f"{cgi_query_string} didn't return a page containing 'Whole Wheat Bread', although each keyword " \
+                "begins one of the words in that food name"
+        for food_name in ("White Bread", "Cornbread", "Wheat Flour, White, All-Purpose, Unenriched"):
+            assert html.escape(food_name) not in content, f"calling foods_local_search_results(request) with CGI " \
+                    f"params {cgi_query_string} returned a page containing '{food_name}', although not every " \
+                    "keyword begins one of the words in that food name"
+
+    def test_foods_local_search_results_normal_case_ranking(self):
+        cgi_data = {'search_query': 'bread', 'page_number': 1, 'page_size': 25}
+        cgi_query_string = urllib.parse.urlencode(cgi_data)
+        request = self.request_factory.get("/foods/local_search_results/", data=cgi_data)
+        content = foods_local_search_results(request).content.decode('utf-8')
+        ranked_food_names = ["White Bread", "Whole Wheat Bread", "Cornbread"]
+        for food_name in ranked_food_names:
+            assert food_name in content, f"calling foods_local_search_results(request) with CGI params " \
+                    f"{cgi_query_string} didn't return a page containing '{food_name}', although its name contains " \
+                    "the keyword"
+        positions = [content.index(food_name) for food_name in ranked_food_names]
+        assert positions == sorted(positions), f"calling foods_local_search_results(request) with CGI params " \
+                f"{cgi_query_string} didn't list the matching foods in the order {', '.join(ranked_food_names)}; " \
+                "shorter names where the keyword begins a word should come first"
+
     def test_foods_local_search_results_pagination_too_far(self):
         cgi_data = {'search_query': 'Bread', 'page_number': 3, 'page_size': 2}
         request = self.request_factory.get("/foods/local_search_results/", data=cgi_data)
@@ -319,6 +446,117 @@ class test_foods_local_search_results(foods_test_case):
         assert "No matches" in content, "calling foods_local_search(request) with a non-matching search_query " \
                 "doesn't return a page containing 'No matches'"
 
+    def _cursor_mode_fdc_ids(self, search_query):
+        fdc_ids = list()
+        cgi_data = {'search_query': search_query, 'page_size': 2, 'after': ''}
+        while True:
+            request = self.request_factory.get("/foods/local_search_results/", data=cgi_data)
+            content = foods_local_search_results(request).content.decode('utf-8')
+            fdc_ids.extend(int(fdc_id) for fdc_id in re.findall(r'<a href="/foods/(\d+)/">', content))
+            next_link_match = re.search(r'<a href="/foods/local_search_results/\?[^"]*after=([^"&]+)[^"]*">Next »</a>',
+                                        content)
+            if not next_link_match:
+                return fdc_ids
+            cgi_data['after'] = urllib.parse.unquote(next_link_match.group(1))
+
+    def test_foods_local_search_results_normal_case_modes_agree(self):
+        for search_query in ("bread", "whe BRE", "ing", "granulated SUGAR", "rooibos tea"):
+            cgi_data = {'search_query': search_query, 'page_number': 1, 'page_size': 25}
+            request = self.request_factory.get("/foods/local_search_results/", data=cgi_data)
+            content = foods_local_search_results(request).content.decode('utf-8')
+            page_mode_fdc_ids = [int(fdc_id) for fdc_id in re.findall(r'<a href="/foods/(\d+)/">', content)]
+            keywords = search_query.lower().split()
+            expected_fdc_ids = {food_argd['fdc_id'] for food_argd in food_model_objs_argds
+                                if all(keyword in food_argd['food_name'].lower() for keyword in keywords)}
+            assert set(page_mode_fdc_ids) == expected_fdc_ids, "calling foods_local_search_results(request) with " \
+                    f"search_query '{search_query}' in page mode didn't return exactly the foods whose names " \
+                    "contain every keyword"
+            cursor_mode_fdc_ids = self._cursor_mode_fdc_ids(search_query)
+            assert sorted(cursor_mode_fdc_ids) == sorted(page_mode_fdc_ids), "paging through " \
+                    f"foods_local_search_results(request) with search_query '{search_query}' in cursor mode " \
+                    "didn't return the same foods, each once, as page mode"
+
+    def test_foods_local_search_results_normal_case_changed_elsewhere(self):
+        # Another process's import, which this process's index never hears
+        # about except by the foods generation being bumped. The index's
+        # limits on how often it checks and rebuilds are lifted so it notices
+        # right away.
+        Food.objects.mongo_insert_one({'fdc_id': 1234567, 'food_name': 'Breadfruit, Raw', 'serving_size': 100,
+                                       'serving_units': 'g', 'energy_kcal': 103})
+        Result_Count_Generation.objects.mongo_update_one({'_id': 'foods'}, {'$inc': {'generation': 1}}, upsert=True)
+        generation_ttl, rebuild_interval = food_name_index.generation_ttl, food_name_index.rebuild_interval
+        food_name_index.generation_ttl = food_name_index.rebuild_interval = 0
+        try:
+            search_food_ids("bread")
+            food_name_index.wait()
+        finally:
+            food_name_index.generation_ttl, food_name_index.rebuild_interval = generation_ttl, rebuild_interval
+        for cgi_data in ({'search_query': 'bread', 'page_number': 1, 'page_size': 25},
+                         {'search_query': 'bread', 'page_size': 25, 'after': ''}):
+            request = self.request_factory.get("/foods/local_search_results/", data=cgi_data)
+            content = foods_local_search_results(request).content.decode('utf-8')
+            assert '<a href="/foods/1234567/">' in content, "calling foods_local_search_results(request) with " \
+                    f"CGI params {urllib.parse.urlencode(cgi_data)} didn't return a page containing a food that " \
+                    "was added to the collection, and its generation bumped, behind this process's back"
+
+    def _counting_trigram_index(self, generation, **kwargs):
+        loads = list()
+        def loader():
+            loads.append(generation[0])
+            return [(1, "White Bread")]
+        trigram_index = Trigram_Index(loader, lambda: generation[0], **kwargs)
+        trigram_index.build()
+        return trigram_index, loads
+
+    def test_foods_local_search_results_normal_case_own_changes(self):
+        generation = [5]
+        trigram_index, loads = self._counting_trigram_index(generation)
+        # This process's own write, which bumped the generation.
+        generation[0] += 1
+        trigram_index.add(2, "Cornbread", generation[0])
+        assert trigram_index.search("bread") == [1, 2], "a Trigram_Index didn't find a food this process added " \
+                "to it with add()"
+        trigram_index.wait()
+        assert len(loads) == 1, "a Trigram_Index rebuilt itself for a change this process had already applied " \
+                "with add(), given the generation its write bumped the collection to"
+
+    def test_foods_local_search_results_normal_case_rebuild_limits(self):
+        generation = [5]
+        trigram_index, loads = self._counting_trigram_index(generation, generation_ttl=3600, rebuild_interval=3600)
+        # Another process's write.
+        generation[0] += 1
+        trigram_index.search("bread")
+        trigram_index.wait()
+        assert len(loads) == 1, "a Trigram_Index read the collection's generation again before generation_ttl " \
+                "seconds had passed"
+        trigram_index.generation_ttl = 0
+        trigram_index.search("bread")
+        trigram_index.wait()
+        assert len(loads) == 1, "a Trigram_Index rebuilt itself before rebuild_interval seconds had passed since " \
+                "its last build"
+        trigram_index.rebuild_interval = 0
+        trigram_index.search("bread")
+        trigram_index.wait()
+        assert loads == [5, 6], "a Trigram_Index a generation behind didn't rebuild itself once its limits allowed"
+
+    def test_foods_local_search_results_normal_case_unbuilt_index(self):
+        loaded = threading.Event()
+        released = threading.Event()
+        def loader():
+            loaded.set()
+            released.wait()
+            return [(food_model_obj._id, food_model_obj.food_name) for food_model_obj in Food.objects.filter()]
+        trigram_index = Trigram_Index(loader)
+        assert trigram_index.search("bread") is None, "searching a Trigram_Index that hasn't been built didn't " \
+                "return None to have the caller fall back to the database"
+        assert loaded.wait(5), "searching a Trigram_Index that hasn't been built didn't start building it"
+        released.set()
+        trigram_index.wait()
+        fallback_mongodb_ids = [food_model_obj._id for food_model_obj
+                                in Food.objects.filter(food_search_q_term("bread")).order_by('food_name', '_id')]
+        assert sorted(trigram_index.search("bread")) == sorted(fallback_mongodb_ids), "a built Trigram_Index " \
+                "and the database query it falls back to didn't match the same foods for the search 'bread'"
+
 
 class test_foods_fdc_search(foods_test_case):
 
@@ -356,7 +594,8 @@ class test_foods_fdc_search_results(foods_test_case):
                 "yielded content that didn't contain pagination link to page 2"
 
     def test_foods_fdc_search_results_error_case_overshooting_arg(self):
-        cgi_data = {'search_query': 'Bread', 'page_number': 5, 'page_size': 25}
+        # The testing data reports 19002 hits, 761 pages of 25.
+        cgi_data = {'search_query': 'Bread', 'page_number': 800, 'page_size': 25}
         cgi_query_string = urllib.parse.urlencode(cgi_data)
         request = self.request_factory.get("/foods/fdc_search_results/", data=cgi_data)
         response = foods_fdc_search_results(request, fdc_api_contacter=Mock_Fdc_Api_Contacter)
@@ -364,9 +603,44 @@ class test_foods_fdc_search_results(foods_test_case):
         assert "No more results" in content, \
                 f"calling foods_fdc_search_results(request, Mock_Fdc_Api_Contacter) with cgi args {cgi_query_string} " \
                 "yielded content that didn't contain 'No more results'"
-        assert '<a href="/foods/fdc_search_results/?page_size=25&page_number=2&search_query=Bread">2</a>' in content, \
+        assert '<a href="/foods/fdc_search_results/?page_size=25&page_number=761&search_query=Bread">761</a>' \
+                in content, f"calling foods_fdc_search_results(request, Mock_Fdc_Api_Contacter) with cgi args " \
+                f"{cgi_query_string} yielded content that didn't contain pagination link to the last page, 761"
+
+    def test_foods_fdc_search_results_normal_case_windowed_pagination(self):
+        # The testing data reports 19002 hits, 761 pages of 25; only a window
+        # of them around the current page is linked.
+        cgi_data = {'search_query': 'Bread', 'page_number': 1, 'page_size': 25}
+        cgi_query_string = urllib.parse.urlencode(cgi_data)
+        request = self.request_factory.get("/foods/fdc_search_results/", data=cgi_data)
+        response = foods_fdc_search_results(request, fdc_api_contacter=Mock_Fdc_Api_Contacter)
+        content = response.content.decode('utf-8')
+        linked_page_numbers = set(int(page_number) for page_number in re.findall(
+            r'<a href="/foods/fdc_search_results/\?page_size=25&page_number=(\d+)&search_query=Bread">\d+</a>',
+            content))
+        assert linked_page_numbers == {2, 3, 761}, f"calling foods_fdc_search_results(request, " \
+                f"Mock_Fdc_Api_Contacter) with cgi args {cgi_query_string} yielded content with links to pages " \
+                f"{sorted(linked_page_numbers)} rather than just to pages 2, 3 and 761"
+        assert '<input type="number" name="page_number" min="1" max="761" value="1">' in content, \
                 f"calling foods_fdc_search_results(request, Mock_Fdc_Api_Contacter) with cgi args {cgi_query_string} " \
-                "yielded content that didn't contain pagination link to page 2"
+                "yielded content that didn't contain a form to jump to any of the 761 pages"
+
+
+    def test_foods_fdc_search_results_normal_case_in_db_already(self):
+        fdc_id = Mock_Fdc_Api_Contacter.search_by_keywords_data['foods'][3]['fdcId']
+        Food(**Mock_Fdc_Api_Contacter(None).look_up_fdc_id(fdc_id).to_model_cls_args()).save()
+        cgi_data = {'search_query': 'Bread', 'page_number': 1, 'page_size': 25}
+        cgi_query_string = urllib.parse.urlencode(cgi_data)
+        request = self.request_factory.get("/foods/fdc_search_results/", data=cgi_data)
+        response = foods_fdc_search_results(request, fdc_api_contacter=Mock_Fdc_Api_Contacter)
+        content = response.content.decode('utf-8')
+        assert content.count("In the local database at") == 1 and f'<a href="/foods/{fdc_id}/">' in content, \
+                f"calling foods_fdc_search_results(request, Mock_Fdc_Api_Contacter) with cgi args {cgi_query_string} " \
+                f"with a food with fdc_id={fdc_id} in the local database didn't mark that result, and only that " \
+                "result, as already in the local database"
+        assert content.count('value="Import"') == len(Mock_Fdc_Api_Contacter.search_by_keywords_data['foods']) - 1, \
+                f"calling foods_fdc_search_results(request, Mock_Fdc_Api_Contacter) with cgi args {cgi_query_string} " \
+                "didn't offer to import every result not in the local database"
 
 
 class test_foods_fdc_search_fdc_id(foods_test_case):
@@ -476,6 +750,31 @@ class test_foods_fdc_import(foods_test_case):
                 f"fdc_api_contacter=Mock_Fdc_Api_Contacter) with CGI params {cgi_query_string} where that food " \
                 "object is present in the database doesn't yield content containing the appropriate success message"
 
+    # Another request imports the food between this one finding it isn't in
+    # the database and saving it.
+    def test_foods_fdc_import_normal_case_imported_concurrently(self):
+        class Racing_Fdc_Api_Contacter(Mock_Fdc_Api_Contacter):
+            def look_up_fdc_id(self, fdc_id):
+                food_obj = super().look_up_fdc_id(fdc_id)
+                Food(**food_obj.to_model_cls_args()).save()
+                return food_obj
+
+        call_command("ensure_indexes", stdout=io.StringIO())
+        fdc_id = random.choice(list(Mock_Fdc_Api_Contacter.look_up_fdc_id_data))
+        cgi_data = {'fdc_id': fdc_id}
+        cgi_query_string = urllib.parse.urlencode(cgi_data)
+        request = self.request_factory.get("/foods/fdc_import/", data=cgi_data)
+        response = foods_fdc_import(request, fdc_api_contacter=Racing_Fdc_Api_Contacter)
+        content = response.content.decode('utf-8')
+        success_message = '<b>Not imported.</b> A food with this FDC ID already exists in the local database. ' \
+                "It's accessible at " + f'<a href="/foods/{fdc_id}/">'
+        assert success_message in content, f"calling foods_fdc_import(request) with CGI params {cgi_query_string} " \
+                "where another request imports the same food while it's being looked up doesn't yield content " \
+                "containing the appropriate success message"
+        assert len(Food.objects.filter(fdc_id=fdc_id)) == 1, f"calling foods_fdc_import(request) with CGI params " \
+                f"{cgi_query_string} where another request imports the same food while it's being looked up " \
+                "left more than one copy of it in the data store"
+
     def test_foods_fdc_import_error_case_api_responds_fdc_id_invalid(self):
         spurious_fdc_id = random.randint(2**17, 2**22)
         while spurious_fdc_id in Mock_Fdc_Api_Contacter.look_up_fdc_id_data:
@@ -491,6 +790,351 @@ class test_foods_fdc_import(foods_test_case):
                 "yield content containing the appropriate error message"
 
 
+class test_import_fdc_dump(foods_test_case):
+
+    def _write_dump_file(self, dump_dir, food_json_objs, zipped=False):
+        dump_content = json.dumps({"BrandedFoods": food_json_objs}, indent=4)
+        if not zipped:
+            dump_path = os.path.join(dump_dir, "fdc_dump.json")
+            with open(dump_path, "w") as dump_fh:
+                dump_fh.write(dump_content)
+        else:
+            dump_path = os.path.join(dump_dir, "fdc_dump.zip")
+            with zipfile.ZipFile(dump_path, "w") as dump_zip:
+                dump_zip.writestr("fdc_dump.json", dump_content)
+        return dump_path
+
+    def test_import_fdc_dump_normal_case(self):
+        food_json_objs = list(Mock_Fdc_Api_Contacter.look_up_fdc_id_data.values())
+        usable_json_objs = [food_json_obj for food_json_obj in food_json_objs
+                            if Food_Detailed.is_usable_json_object(food_json_obj)]
+        number_of_foods_before = Food.objects.count()
+        with tempfile.TemporaryDirectory() as dump_dir:
+            for zipped in (False, True):
+                dump_path = self._write_dump_file(dump_dir, food_json_objs, zipped=zipped)
+                call_command("import_fdc_dump", dump_path, "--batch-size", "4", stdout=io.StringIO())
+                assert Food.objects.count() == number_of_foods_before + len(usable_json_objs), \
+                        f"running import_fdc_dump on a {'zipped ' if zipped else ''}dump file of " \
+                        f"{len(food_json_objs)} foods, {len(usable_json_objs)} of them usable, didn't leave exactly " \
+                        "one new food in the foods collection per usable food"
+        for food_json_obj in usable_json_objs:
+            food_obj = Food_Detailed.from_fdc_json_obj(food_json_obj)
+            food_model_obj = Food.objects.get(fdc_id=food_obj.fdc_id)
+            assert food_model_obj.food_name == food_obj.food_name \
+                    and food_model_obj.energy_kcal == food_obj.energy_kcal.amount, \
+                    f"running import_fdc_dump didn't store the food with fdc_id={food_obj.fdc_id} the same way " \
+                    "foods_fdc_import would have"
+
+
+# Returns the pieces it's given one per read, whatever size is asked for, so
+# a test can split its input wherever it likes.
+class Split_Text_Fh:
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+
+    def read(self, size=-1):
+        return self.pieces.pop(0) if self.pieces else ''
+
+
+@tag("foods")
+class test_iterate_json_array(TestCase):
+
+    json_docs = ('[9.25, 1]', '[-1.5e+10, 2E-3, 0, 12, true, null, "a, b", {"x": 1.5}, [1, 2.0], 7.125]',
+                 '{"count": 12.5, "label": "foods", "items": [3.25, {"fdc_id": 172470}, -0.5]}')
+
+    def _expected_items(self, json_doc):
+        json_obj = json.loads(json_doc)
+        return json_obj['items'] if isinstance(json_obj, dict) else json_obj
+
+    def test_iterate_json_array_normal_case_every_chunk_size(self):
+        for json_doc in self.json_docs:
+            for chunk_size in range(1, len(json_doc) + 1):
+                items = list(iterate_json_array(io.StringIO(json_doc), chunk_size=chunk_size))
+                assert items == self._expected_items(json_doc), f"iterate_json_array() on '{json_doc}' read " \
+                        f"{chunk_size} characters at a time yields {items!r}"
+
+    def test_iterate_json_array_normal_case_every_split_offset(self):
+        for json_doc in self.json_docs:
+            for offset in range(1, len(json_doc)):
+                other_values = dict()
+                items = list(iterate_json_array(Split_Text_Fh((json_doc[:offset], json_doc[offset:])),
+                                                other_values=other_values))
+                assert items == self._expected_items(json_doc), f"iterate_json_array() on '{json_doc}' split " \
+                        f"after {offset} characters yields {items!r}"
+                if json_doc.startswith('{'):
+                    assert other_values == {'count': 12.5, 'label': "foods"}, f"iterate_json_array() on " \
+                            f"'{json_doc}' split after {offset} characters stores {other_values!r} as the values " \
+                            "preceding the array"
+
+    def test_iterate_json_array_error_case_truncated_input(self):
+        for json_doc in ('[9.25, 1', '[9.25, 1.', '[{"x": 1}'):
+            with self.assertRaises(ValueError, msg=f"iterate_json_array() on the truncated input '{json_doc}' "
+                                   "doesn't raise a ValueError"):
+                list(iterate_json_array(io.StringIO(json_doc), chunk_size=2))
+
+    def test_iterate_json_array_error_case_bad_separators(self):
+        for json_doc in ('[1,,2]', '[1 2]', '[1,]', '[,1]', '{"count": 1 "items": [1]}',
+                         '{"count": 1,, "items": [1]}'):
+            for chunk_size in (1, len(json_doc)):
+                with self.assertRaises(ValueError, msg=f"iterate_json_array() on '{json_doc}' read {chunk_size} "
+                                       "characters at a time doesn't raise a ValueError"):
+                    list(iterate_json_array(io.StringIO(json_doc), chunk_size=chunk_size))
+
+    def test_iterate_json_array_error_case_malformed_item_not_read_to_end(self):
+        json_doc = '[{"x": 1}, {"x": 2,, "y": 3}, ' + ', '.join('{"x": 1}' for _ in range(10000)) + ']'
+        text_fh = io.StringIO(json_doc)
+        with self.assertRaises(ValueError, msg=f"iterate_json_array() on an input with a malformed second item "
+                               "doesn't raise a ValueError"):
+            list(iterate_json_array(text_fh, chunk_size=64))
+        assert text_fh.tell() <= 128, f"iterate_json_array() on an input with a malformed second item read " \
+                f"{text_fh.tell()} of its {len(json_doc)} characters before raising rather than stopping there"
+
+
+@tag("foods")
+class test_result_counts(foods_test_case):
+
+    def test_result_counts_normal_case(self):
+        number_of_foods = len(food_model_objs_argds)
+        count = result_counts.count(Food)
+        assert count == number_of_foods, f"result_counts.count(Food) returns {count} rather than {number_of_foods}"
+        # A write that doesn't go through the model isn't seen until the
+        # count is invalidated.
+        Food.objects.mongo_insert_one({'fdc_id': 0, 'food_name': "Plain Water", 'serving_size': 1,
+                                       'serving_units': 'cup'})
+        count = result_counts.count(Food)
+        assert count == number_of_foods, f"result_counts.count(Food) recounts rather than returning the cached " \
+                f"count {number_of_foods}"
+        result_counts.invalidate(Food)
+        count = result_counts.count(Food)
+        assert count == number_of_foods + 1, f"result_counts.count(Food) returns {count} after invalidation " \
+                f"rather than {number_of_foods + 1}"
+        Food(fdc_id=0, food_name="Sparkling Water", serving_size=1, serving_units="cup").save()
+        count = result_counts.count(Food, {'fdc_id': 0})
+        assert count == 2, f"result_counts.count(Food, {{'fdc_id': 0}}) returns {count} after a food with that " \
+                "fdc_id is saved rather than 2"
+
+    def test_result_counts_normal_case_other_process(self):
+        # A write by another process, such as an import command, is seen by
+        # way of the generation store.
+        other_process_counts = Result_Count_Cache(generation_store=Mongo_Generation_Store(Result_Count_Generation))
+        count = result_counts.count(Food)
+        Food.objects.mongo_insert_one({'fdc_id': 0, 'food_name': "Plain Water", 'serving_size': 1,
+                                       'serving_units': 'cup'})
+        other_process_counts.invalidate(Food)
+        assert result_counts.count(Food) == count + 1, "result_counts.count(Food) doesn't recount after another " \
+                "Result_Count_Cache with the same generation store invalidates the count"
+
+
+@tag("foods")
+class test_ensure_indexes(TestCase):
+
+    def test_ensure_indexes_normal_case(self):
+        call_command("ensure_indexes", stdout=io.StringIO())
+        call_command("ensure_indexes", "--check", stdout=io.StringIO())
+        assert not check_indexes(databases=["default"]), \
+                "check_indexes() reported absent indexes after running ensure_indexes"
+
+    def test_ensure_indexes_error_case_missing_index(self):
+        call_command("ensure_indexes", stdout=io.StringIO())
+        Food.objects.mongo_drop_index('food_name')
+        try:
+            messages = check_indexes(databases=["default"])
+            assert len(messages) == 1 and "'food_name' on 'foods' is missing" in messages[0].msg, \
+                    f"check_indexes() with the food_name index dropped returned {messages}"
+            with self.assertRaises(CommandError):
+                call_command("ensure_indexes", "--check", stdout=io.StringIO())
+        finally:
+            output = io.StringIO()
+            call_command("ensure_indexes", stdout=output)
+        assert "index 'food_name' on 'foods' was created" in output.getvalue(), \
+                "ensure_indexes didn't report recreating the dropped food_name index"
+
+
+# A local stand-in for the FDC API that serves the testing_data responses, and
+# answers with 503 for as many requests as failures_remaining says first.
+class Stand_In_Fdc_Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures_remaining = 0
+
+    def do_POST(self):
+        json_argd = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.path.startswith("/foods/search"):
+            self._respond(200, Mock_Fdc_Api_Contacter.search_by_keywords_data)
+        else:
+            self._respond(200, [Mock_Fdc_Api_Contacter.look_up_fdc_id_data[fdc_id] for fdc_id in json_argd["fdcIds"]
+                                if fdc_id in Mock_Fdc_Api_Contacter.look_up_fdc_id_data])
+
+    def do_GET(self):
+        fdc_id = int(self.path.split("?")[0].rsplit("/", 1)[1])
+        if fdc_id in Mock_Fdc_Api_Contacter.look_up_fdc_id_data:
+            self._respond(200, Mock_Fdc_Api_Contacter.look_up_fdc_id_data[fdc_id])
+        else:
+            self._respond(404, {"error": "not found"})
+
+    def _respond(self, status, json_obj):
+        if Stand_In_Fdc_Handler.failures_remaining:
+            Stand_In_Fdc_Handler.failures_remaining -= 1
+            status, json_obj = 503, {"error": "unavailable"}
+        body = json.dumps(json_obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@tag("foods")
+class test_fdc_api_contacter(TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Stand_In_Fdc_Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.saved_session_settings = Fdc_Api_Contacter.session_settings
+        self.saved_response_cache = Fdc_Api_Contacter.response_cache
+        Fdc_Api_Contacter.configure(backoff_factor=0, retries=2)
+        Fdc_Api_Contacter.response_cache = Fdc_Response_Cache(backing_store=Mongo_Response_Store(Fdc_Response))
+        self.api_contacter = Fdc_Api_Contacter("bogus_api_key", api_url=f"http://127.0.0.1:{self.server.server_port}")
+
+    def tearDown(self):
+        Stand_In_Fdc_Handler.failures_remaining = 0
+        Fdc_Api_Contacter.configure(**self.saved_session_settings)
+        Fdc_Api_Contacter.response_cache.clear()
+        Fdc_Api_Contacter.response_cache = self.saved_response_cache
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fdc_api_contacter_normal_case_pooled_session(self):
+        Stand_In_Fdc_Handler.failures_remaining = 1
+        counters_before = Fdc_Api_Contacter.pool_statistics()
+        food_stubs = self.api_contacter.search_by_keywords("bread")
+        fdc_id = random.choice(list(Mock_Fdc_Api_Contacter.look_up_fdc_id_data.keys()))
+        food_obj = self.api_contacter.look_up_fdc_id(fdc_id)
+        assert len(food_stubs) == len(Mock_Fdc_Api_Contacter.search_by_keywords_data["foods"]), \
+                "Fdc_Api_Contacter.search_by_keywords() against a server that fails once with a 503 didn't retry " \
+                "and return every search result"
+        assert food_obj.fdc_id == fdc_id, \
+                f"Fdc_Api_Contacter.look_up_fdc_id({fdc_id}) didn't return the food with that fdc_id"
+        statistics = Fdc_Api_Contacter.pool_statistics()
+        assert statistics["connections_opened"] == 1, "Fdc_Api_Contacter made three requests to the same server " \
+                f"but opened {statistics['connections_opened']} connections instead of reusing one"
+        assert statistics["requests"] - counters_before["requests"] == 2 \
+                and statistics["retries"] - counters_before["retries"] == 1, \
+                "Fdc_Api_Contacter.pool_statistics() didn't count two requests and one retry after two calls, " \
+                "one of which was retried once"
+
+    def test_fdc_api_contacter_normal_case_search_with_total(self):
+        counters_before = Fdc_Api_Contacter.pool_statistics()
+        food_stubs, total_hits = self.api_contacter.search_with_total("bread")
+        statistics = Fdc_Api_Contacter.pool_statistics()
+        assert len(food_stubs) == len(Mock_Fdc_Api_Contacter.search_by_keywords_data["foods"]) \
+                and total_hits == Mock_Fdc_Api_Contacter.search_by_keywords_data["totalHits"], \
+                "Fdc_Api_Contacter.search_with_total() didn't return every search result along with the totalHits " \
+                "value from the response"
+        assert statistics["requests"] - counters_before["requests"] == 1, \
+                f"Fdc_Api_Contacter.search_with_total() made {statistics['requests'] - counters_before['requests']} " \
+                "requests instead of one"
+
+    def test_fdc_api_contacter_normal_case_response_cache(self):
+        fdc_id = random.choice(list(Mock_Fdc_Api_Contacter.look_up_fdc_id_data.keys()))
+        counters_before = Fdc_Api_Contacter.pool_statistics()
+        first_food_obj = self.api_contacter.look_up_fdc_id(fdc_id)
+        second_food_obj = self.api_contacter.look_up_fdc_id(fdc_id)
+        first_food_stubs, _ = self.api_contacter.search_with_total("Whole  Wheat")
+        second_food_stubs, _ = self.api_contacter.search_with_total("whole wheat")
+        statistics = Fdc_Api_Contacter.pool_statistics()
+        assert statistics["requests"] - counters_before["requests"] == 2, \
+                "Fdc_Api_Contacter made a request for a repeated lookup or a repeated search differing only in case " \
+                "and spacing instead of answering it from its response cache"
+        assert second_food_obj.serialize() == first_food_obj.serialize() \
+                and [food_stub.serialize() for food_stub in second_food_stubs] \
+                == [food_stub.serialize() for food_stub in first_food_stubs], \
+                "Fdc_Api_Contacter's response cache returned different results for a repeated lookup or search"
+        cache_statistics = Fdc_Api_Contacter.response_cache.statistics()
+        assert cache_statistics["memory_hits"] == 2 and cache_statistics["misses"] == 2, \
+                f"Fdc_Response_Cache.statistics() returned {cache_statistics} after two misses and two hits"
+
+        # A second process's cache shares the backing store but not the
+        # in-memory entries.
+        Fdc_Api_Contacter.response_cache = Fdc_Response_Cache(backing_store=Mongo_Response_Store(Fdc_Response))
+        self.api_contacter.look_up_fdc_id(fdc_id)
+        assert Fdc_Api_Contacter.response_cache.statistics()["store_hits"] == 1 \
+                and Fdc_Api_Contacter.pool_statistics()["requests"] == statistics["requests"], \
+                "Fdc_Api_Contacter made a request for a lookup that was in its response cache's backing store"
+
+        Fdc_Api_Contacter("bogus_api_key", api_url=self.api_contacter.api_url, use_cache=False).look_up_fdc_id(fdc_id)
+        assert Fdc_Api_Contacter.pool_statistics()["requests"] == statistics["requests"] + 1, \
+                "Fdc_Api_Contacter instanced with use_cache=False didn't make a request for a cached lookup"
+
+    def test_fdc_api_contacter_normal_case_response_cache_expiry_and_eviction(self):
+        response_cache = Fdc_Response_Cache(max_entries=2, ttls={'lookup': 0})
+        response_cache.set('search', "a", 1)
+        response_cache.set('search', "b", 2)
+        response_cache.get("a")
+        response_cache.set('search', "c", 3)
+        assert response_cache.get("b") == (False, None) and response_cache.get("a") == (True, 1), \
+                "Fdc_Response_Cache with max_entries=2 didn't evict the least recently used of three entries"
+        response_cache.set('lookup', "d", 4)
+        assert response_cache.get("d") == (False, None), \
+                "Fdc_Response_Cache returned an entry set with a TTL of 0 seconds"
+        cache_statistics = response_cache.statistics()
+        assert cache_statistics["evictions"] == 2 and cache_statistics["expirations"] == 1, \
+                f"Fdc_Response_Cache.statistics() returned {cache_statistics} after two evictions and one expiration"
+
+    def test_fdc_api_contacter_normal_case_look_up_fdc_ids(self):
+        fdc_ids = list(Mock_Fdc_Api_Contacter.look_up_fdc_id_data.keys()) * 2 + [1, 2]
+        saved_fdc_ids_per_request = Fdc_Api_Contacter.fdc_ids_per_request
+        Fdc_Api_Contacter.fdc_ids_per_request = 4
+        try:
+            counters_before = Fdc_Api_Contacter.pool_statistics()
+            food_objs_by_fdc_id = self.api_contacter.look_up_fdc_ids(fdc_ids)
+            statistics = Fdc_Api_Contacter.pool_statistics()
+        finally:
+            Fdc_Api_Contacter.fdc_ids_per_request = saved_fdc_ids_per_request
+        unique_fdc_ids = list(dict.fromkeys(fdc_ids))
+        assert list(food_objs_by_fdc_id.keys()) == unique_fdc_ids, \
+                "Fdc_Api_Contacter.look_up_fdc_ids() didn't return a dict with each distinct FDC ID it was passed as " \
+                "keys, in order"
+        for fdc_id in unique_fdc_ids:
+            expected_food_obj = Mock_Fdc_Api_Contacter(None).look_up_fdc_id(fdc_id)
+            food_obj = food_objs_by_fdc_id[fdc_id]
+            assert (food_obj is expected_food_obj if expected_food_obj in (None, False)
+                    else food_obj.serialize() == expected_food_obj.serialize()), \
+                    f"Fdc_Api_Contacter.look_up_fdc_ids() didn't return for FDC ID {fdc_id} what " \
+                    "Fdc_Api_Contacter.look_up_fdc_id() would have"
+        expected_requests = math.ceil(len(unique_fdc_ids) / 4)
+        assert statistics["requests"] - counters_before["requests"] == expected_requests, \
+                f"Fdc_Api_Contacter.look_up_fdc_ids() with {len(unique_fdc_ids)} distinct FDC IDs and 4 per request " \
+                f"made {statistics['requests'] - counters_before['requests']} requests instead of {expected_requests}"
+        self.api_contacter.look_up_fdc_ids(fdc_ids)
+        assert Fdc_Api_Contacter.pool_statistics()["requests"] == statistics["requests"], \
+                "Fdc_Api_Contacter.look_up_fdc_ids() made requests for FDC IDs that were in its response cache"
+
+    def test_fdc_api_contacter_normal_case_async_search_results_detailed(self):
+        cgi_data = {'search_query': 'Bread', 'page_number': 1, 'page_size': 25}
+        cgi_query_string = urllib.parse.urlencode(cgi_data)
+        request = RequestFactory().get("/foods/fdc_search_results/detailed/", data=cgi_data)
+        async_fdc_api_contacter = functools.partial(Async_Fdc_Api_Contacter, api_url=self.api_contacter.api_url)
+        counters_before = Fdc_Api_Contacter.pool_statistics()
+        response = async_to_sync(foods_fdc_search_results_detailed)(request,
+                                                                    async_fdc_api_contacter=async_fdc_api_contacter)
+        statistics = Fdc_Api_Contacter.pool_statistics()
+        content = response.content.decode('utf-8')
+        usable_foods_count = sum(Food_Detailed.is_usable_json_object(Mock_Fdc_Api_Contacter.look_up_fdc_id_data[
+                                     food_json_obj['fdcId']])
+                                 for food_json_obj in Mock_Fdc_Api_Contacter.search_by_keywords_data['foods'])
+        assert content.count("Serving size:") == usable_foods_count, \
+                f"calling foods_fdc_search_results_detailed(request) with cgi args {cgi_query_string} yielded " \
+                f"content with {content.count('Serving size:')} serving sizes instead of one for each of the " \
+                f"{usable_foods_count} usable results"
+        assert statistics["requests"] - counters_before["requests"] == 3, \
+                f"calling foods_fdc_search_results_detailed(request) with cgi args {cgi_query_string} made " \
+                f"{statistics['requests'] - counters_before['requests']} requests instead of one search and two " \
+                "batched lookups of 25 results"
+
+
 #class test_foods_add_food(foods_test_case):
 #
 #    def test_foods_add_food_normal_case_no_cgi(self):
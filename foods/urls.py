@@ -16,6 +16,10 @@ urlpatterns = [
     path('fdc_search/',              views.foods_fdc_search,           name='foods_fdc_search_slash'),
     path('fdc_search_results',       views.foods_fdc_search_results,   name='foods_fdc_search_results'),
     path('fdc_search_results/',      views.foods_fdc_search_results,   name='foods_fdc_search_results_slash'),
+    path('fdc_search_results/detailed',  views.foods_fdc_search_results_detailed,
+         name='foods_fdc_search_results_detailed'),
+    path('fdc_search_results/detailed/', views.foods_fdc_search_results_detailed,
+         name='foods_fdc_search_results_detailed_slash'),
     path('fdc_search/<int:fdc_id>',  views.foods_fdc_search_fdc_id,    name='foods_fdc_search_+fdc_id+'),
     path('fdc_search/<int:fdc_id>/', views.foods_fdc_search_fdc_id,    name='foods_fdc_search_+fdc_id+_slash'),
     path('fdc_import',               views.foods_fdc_import,           name='foods_fdc_import'),
@@ -1,21 +1,21 @@
 #!/usr/bin/python
 
+import asyncio
 import math
 
+from asgiref.sync import sync_to_async
 from decouple import config
 
-from operator import and_, attrgetter
-
-from functools import reduce
-
-from django.db.models import Q
-from django.http import HttpResponse
+from django.db import DatabaseError
+from django.http import HttpResponse, HttpResponseNotAllowed
 from django.template import loader
 from django.views.decorators.http import require_http_methods
 
-from .models import Food
+from .models import Food, Fdc_Response, food_name_index, search_food_ids, fdc_ids_in_db, result_counts
 from nutritracker.utils import Food_Detailed, Navigation_Links_Displayer, generate_pagination_links, get_cgi_params, \
-        slice_output_list_by_page, cast_to_int, Fdc_Api_Contacter, retrieve_pagination_params
+        slice_output_list_by_page, cast_to_int, Fdc_Api_Contacter, retrieve_pagination_params, slice_queryset_by_cursor, \
+        slice_list_by_cursor, food_search_q_term, sort_by_key_order, Fdc_Response_Cache, Mongo_Response_Store, \
+        Async_Fdc_Api_Contacter, Food_Row, is_duplicate_key_error
 
 
 navigation_links_displayer = Navigation_Links_Displayer({'/foods/': "Main Foods List",
@@ -27,6 +27,15 @@ DEFAULT_PAGE_SIZE = config("DEFAULT_PAGE_SIZE")
 
 FDC_API_KEY = config("FDC_API_KEY")
 
+Fdc_Api_Contacter.configure(pool_size=config("FDC_POOL_SIZE", default=10, cast=int),
+                            retries=config("FDC_RETRIES", default=3, cast=int))
+
+Fdc_Api_Contacter.response_cache = Fdc_Response_Cache(
+        max_entries=config("FDC_CACHE_SIZE", default=1000, cast=int),
+        ttls={'lookup': config("FDC_LOOKUP_CACHE_TTL", default=7 * 24 * 60 * 60, cast=int),
+              'search': config("FDC_SEARCH_CACHE_TTL", default=24 * 60 * 60, cast=int)},
+        backing_store=Mongo_Response_Store(Fdc_Response))
+
 VALID_SERVING_UNITS = ("cups", "floz", "g", "oz", "tbsp", "tsp")
 
 FOOD_MODEL_OBJ_FLOAT_KEYS = ("serving_size", "energy_kcal", "biotin_B7_mcg", "calcium_mg", "cholesterol_mg",
@@ -48,9 +57,25 @@ def foods(request):
     page_size = retval["page_size"]
     page_number = retval["page_number"]
 
-    food_objs = [Food_Detailed.from_model_obj(food_model_obj) for food_model_obj in Food.objects.filter()]
-    food_objs.sort(key=attrgetter('food_name'))
-    number_of_results = len(food_objs)
+    if retval["cursor_mode"]:
+        food_model_objs, prev_cursor, next_cursor = slice_queryset_by_cursor(Food.objects.only(*Food_Row.fields),
+                                                                             'food_name', page_size, retval["after"],
+                                                                             retval["before"])
+        if not food_model_objs:
+            context["message"] = "No more results"
+        context["more_than_one_page"] = prev_cursor is not None or next_cursor is not None
+        context["pagination_links"] = generate_pagination_links("/foods/", None, page_size, None,
+                                                                cursors=(prev_cursor, next_cursor))
+        context['subordinate_navigation'] = navigation_links_displayer.href_list_wo_one_callable("/foods/")
+        context['food_objs'] = [Food_Row.from_model_obj(food_model_obj) for food_model_obj in food_model_objs]
+        return HttpResponse(foods_template.render(context, request))
+
+    # The count, the sort and the skip/limit are all done by MongoDB (the sort
+    # using the index on food_name), so only the foods on the requested page are
+    # transferred, and only the fields of them that a Food_Row needs. The count
+    # is the collection's estimated count, cached until a food is added or
+    # removed.
+    number_of_results = result_counts.count(Food)
     number_of_pages = math.ceil(number_of_results / page_size)
     if page_number > number_of_pages:
         context["more_than_one_page"] = True
@@ -58,8 +83,10 @@ def foods(request):
         context["pagination_links"] = generate_pagination_links("/foods/", number_of_results, page_size, page_number)
         return HttpResponse(foods_template.render(context, request))
 
-    if len(food_objs) > page_size:
-        food_objs = slice_output_list_by_page(food_objs, page_size, page_number)
+    food_model_objs = slice_output_list_by_page(Food.objects.only(*Food_Row.fields).order_by('food_name', '_id'),
+                                                page_size, page_number)
+    food_objs = [Food_Row.from_model_obj(food_model_obj) for food_model_obj in food_model_objs]
+    if number_of_results > page_size:
         context["more_than_one_page"] = True
         context["pagination_links"] = generate_pagination_links("/foods/", number_of_results, page_size, page_number)
     context['subordinate_navigation'] = navigation_links_displayer.href_list_wo_one_callable("/foods/")
@@ -113,25 +140,44 @@ def foods_local_search_results(request):
     search_query = retval["search_query"]
     page_size = retval["page_size"]
     page_number = retval["page_number"]
-    kws = search_query.strip().split()
-
-    # This is equivelant to q_term = (Q(food_name__icontains=kws[0]) & Q(food_name__icontains=kws[1])
-    #                                 & ... & Q(food_name__icontains=kws[-1]))
-    q_term = reduce(and_, (Q(food_name__icontains=kw) for kw in kws))
-    food_objs = list(Food.objects.filter(q_term))
-    food_objs.sort(key=attrgetter('food_name'))
-    if not len(food_objs):
+
+    # Both modes match a food if its name contains every keyword anywhere;
+    # see foods.models.search_food_ids(). Cursor pagination pages through the
+    # matches in name order, from foods.models.food_name_index, or if it's
+    # still being built for the first time, from the database.
+    if retval["cursor_mode"]:
+        q_term = food_search_q_term(search_query)
+        if q_term is None:
+            context["message"] = "No matches"
+            return HttpResponse(local_search_template.render(context, request))
+        name_ordered_matches = food_name_index.search_by_name(search_query)
+        if name_ordered_matches is None:
+            food_model_objs, prev_cursor, next_cursor = slice_queryset_by_cursor(
+                Food.objects.filter(q_term).only(*Food_Row.fields), 'food_name', page_size, retval["after"],
+                retval["before"])
+        else:
+            page_matches, prev_cursor, next_cursor = slice_list_by_cursor(name_ordered_matches, page_size,
+                                                                          retval["after"], retval["before"])
+            page_mongodb_ids = [mongodb_id for _, mongodb_id in page_matches]
+            food_model_objs = (sort_by_key_order(Food.objects.filter(_id__in=page_mongodb_ids).only(*Food_Row.fields),
+                                                 page_mongodb_ids) if page_mongodb_ids else [])
+        if not food_model_objs:
+            context["message"] = "No matches" if retval["after"] is None and retval["before"] is None \
+                                 else "No more results"
+        context["more_than_one_page"] = prev_cursor is not None or next_cursor is not None
+        context["pagination_links"] = generate_pagination_links("/foods/local_search_results/", None, page_size, None,
+                                                                search_query=search_query,
+                                                                cursors=(prev_cursor, next_cursor))
+        context['food_objs'] = [Food_Row.from_model_obj(food_model_obj) for food_model_obj in food_model_objs]
+        return HttpResponse(local_search_results_template.render(context, request))
+
+    # Otherwise the matches are ranked by how well they match.
+    ranked_mongodb_ids = search_food_ids(search_query)
+    number_of_results = len(ranked_mongodb_ids)
+    if not number_of_results:
         context["message"] = "No matches"
         return HttpResponse(local_search_template.render(context, request))
-    elif len(food_objs) <= page_size and page_number > 1:
-        context["more_than_one_page"] = True
-        context["message"] = "No more results"
-        context["pagination_links"] = generate_pagination_links("/foods/local_search_results/", len(food_objs),
-                                                                page_size, page_number, search_query=search_query)
-        return HttpResponse(local_search_template.render(context, request))
 
-    food_objs = [Food_Detailed.from_model_obj(food_model_obj) for food_model_obj in food_objs]
-    number_of_results = len(food_objs)
     number_of_pages = math.ceil(number_of_results / page_size)
     context["pagination_links"] = generate_pagination_links("/foods/local_search_results/", number_of_results,
                                                             page_size, page_number, search_query=search_query)
@@ -140,12 +186,11 @@ def foods_local_search_results(request):
         context["message"] = "No more results"
         return HttpResponse(local_search_results_template.render(context, request))
 
-    if len(food_objs) > page_size:
-        context["more_than_one_page"] = True
-        context['food_objs'] = slice_output_list_by_page(food_objs, page_size, page_number)
-    else:
-        context["more_than_one_page"] = False
-        context['food_objs'] = food_objs
+    page_mongodb_ids = slice_output_list_by_page(ranked_mongodb_ids, page_size, page_number)
+    food_model_objs = sort_by_key_order(Food.objects.filter(_id__in=page_mongodb_ids).only(*Food_Row.fields),
+                                        page_mongodb_ids)
+    context["more_than_one_page"] = number_of_results > page_size
+    context['food_objs'] = [Food_Row.from_model_obj(food_model_obj) for food_model_obj in food_model_objs]
     return HttpResponse(local_search_results_template.render(context, request))
 
 
@@ -166,7 +211,6 @@ def foods_fdc_search_results(request, fdc_api_contacter=Fdc_Api_Contacter):
                'message': '',
                'more_than_one_page': False}
     fdc_search_template = loader.get_template('foods/foods_fdc_search.html')
-    fdc_search_results_template = loader.get_template('foods/foods_fdc_search_results.html')
 
     retval = retrieve_pagination_params(fdc_search_template, context, request, DEFAULT_PAGE_SIZE, search_url,
                                         query=True)
@@ -176,16 +220,70 @@ def foods_fdc_search_results(request, fdc_api_contacter=Fdc_Api_Contacter):
     page_size = retval["page_size"]
     page_number = retval["page_number"]
 
-    number_of_results = api_contacter.number_of_search_results(query=search_query)
+    food_objs, number_of_results = api_contacter.search_with_total(query=search_query, page_size=page_size,
+                                                                   page_number=page_number)
+    if not number_of_results:
+        context["message"] = "No matches"
+        return HttpResponse(fdc_search_template.render(context, request))
+    mark_foods_in_db(food_objs)
+
+    context["detailed_url"] = "/foods/fdc_search_results/detailed/?" + request.GET.urlencode()
+    return render_fdc_search_results(request, context, food_objs, number_of_results, "/foods/fdc_search_results/",
+                                     search_query, page_size, page_number)
+
+
+# The same search results page as foods_fdc_search_results, with each result's
+# serving size and macronutrients besides its calories. Those take a lookup of
+# every food on the page, which are made concurrently by an
+# Async_Fdc_Api_Contacter, alongside the check for which foods are in the local
+# database. It's an async view, so it's only truly concurrent when the app is
+# served through nutritracker/asgi.py.
+async def foods_fdc_search_results_detailed(request, async_fdc_api_contacter=Async_Fdc_Api_Contacter):
+    # Django's method decorators don't support async views until 4.2.
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    search_url = "/foods/fdc_search/"
+    api_contacter = async_fdc_api_contacter(FDC_API_KEY)
+    subordinate_navigation = navigation_links_displayer.full_href_list_callable()
+    context = {'subordinate_navigation': subordinate_navigation,
+               'message': '',
+               'more_than_one_page': False}
+    fdc_search_template = loader.get_template('foods/foods_fdc_search.html')
+
+    retval = retrieve_pagination_params(fdc_search_template, context, request, DEFAULT_PAGE_SIZE, search_url,
+                                        query=True)
+    if isinstance(retval, HttpResponse):
+        return retval
+    search_query = retval["search_query"]
+    page_size = retval["page_size"]
+    page_number = retval["page_number"]
+
+    food_objs, number_of_results = await api_contacter.search_with_total(query=search_query, page_size=page_size,
+                                                                         page_number=page_number)
     if not number_of_results:
         context["message"] = "No matches"
         return HttpResponse(fdc_search_template.render(context, request))
-    food_objs = api_contacter.search_by_keywords(query=search_query, page_size=page_size, page_number=page_number)
+    fdc_ids = [food_obj.fdc_id for food_obj in food_objs]
+    food_detailed_objs, _ = await asyncio.gather(api_contacter.look_up_fdc_ids(fdc_ids),
+                                                 sync_to_async(mark_foods_in_db)(food_objs))
+    for food_obj in food_objs:
+        food_obj.food_detailed = food_detailed_objs.get(food_obj.fdc_id) or None
+
+    return render_fdc_search_results(request, context, food_objs, number_of_results,
+                                     "/foods/fdc_search_results/detailed/", search_query, page_size, page_number)
+
+
+def mark_foods_in_db(food_objs):
+    fdc_ids_present = fdc_ids_in_db(food_obj.fdc_id for food_obj in food_objs)
     for food_obj in food_objs:
-        food_obj.in_db_already = bool(len(Food.objects.filter(fdc_id=food_obj.fdc_id)))
+        food_obj.in_db_already = food_obj.fdc_id in fdc_ids_present
+
 
-    context["pagination_links"] = generate_pagination_links("/foods/fdc_search_results/", number_of_results, page_size,
-                                                            page_number, search_query=search_query)
+def render_fdc_search_results(request, context, food_objs, number_of_results, url_base, search_query, page_size,
+                              page_number):
+    fdc_search_results_template = loader.get_template('foods/foods_fdc_search_results.html')
+    context["pagination_links"] = generate_pagination_links(url_base, number_of_results, page_size, page_number,
+                                                            search_query=search_query)
 
     number_of_pages = math.ceil(number_of_results / page_size)
     if page_number > number_of_pages:
@@ -214,7 +312,7 @@ def foods_fdc_search_fdc_id(request, fdc_id, fdc_api_contacter=Fdc_Api_Contacter
         context['error'] = True
         context['message'] = f"Internal error in rendering food with ID {fdc_id}"
         return HttpResponse(template.render(context, request), status=500)
-    food_obj.in_db_already = bool(len(Food.objects.filter(fdc_id=food_obj.fdc_id)))
+    mark_foods_in_db((food_obj,))
     context['food_or_recipe_obj'] = context['food_obj'] = food_obj
     return HttpResponse(template.render(context, request))
 
@@ -231,10 +329,10 @@ def foods_fdc_import(request, fdc_api_contacter=Fdc_Api_Contacter):
     if isinstance(retval, HttpResponse):
         return retval
     fdc_id = retval
-    food_model_objs = list(Food.objects.filter(fdc_id=fdc_id))
-    if len(food_model_objs):
+    food_model_obj = Food.objects.filter(fdc_id=fdc_id).first()
+    if food_model_obj is not None:
         context['imported'] = False
-        context['food_obj'] = food_model_objs[0]
+        context['food_obj'] = food_model_obj
         return HttpResponse(template.render(context, request))
 
     food_obj = api_contacter.look_up_fdc_id(fdc_id)
@@ -245,7 +343,16 @@ def foods_fdc_import(request, fdc_api_contacter=Fdc_Api_Contacter):
 
     food_model_cls_argd = food_obj.to_model_cls_args()
     food_model_obj = Food(**food_model_cls_argd)
-    food_model_obj.save()
+    # Another request can import the same food while this one's looking it
+    # up; the unique fdc_id index turns the second save away.
+    try:
+        food_model_obj.save()
+    except DatabaseError as exception:
+        if not is_duplicate_key_error(exception):
+            raise
+        context['imported'] = False
+        context['food_obj'] = Food.objects.filter(fdc_id=fdc_id).first()
+        return HttpResponse(template.render(context, request))
     context['imported'] = True
 
     context['food_obj'] = food_model_obj
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+import pymongo
+
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+
+
+# Every model is unmanaged, so no migration ever creates the indexes they
+# declare in their Meta classes. These compare those declarations against the
+# indexes that actually exist; `./manage.py ensure_indexes` creates them.
+# Models can declare create_index() options that Django's Index has no way to
+# express, such as unique, in an index_options dict keyed by index name, and
+# indexes on keys Django's Index can't name, such as fields of embedded
+# documents, in a mongo_indexes dict of index names to pymongo-style keys.
+
+
+# Yields a (model, index name, index keys, index options) tuple for each
+# declared index, with the keys in the form pymongo's create_index() takes.
+def declared_indexes():
+    for model in apps.get_models():
+        for index in model._meta.indexes:
+            index_keys = [(field_name.removeprefix('-'),
+                           pymongo.DESCENDING if field_name.startswith('-') else pymongo.ASCENDING)
+                          for field_name in index.fields]
+            yield model, index.name, index_keys, getattr(model, 'index_options', {}).get(index.name, {})
+        for index_name, index_keys in getattr(model, 'mongo_indexes', {}).items():
+            yield model, index_name, list(index_keys), getattr(model, 'index_options', {}).get(index_name, {})
+
+
+# Returns 'present', 'missing', or 'different' if an index by that name exists
+# but with other keys or options than declared.
+def index_status(model, index_name, index_keys, index_options):
+    existing_index = model.objects.mongo_index_information().get(index_name)
+    if existing_index is None:
+        return 'missing'
+    existing_options = {option: value for option, value in existing_index.items() if option not in ('key', 'v', 'ns')}
+    if [tuple(index_key) for index_key in existing_index['key']] != index_keys or existing_options != index_options:
+        return 'different'
+    return 'present'
+
+
+# Creates the index if it's missing, replacing it first if it differs, and
+# returns its status beforehand. create_index() fails if an index by the same
+# name differs, as it will if the declaration has changed since it was created.
+def ensure_index(model, index_name, index_keys, index_options):
+    status = index_status(model, index_name, index_keys, index_options)
+    if status == 'different':
+        model.objects.mongo_drop_index(index_name)
+    if status != 'present':
+        model.objects.mongo_create_index(index_keys, name=index_name, **index_options)
+    return status
+
+
+# Connected to post_migrate, so `./manage.py migrate`, and the creation of the
+# test database, create the indexes too.
+def ensure_indexes_after_migrate(using='default', **kwargs):
+    for model, index_name, index_keys, index_options in declared_indexes():
+        if model.objects.db == using:
+            ensure_index(model, index_name, index_keys, index_options)
+
+
+# Returns a list of (model, index name, status) tuples for the declared
+# indexes that aren't present as declared.
+def absent_indexes():
+    return [(model, index_name, status) for model, index_name, index_keys, index_options in declared_indexes()
+            for status in (index_status(model, index_name, index_keys, index_options),) if status != 'present']
+
+
+# A system check, so `./manage.py check --database default` reports absent
+# indexes. They're errors in production, where every query that needs one
+# scans its whole collection, and warnings in development.
+@checks.register(checks.Tags.database)
+def check_indexes(app_configs=None, databases=None, **kwargs):
+    if not databases:
+        return []
+    message_cls, message_id = (checks.Warning, 'nutritracker.W001') if settings.DEBUG else (checks.Error,
+                                                                                           'nutritracker.E001')
+    return [message_cls(f"index '{index_name}' on '{model._meta.db_table}' is {status}",
+                        hint="run `./manage.py ensure_indexes`", obj=model, id=message_id)
+            for model, index_name, status in absent_indexes()]
+
+
+# Called by asgi.py and wsgi.py, so the app refuses to start in production
+# without its indexes.
+def verify_indexes():
+    if settings.DEBUG:
+        return
+    index_descriptions = [f"'{index_name}' on '{model._meta.db_table}' is {status}"
+                          for model, index_name, status in absent_indexes()]
+    if index_descriptions:
+        raise ImproperlyConfigured("MongoDB indexes aren't as declared, run `./manage.py ensure_indexes`: "
+                                   + "; ".join(index_descriptions))
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+import collections
+import threading
+
+from django.conf import settings
+
+from foods import models as foods_models
+from recipes import models as recipes_models
+from nutritracker.utils import Identity_Map, Food_Identity_Map, Request_Loader
+
+
+# Every request gets a Request_Loader as request.loader, with an identity map
+# for each kind of lookup the views repeat within a request: food documents by
+# fdc_id for hydrating reference ingredients, recipes.models.Food objects by
+# fdc_id, and Recipe objects by _id. Views called without the middleware, as
+# the tests call them, get one the first time they ask.
+def request_loader(request):
+    if not hasattr(request, 'loader'):
+        request.loader = Request_Loader(food_docs=Food_Identity_Map(foods_models.Food),
+                                        foods=Identity_Map(recipes_models.Food, 'fdc_id'),
+                                        recipes=Identity_Map(recipes_models.Recipe, '_id'))
+    return request.loader
+
+
+# The number of queries the loaders have saved, totaled over every request
+# this process has served, by identity map name.
+queries_saved = collections.Counter()
+queries_saved_lock = threading.Lock()
+
+
+def loader_statistics():
+    with queries_saved_lock:
+        return dict(queries_saved)
+
+
+# With DEBUG on, each response also says how many queries its loader saved,
+# in an X-Queries-Saved header.
+class Request_Loader_Middleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        loader = request_loader(request)
+        response = self.get_response(request)
+        statistics = loader.statistics()
+        with queries_saved_lock:
+            for name in loader.identity_maps:
+                queries_saved[name] += statistics[name]['saved']
+        if settings.DEBUG:
+            response['X-Queries-Saved'] = str(statistics['saved'])
+        return response
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+import numpy
+
+from nutritracker.utils import Nutrient, Nutrient_Vector
+
+
+# Batch counterparts to the per-object nutrient arithmetic in utils, for when
+# there are enough foods at once for the per-object overhead to matter: whole
+# result pages, every recipe in the collection, or a range of days of food
+# intake. They work on nutrient matrices, which have one row per food and one
+# column per nutrient in Nutrient_Vector.symbols order.
+
+
+# Nutrients without a daily value get NaN, which carries through to their
+# percentages.
+daily_values = numpy.array([Nutrient.daily_values.get(symbol, numpy.nan) for symbol in Nutrient_Vector.symbols])
+
+
+# Accepts Food_Detailed objects or the food dicts embedded in recipe documents.
+def nutrient_matrix(food_objs):
+    number_of_columns = len(Nutrient_Vector.symbols)
+    if not len(food_objs):
+        return numpy.zeros((0, number_of_columns))
+    if isinstance(food_objs[0], dict):
+        return numpy.array([[food_dict.get(symbol) or 0 for symbol in Nutrient_Vector.symbols]
+                            for food_dict in food_objs], dtype=float)
+    # Each food's vector is already a packed array of doubles, so the matrix
+    # can be read straight out of their concatenated bytes.
+    return numpy.frombuffer(b''.join(food_obj.nutrients.amounts.tobytes() for food_obj in food_objs)) \
+            .reshape(-1, number_of_columns).copy()
+
+
+def scale(matrix, servings_numbers):
+    return matrix * numpy.asarray(servings_numbers, dtype=float)[:, numpy.newaxis]
+
+
+# With no group_ids, sums every scaled row into one vector of totals. With
+# them, row i is added to group group_ids[i], so a single call can total every
+# recipe in a batch, or every day in a range, into a groups × nutrients matrix.
+def totals(matrix, servings_numbers, group_ids=None, number_of_groups=None):
+    scaled_matrix = scale(matrix, servings_numbers)
+    if group_ids is None:
+        return scaled_matrix.sum(axis=0)
+    group_ids = numpy.asarray(group_ids, dtype=numpy.intp)
+    if number_of_groups is None:
+        number_of_groups = int(group_ids.max()) + 1 if len(group_ids) else 0
+    grouped_totals = numpy.zeros((number_of_groups, len(Nutrient_Vector.symbols)))
+    numpy.add.at(grouped_totals, group_ids, scaled_matrix)
+    return grouped_totals
+
+
+def per_serving(totals_matrix, servings_counts):
+    servings_counts = numpy.asarray(servings_counts, dtype=float)
+    if servings_counts.ndim:
+        servings_counts = servings_counts[:, numpy.newaxis]
+    return totals_matrix / servings_counts
+
+
+# Matches Nutrient.dv_perc, rounded to the nearest whole percent.
+def dv_percentages(totals_matrix):
+    return numpy.round(100 * totals_matrix / daily_values)
+
+
+def to_nutrient_vectors(matrix):
+    return [Nutrient_Vector(row.tobytes()) for row in numpy.atleast_2d(numpy.asarray(matrix, dtype=float))]
@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Choices
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'nutritracker.middleware.Request_Loader_Middleware',
 ]
 
 ROOT_URLCONF = 'nutritracker.urls'
@@ -138,3 +139,16 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Number of page links generate_pagination_links() shows on either side of
+# the current page, besides the first and last pages.
+
+PAGINATION_WINDOW = config('PAGINATION_WINDOW', default=2, cast=int)
+
+# How new recipe ingredients store their food: 'embedded', a full copy of the
+# food in the recipe document, or 'reference', just its fdc_id and a content
+# hash, with the food looked up when the recipe is displayed. `./manage.py
+# migrate_ingredient_storage` converts existing recipes either way.
+
+RECIPE_INGREDIENT_STORAGE = config('RECIPE_INGREDIENT_STORAGE', default='embedded',
+                                   cast=Choices(['embedded', 'reference']))
@@ -1,18 +1,39 @@
 #!/usr/bin/python
 
 import abc
+import array
+import asyncio
+import base64
+import bisect
+import collections
+import datetime
+import io
 import json
 import re
 import requests
+import requests.adapters
 import functools
+import hashlib
+import html
 import math
+import operator
+import threading
+import time
 import urllib.parse
 
+from bson.objectid import ObjectId, InvalidId
+
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.db.models import Q
+
 from django.shortcuts import redirect
 
 from django.http import HttpResponse
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 
 get_cgi_params = lambda request: request.GET if request.method == "GET" else request.POST if request.method == "POST" else {}
@@ -42,17 +63,133 @@ def retrieve_pagination_params(template, context, request, default_page_size=25,
         return_dict["search_query"] = cgi_params.get("search_query", '')
         if not return_dict["search_query"]:
             return redirect(redir_url)
-    retval = cast_to_int(cgi_params.get("page_size", default_page_size), 'page_size', template, context, request)
+    retval = cast_to_int(cgi_params.get("page_size", default_page_size), 'page_size', template, context, request,
+                         lowerb=1)
     if isinstance(retval, HttpResponse):
         return retval
     return_dict["page_size"] = retval
-    retval = cast_to_int(cgi_params.get("page_number", 1), 'page_number', template, context, request)
+    retval = cast_to_int(cgi_params.get("page_number", 1), 'page_number', template, context, request, lowerb=1)
     if isinstance(retval, HttpResponse):
         return retval
     return_dict["page_number"] = retval
+    # Cursor mode is selected by the presence of an 'after' or 'before' param;
+    # an empty 'after' param requests the first page.
+    return_dict["cursor_mode"] = "after" in cgi_params or "before" in cgi_params
+    for cursor_param in ("after", "before"):
+        cursor = cgi_params.get(cursor_param, '')
+        if not cursor:
+            return_dict[cursor_param] = None
+            continue
+        try:
+            return_dict[cursor_param] = decode_pagination_cursor(cursor)
+        except (ValueError, TypeError, InvalidId):
+            context["error"] = True
+            context["message"] = f"value for {cursor_param} is not a valid pagination cursor; received '{cursor}'"
+            return HttpResponse(template.render(context, request))
     return return_dict
 
 
+def encode_pagination_cursor(sort_value, mongodb_id):
+    cursor_json = json.dumps([sort_value, str(mongodb_id)])
+    return base64.urlsafe_b64encode(cursor_json.encode('utf-8')).decode('ascii')
+
+
+def decode_pagination_cursor(cursor):
+    sort_value, mongodb_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if not isinstance(sort_value, str):
+        raise ValueError(f"sort value in pagination cursor must be a string; received {sort_value!r}")
+    return sort_value, ObjectId(mongodb_id)
+
+
+# Keyset pagination: rather than skipping (page_number - 1) * page_size
+# documents, this filters on the (sort_field, _id) key of the last row seen, so
+# with an index on (sort_field, _id) fetching any page costs the same as fetching
+# the first. One row past the page is fetched to find out if there's a next page.
+def slice_queryset_by_cursor(queryset, sort_field, page_size, after=None, before=None):
+    if before is not None:
+        sort_value, mongodb_id = before
+        queryset = queryset.filter(Q(**{f"{sort_field}__lt": sort_value})
+                                   | Q(**{sort_field: sort_value, "_id__lt": mongodb_id}))
+        model_objs = list(queryset.order_by(f"-{sort_field}", "-_id")[:page_size + 1])
+        has_prev_page = len(model_objs) > page_size
+        has_next_page = True
+        model_objs = model_objs[:page_size][::-1]
+    else:
+        if after is not None:
+            sort_value, mongodb_id = after
+            queryset = queryset.filter(Q(**{f"{sort_field}__gt": sort_value})
+                                       | Q(**{sort_field: sort_value, "_id__gt": mongodb_id}))
+        model_objs = list(queryset.order_by(sort_field, "_id")[:page_size + 1])
+        has_prev_page = after is not None
+        has_next_page = len(model_objs) > page_size
+        model_objs = model_objs[:page_size]
+    if not model_objs:
+        return model_objs, None, None
+    prev_cursor = (encode_pagination_cursor(getattr(model_objs[0], sort_field), model_objs[0]._id)
+                   if has_prev_page else None)
+    next_cursor = (encode_pagination_cursor(getattr(model_objs[-1], sort_field), model_objs[-1]._id)
+                   if has_next_page else None)
+    return model_objs, prev_cursor, next_cursor
+
+
+# The same, over the documents of model_class's collection that match a
+# MongoDB filter, for searches that are also counted and paged by page number
+# with that filter. Returns the page's _ids in order.
+def slice_collection_by_cursor(model_class, mongo_filter, sort_field, page_size, after=None, before=None):
+    sort_order = -1 if before is not None else 1
+    if before is not None or after is not None:
+        sort_value, mongodb_id = before if before is not None else after
+        comparison = '$lt' if before is not None else '$gt'
+        mongo_filter = {'$and': [mongo_filter, {'$or': [{sort_field: {comparison: sort_value}},
+                                                        {sort_field: sort_value, '_id': {comparison: mongodb_id}}]}]}
+    mongo_docs = list(model_class.objects.mongo_find(mongo_filter, {sort_field: True})
+                      .sort([(sort_field, sort_order), ('_id', sort_order)]).limit(page_size + 1))
+    if before is not None:
+        has_prev_page = len(mongo_docs) > page_size
+        has_next_page = True
+        mongo_docs = mongo_docs[:page_size][::-1]
+    else:
+        has_prev_page = after is not None
+        has_next_page = len(mongo_docs) > page_size
+        mongo_docs = mongo_docs[:page_size]
+    if not mongo_docs:
+        return [], None, None
+    prev_cursor = (encode_pagination_cursor(mongo_docs[0][sort_field], mongo_docs[0]['_id'])
+                   if has_prev_page else None)
+    next_cursor = (encode_pagination_cursor(mongo_docs[-1][sort_field], mongo_docs[-1]['_id'])
+                   if has_next_page else None)
+    return [mongo_doc['_id'] for mongo_doc in mongo_docs], prev_cursor, next_cursor
+
+
+# The same, over a list of (sort_value, _id) pairs that's already in that
+# order, for results that don't come from a database query. Returns the
+# page's pairs.
+def slice_list_by_cursor(sorted_pairs, page_size, after=None, before=None):
+    if before is not None:
+        end = bisect.bisect_left(sorted_pairs, before)
+        start = max(end - page_size, 0)
+        has_prev_page = start > 0
+        has_next_page = True
+    else:
+        start = bisect.bisect_right(sorted_pairs, after) if after is not None else 0
+        end = start + page_size
+        has_prev_page = after is not None
+        has_next_page = end < len(sorted_pairs)
+    page_pairs = sorted_pairs[start:end]
+    if not page_pairs:
+        return page_pairs, None, None
+    prev_cursor = encode_pagination_cursor(*page_pairs[0]) if has_prev_page else None
+    next_cursor = encode_pagination_cursor(*page_pairs[-1]) if has_next_page else None
+    return page_pairs, prev_cursor, next_cursor
+
+
+# Puts model objects fetched with a `__in` filter, which come back in no
+# particular order, into the order of the list of keys they were fetched by.
+def sort_by_key_order(model_objs, keys, attr_name='_id'):
+    key_positions = {key: position for position, key in enumerate(keys)}
+    return sorted(model_objs, key=lambda model_obj: key_positions[getattr(model_obj, attr_name)])
+
+
 def cast_to_int(strval, param_name, template, context, request, lowerb=-math.inf, upperb=math.inf):
     if lowerb != -math.inf and isinstance(lowerb, float):
         raise ValueError(f"cast_to_int() called with float value for 'lowerb': {lowerb}")
@@ -124,26 +261,383 @@ def check_str_param(strval, param_name, template, context, request, lowerb=0, up
     return strval
 
 
+# Decodes JSON values one at a time from a text file, reading it chunk_size
+# characters at a time, so only the value being decoded needs to be in memory.
+class Json_Stream_Reader:
+    __slots__ = 'text_fh', 'chunk_size', 'buffer', 'position', 'decoder'
+
+    number_chars = frozenset('-+0123456789.eE')
+
+    # The length of '-Infinity', the longest literal the decoder accepts.
+    truncation_margin = 9
+
+    def __init__(self, text_fh, chunk_size=1 << 20):
+        self.text_fh = text_fh
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    def _read_more(self, min_size=0):
+        chunk = self.text_fh.read(max(self.chunk_size, min_size))
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    # Skips whitespace and returns the next character without consuming it, or
+    # '' at the end of the input.
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read_more():
+                return ''
+
+    def consume(self, char):
+        next_char = self.peek()
+        if next_char != char:
+            raise ValueError(f"expected '{char}' in JSON input, found '{next_char}'" if next_char
+                             else f"expected '{char}' in JSON input, found end of input")
+        self.position += 1
+
+    # A value that only fails to decode because it runs past the end of the
+    # buffer fails at the end of it, a few characters short of it if it ends
+    # in a partial literal like 'fals' or a partial '\uXXXX' escape, or at the
+    # opening quote of a string that isn't closed. Any other failure is an
+    # error in the buffered text.
+    def _is_truncated(self, decode_error):
+        return (len(self.buffer) - decode_error.pos <= self.truncation_margin
+                or decode_error.msg == "Unterminated string starting at")
+
+    # A number can be split anywhere, even after its '.' or 'e', and still
+    # decode as a shorter number, so one is only decoded once the character
+    # after it, or the end of the input, has been read. Any other value is
+    # incomplete until its last character has been read, and fails to decode
+    # before then. Each retry at least doubles what's buffered of the value,
+    # so a value much longer than chunk_size isn't decoded over and over.
+    def decode(self):
+        if self.peek() in self.number_chars:
+            number_length = 0
+            while True:
+                while (self.position + number_length < len(self.buffer)
+                       and self.buffer[self.position + number_length] in self.number_chars):
+                    number_length += 1
+                if self.position + number_length < len(self.buffer) or not self._read_more():
+                    break
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as decode_error:
+                if not self._is_truncated(decode_error) or not self._read_more(len(self.buffer) - self.position):
+                    raise
+                continue
+            self.position = end
+            return value
+
+
+# Yields the items of a JSON array in a text file one at a time. The input can
+# be the array itself or an object containing it, such as an FDC API search
+# response or one of the FDC dumps, which are a single object holding an
+# array of every food. In that case the array is the one under array_key, or
+# the first array-valued member if that's None, and if other_values is a dict
+# the members that precede the array are stored in it as they're passed.
+def iterate_json_array(text_fh, array_key=None, other_values=None, chunk_size=1 << 20):
+    reader = Json_Stream_Reader(text_fh, chunk_size)
+    if reader.peek() == '{':
+        reader.consume('{')
+        while True:
+            if reader.peek() == '}':
+                raise ValueError(f"no array under '{array_key}' in JSON object" if array_key is not None
+                                 else "no array in JSON object")
+            key = reader.decode()
+            reader.consume(':')
+            if reader.peek() == '[' and (array_key is None or key == array_key):
+                break
+            value = reader.decode()
+            if other_values is not None:
+                other_values[key] = value
+            if reader.peek() != '}':
+                reader.consume(',')
+    reader.consume('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        if not reader.peek():
+            raise ValueError("input ended inside a JSON array")
+        yield reader.decode()
+        if reader.peek() == ']':
+            return
+        reader.consume(',')
+
+
 def get_db_handle(db_name, host, port, username, password):
     client = MongoClient(host=host, port=int(port), username=username, password=password)
     db_handle = client['nutritracker']
     return db_handle, client
 
 
-def title_case(strval):
-    is_unc_alnum_punct = lambda strval: re.match("^[A-Za-zÀ-ÿ0-9._'ʼ’]+$", strval)
+# djongo writes with insert_many(), so a duplicate key can turn up as a
+# BulkWriteError with code 11000 as well as a DuplicateKeyError, and it raises
+# the pymongo error as the cause of its own DatabaseError, which Django wraps
+# in turn.
+def is_duplicate_key_error(exception):
+    while exception is not None:
+        if isinstance(exception, DuplicateKeyError):
+            return True
+        elif isinstance(exception, BulkWriteError) and any(write_error.get('code') == 11000 for write_error
+                                                           in exception.details.get('writeErrors', ())):
+            return True
+        exception = exception.__cause__ or exception.__context__
+    return False
+
+
+# A local search query is broken into its keywords, the distinct lowercased
+# alphanumeric words in it, and food names into theirs the same way for
+# ranking; see Trigram_Index.rank().
+def tokenize_food_name(food_name):
+    return list(dict.fromkeys(re.findall(r"[^\W_]+", food_name.lower())))
+
+
+# A food matches a local search if its name contains every keyword anywhere,
+# case insensitively. This is that rule as a database query, for when
+# Trigram_Index below hasn't been built yet. Keywords are runs of word
+# characters, so there's nothing in them for icontains' regex to escape.
+def food_search_q_term(search_query):
+    keywords = tokenize_food_name(search_query)
+    if not keywords:
+        return None
+    return functools.reduce(operator.and_, (Q(food_name__icontains=keyword) for keyword in keywords))
+
+
+# An in-memory index of food names by their three-character substrings, which
+# answers substring searches ("chedd", "ogurt") without scanning every
+# food_name. The loader is a callable returning (key, food_name) pairs, and
+# generation a callable returning the generation of the foods collection,
+# which every process and command that changes it bumps; see
+# Mongo_Generation_Store. The index is never built in a request: a search that
+# finds it unbuilt or a generation behind starts a rebuild in a background
+# thread and is answered from the index as it stands, or with None if it's
+# never been built.
+#
+# This process's own changes are applied with add() and remove(), given the
+# generation their write bumped the collection to, so they don't cost a
+# rebuild. Rebuilding for other processes' changes means reloading every food
+# name, so the generation is read at most once every generation_ttl seconds,
+# and a rebuild starts at most once every rebuild_interval seconds; a steady
+# import elsewhere shows up that much late, rather than keeping every worker
+# rebuilding.
+class Trigram_Index:
+    __slots__ = 'loader', 'generation', 'generation_ttl', 'rebuild_interval', 'names', 'postings', \
+                'built_generation', 'known_generation', 'known_at', 'build_started_at', 'pending', 'builder', 'lock', \
+                'build_lock'
+
+    def __init__(self, loader, generation=lambda: 0, generation_ttl=0, rebuild_interval=0):
+        self.loader = loader
+        self.generation = generation
+        self.generation_ttl = generation_ttl
+        self.rebuild_interval = rebuild_interval
+        self.names = dict()
+        self.postings = dict()
+        self.built_generation = None
+        self.known_generation = None
+        self.known_at = -math.inf
+        self.build_started_at = -math.inf
+        self.pending = None
+        self.builder = None
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+
+    @staticmethod
+    def trigrams(strval):
+        return {strval[index:index+3] for index in range(len(strval) - 2)}
+
+    # Builds into new dicts, so searches go on using the old ones until it's
+    # done. The generation is read before the loader runs, so a change made
+    # while it's running leaves the index a generation behind rather than
+    # missing the change for good. Changes this process makes while it runs
+    # are replayed onto the new dicts, and count toward its generation.
+    def build(self):
+        with self.build_lock:
+            with self.lock:
+                self.pending = list()
+                self.build_started_at = time.monotonic()
+            generation = self.generation()
+            names, postings = dict(), dict()
+            for key, food_name in self.loader():
+                self._add(names, postings, key, food_name)
+            with self.lock:
+                for key, food_name, change_generation in self.pending:
+                    self._remove(names, postings, key)
+                    if food_name is not None:
+                        self._add(names, postings, key, food_name)
+                    if change_generation == generation + 1:
+                        generation = change_generation
+                self.names, self.postings = names, postings
+                self.pending = None
+                self.built_generation = generation
+                self._note_generation(generation)
+
+    def start_build(self):
+        with self.lock:
+            if self.builder is None or not self.builder.is_alive():
+                self.build_started_at = time.monotonic()
+                self.builder = threading.Thread(target=self.build, daemon=True)
+                self.builder.start()
+
+    def wait(self):
+        builder = self.builder
+        if builder is not None:
+            builder.join()
+
+    def add(self, key, food_name, generation=None):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((key, food_name, generation))
+            if self.built_generation is not None:
+                self._remove(self.names, self.postings, key)
+                self._add(self.names, self.postings, key, food_name)
+                self._advance(generation)
+
+    def remove(self, key, generation=None):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((key, None, generation))
+            if self.built_generation is not None:
+                self._remove(self.names, self.postings, key)
+                self._advance(generation)
+
+    # If nothing else has changed the collection since the index was built
+    # or last advanced, the change this process just applied brings it up to
+    # the generation its write bumped the collection to.
+    def _advance(self, generation):
+        if generation is not None and generation == self.built_generation + 1:
+            self.built_generation = generation
+            self._note_generation(generation)
+
+    def _note_generation(self, generation):
+        if self.known_generation is None or generation > self.known_generation:
+            self.known_generation = generation
+            self.known_at = time.monotonic()
+
+    @classmethod
+    def _add(cls, names, postings, key, food_name):
+        names[key] = food_name
+        for trigram in cls.trigrams(food_name.lower()):
+            postings.setdefault(trigram, set()).add(key)
+
+    @classmethod
+    def _remove(cls, names, postings, key):
+        food_name = names.pop(key, None)
+        if food_name is None:
+            return
+        for trigram in cls.trigrams(food_name.lower()):
+            postings[trigram].discard(key)
+            if not postings[trigram]:
+                del postings[trigram]
+
+    def _is_built(self):
+        if self.built_generation is None:
+            self.start_build()
+            return False
+        if time.monotonic() - self.known_at >= self.generation_ttl:
+            generation = self.generation()
+            with self.lock:
+                self._note_generation(generation)
+                self.known_at = time.monotonic()
+        with self.lock:
+            if self.known_generation != self.built_generation \
+                    and time.monotonic() - self.build_started_at >= self.rebuild_interval:
+                self.start_build()
+        return True
+
+    # Called with the lock held.
+    def _matching_keys(self, keywords):
+        query_trigrams = set().union(*(self.trigrams(keyword) for keyword in keywords))
+        if query_trigrams:
+            # Intersecting smallest posting sets first keeps the intermediate
+            # candidate sets small.
+            postings = sorted((self.postings.get(trigram, set()) for trigram in query_trigrams), key=len)
+            candidate_keys = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidate_keys = self.names.keys()
+        # Trigrams are only a filter; a name can contain every trigram of a
+        # keyword without containing the keyword itself.
+        return [key for key in candidate_keys if all(keyword in self.names[key].lower() for keyword in keywords)]
+
+    # Returns the keys of the foods whose names contain every keyword in the
+    # query, best matches first.
+    def search(self, search_query):
+        keywords = tokenize_food_name(search_query)
+        if not keywords:
+            return []
+        if not self._is_built():
+            return None
+        with self.lock:
+            ranked_matches = sorted((self.rank(self.names[key].lower(), keywords), key)
+                                    for key in self._matching_keys(keywords))
+        return [key for _, key in ranked_matches]
+
+    # Returns the same matches as (food_name, key) pairs, in the order the
+    # database sorts foods by name; see slice_list_by_cursor().
+    def search_by_name(self, search_query):
+        keywords = tokenize_food_name(search_query)
+        if not keywords:
+            return []
+        if not self._is_built():
+            return None
+        with self.lock:
+            return sorted((self.names[key], key) for key in self._matching_keys(keywords))
+
+    # Sort key for a matching name: exact matches, then names beginning with
+    # the first keyword, then names where every keyword begins a word, then
+    # mid-word matches; within each of those, shorter names (which the query
+    # covers more of) first, then alphabetical order.
+    @staticmethod
+    def rank(food_name, keywords):
+        name_tokens = tokenize_food_name(food_name)
+        if name_tokens == keywords:
+            tier = 0
+        elif name_tokens[0].startswith(keywords[0]):
+            tier = 1
+        elif all(any(name_token.startswith(keyword) for name_token in name_tokens) for keyword in keywords):
+            tier = 2
+        else:
+            tier = 3
+        return tier, len(food_name), food_name
+
+
+# title_case() runs on every food and recipe name that isn't already stored
+# title cased, so its patterns are compiled once here, and its results are
+# memoized; the same few thousand food names turn up on page after page.
+title_case_word_chars = "A-Za-zÀ-ÿ0-9._'ʼ’"
+
+title_case_lc_words = frozenset({"a", "an", "and", "as", "at", "but", "by", "even", "for", "from", "if", "in", "into",
+                                 "'n", "n'", "'n'", "ʼn", "nʼ", "ʼnʼ", "’n", "n’", "’n’", "nor", "now", "of", "off",
+                                 "on", "or", "out", "so", "than", "that", "the", "to", "top", "up", "upon", "w", "when",
+                                 "with", "yet"})
+
+title_case_tokenizing_re = re.compile(f"(?<=[{title_case_word_chars}])(?=[^{title_case_word_chars}])"
+                                          "|"
+                                      f"(?<=[^{title_case_word_chars}])(?=[{title_case_word_chars}])")
+
+title_case_word_re = re.compile(f"^[{title_case_word_chars}]+$")
 
-    capitalize = lambda strval: re.sub("[A-Za-zÀ-ÿ]", lambda m: m.group(0).upper(), strval, count=1)
+title_case_initialism_re = re.compile(r"^([A-Za-zÀ-ÿ]\.){2,}$")
 
-    title_case_lc_words = {"a", "an", "and", "as", "at", "but", "by", "even", "for", "from", "if", "in", "into", "'n",
-                           "n'", "'n'", "ʼn", "nʼ", "ʼnʼ", "’n", "n’", "’n’", "nor", "now", "of", "off", "on", "or",
-                           "out", "so", "than", "that", "the", "to", "top", "up", "upon", "w", "when", "with", "yet"}
+title_case_lc_word_re = re.compile("^([à-ÿa-z'’ʼ]+)$")
 
-    tokenizing_re = re.compile("(?<=[A-Za-zÀ-ÿ0-9._'ʼ’])(?=[^A-Za-zÀ-ÿ0-9._'ʼ’])"
-                                   "|"
-                               "(?<=[^A-Za-zÀ-ÿ0-9._'ʼ’])(?=[A-Za-zÀ-ÿ0-9._'ʼ’])")
+title_case_first_letter_re = re.compile("[A-Za-zÀ-ÿ]")
 
-    tokens = tokenizing_re.split(strval)
+capitalize = lambda strval: title_case_first_letter_re.sub(lambda m: m.group(0).upper(), strval, count=1)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def title_case(strval):
+    tokens = title_case_tokenizing_re.split(strval)
 
     output = list()
     first_alpha_token_index = -1
@@ -154,24 +648,23 @@ def title_case(strval):
     # first and last words in a string to be titlecased only applies to the
     # first and last _actual words_, not counting non-alphanumeric substrings,
     # so the indexes of the first and last actual words need to be found.
-    for index, token in zip(range(len(tokens)), tokens):
-        if is_unc_alnum_punct(token):
+    for index, token in enumerate(tokens):
+        if title_case_word_re.match(token):
             first_alpha_token_index = index
             break
-    for index, token in zip(range(len(tokens) - 1, -1, -1), reversed(tokens)):
-        if is_unc_alnum_punct(token):
+    for index in range(len(tokens) - 1, -1, -1):
+        if title_case_word_re.match(tokens[index]):
             last_alpha_token_index = index
             break
 
-    for index in range(len(tokens)):
-        token = tokens[index]
-        if re.match(r"^([A-Za-zÀ-ÿ]\.){2,}$", token):
+    for index, token in enumerate(tokens):
+        if title_case_initialism_re.match(token):
             token = token.upper()
         elif index == first_alpha_token_index or index == last_alpha_token_index:
             token = capitalize(token)
         elif token.lower() in title_case_lc_words:
             token = token.lower()
-        elif re.match("^([à-ÿa-z'’ʼ]+)$", token):
+        elif title_case_lc_word_re.match(token):
             token = capitalize(token)
         output.append(token)
 
@@ -200,32 +693,87 @@ class Navigation_Links_Displayer:
                           for nav_href, nav_link_text in self.nav_hrefs_to_texts.items())
 
 
+# Recipe documents carry a nutrient_totals subdocument mapping each nutrient
+# symbol to the recipe's total amount of it, which is adjusted as ingredients
+# are added and removed so recipes can be displayed without re-summing their
+# ingredients. These take the embedded food dicts stored in a recipe's
+# ingredients list.
+def update_nutrient_totals(nutrient_totals, food_dict, servings_number):
+    updated_totals = dict.fromkeys(Nutrient.nutrient_symbols_to_numbers, 0)
+    updated_totals.update(nutrient_totals or {})
+    for symbol in Nutrient.nutrient_symbols_to_numbers:
+        updated_totals[symbol] += servings_number * (food_dict.get(symbol) or 0)
+    return updated_totals
+
+
+def sum_nutrient_totals(ingredient_dicts):
+    nutrient_totals = dict.fromkeys(Nutrient.nutrient_symbols_to_numbers, 0)
+    for ingredient_dict in ingredient_dicts:
+        nutrient_totals = update_nutrient_totals(nutrient_totals, ingredient_dict["food"],
+                                                 ingredient_dict["servings_number"])
+    return nutrient_totals
+
+
+# Ingredients are stored either with an embedded copy of their food, or, if
+# settings.RECIPE_INGREDIENT_STORAGE is 'reference', with only its fdc_id and a
+# content hash of the food as it was when the ingredient was added; the food
+# itself is looked up when the recipe is displayed, so a re-imported food
+# shows up in every recipe that uses it. The hash is of the fields an embedded
+# copy would have, with numbers as floats, so a food reads back from either
+# collection or either driver with the same hash.
+def food_content_hash(food_dict):
+    food_content = [food_dict.get('food_name') or '', float(food_dict.get('serving_size') or 0),
+                    food_dict.get('serving_units') or '']
+    food_content.extend(float(food_dict.get(symbol) or 0) for symbol in sorted(Nutrient.nutrient_symbols_to_numbers))
+    return hashlib.sha1(json.dumps(food_content).encode('utf-8')).hexdigest()
+
+
+ingredient_fdc_id = lambda ingredient_dict: ingredient_dict['food']['fdc_id'] if ingredient_dict.get('food') else ingredient_dict['fdc_id']
+
+
+def reference_ingredient(ingredient_dict):
+    return {'_id': ingredient_dict.get('_id'), 'servings_number': ingredient_dict['servings_number'],
+            'fdc_id': ingredient_dict['food']['fdc_id'], 'food_hash': food_content_hash(ingredient_dict['food']),
+            'food': None}
+
+
+# Returns the ingredient dicts with each referenced food filled in from the
+# identity map, which looks them all up in one query. A food that's gone from
+# the foods collection raises a ValueError.
+def resolve_ingredient_foods(ingredient_dicts, food_identity_map):
+    food_docs = food_identity_map.get_many(ingredient_dict['fdc_id'] for ingredient_dict in ingredient_dicts
+                                           if not ingredient_dict.get('food'))
+    resolved_dicts = list()
+    for ingredient_dict in ingredient_dicts:
+        if not ingredient_dict.get('food'):
+            if food_docs[ingredient_dict['fdc_id']] is None:
+                raise ValueError(f"no food with FDC ID {ingredient_dict['fdc_id']} to resolve ingredient with")
+            ingredient_dict = dict(ingredient_dict, food=food_docs[ingredient_dict['fdc_id']])
+        resolved_dicts.append(ingredient_dict)
+    return resolved_dicts
+
+
 class Recipe_Detailed:
-    __slots__ = 'mongodb_id', 'recipe_name', 'ingredients', 'complete'
+    __slots__ = ('mongodb_id', 'recipe_name', '_ingredients', '_unhydrated_ingredients', 'complete', '_nutrient_totals',
+                 '_food_identity_map')
 
     # This class calls for 26 properties that all behave identically apart from
     # which symbol they query, so this class generalizes that repeated __get__()
-    # method.
+    # method. The totals themselves come from the recipe's stored
+    # nutrient_totals if it has them, and otherwise are summed from the
+    # ingredients' nutrient vectors and cached on the instance.
     class Summing_Property:
-        __slots__ = 'symbol', 'memoized'
+        __slots__ = 'symbol',
 
         def __init__(self, symbol):
             self.symbol = symbol
-            self.memoized = None
 
         def __get__(self, instance, instancetype=None):
-            if self.memoized is not None:
-                return self.memoized
-            nutrient_obj = Nutrient.from_symbol(self.symbol)
-            if len(instance.ingredients):
-                amount = 0
-                for ingr_obj in instance.ingredients:
-                    if not hasattr(ingr_obj.food, self.symbol):
-                        continue
-                    amount += ingr_obj.servings_number * getattr(ingr_obj.food, self.symbol).amount
-                nutrient_obj.amount = amount
-            self.memoized = nutrient_obj
-            return nutrient_obj
+            if instance is None:
+                return self
+            if instance._nutrient_totals is None:
+                instance._nutrient_totals = instance._sum_nutrients()
+            return instance._nutrient_totals.nutrient(self.symbol)
 
         def __set__(self, instance):
             raise AttributeError(f"'{instance.__class__.__name__}' object attribute '{self.symbol}' is read-only")
@@ -233,27 +781,115 @@ class Recipe_Detailed:
         def __delete__(self, instance):
             raise AttributeError(f"'{instance.__class__.__name__}' object attribute '{self.symbol}' is read-only")
 
-    def __init__(self, recipe_name, mongodb_id=None, ingredients=[], complete=False):
+    # Recipes store their title cased name as display_name when they're saved,
+    # so it's only computed here for recipes that predate that.
+    # Recipes with reference ingredients need a Food_Identity_Map to look
+    # their foods up in; see resolve_foods().
+    def __init__(self, recipe_name, mongodb_id=None, ingredients=[], complete=False, nutrient_totals=None,
+                 display_name=None, food_identity_map=None):
         self.mongodb_id = mongodb_id
-        self.recipe_name = title_case(recipe_name.lower())
+        self.recipe_name = display_name if display_name else title_case(recipe_name.lower())
         self.complete = complete
-        ingredient_list = list()
-        for ingredient_obj in ingredients:
-            if isinstance(ingredient_obj, dict):
-                ingredient_list.append(Ingredient_Detailed.from_json_obj(ingredient_obj))
-            elif isinstance(ingredient_obj, Ingredient_Detailed):
-                ingredient_list.append(ingredient_obj)
-            else:
-                raise ValueError(f"Recipe_Detailed.__init__ unable to import ingredient object of type '{ingredient_obj.__class__.__name__}'")
-        self.ingredients = [Ingredient_Detailed.from_json_obj(ingredient_obj) for ingredient_obj in ingredients]
-
+        # Building Food_Detailed objects for every ingredient is the expensive
+        # part of instancing a recipe, and pages that only show its totals
+        # don't need them, so that's put off until the ingredients are used.
+        self._ingredients = None
+        self._unhydrated_ingredients = ingredients
+        self._nutrient_totals = Nutrient_Vector.from_dict(nutrient_totals) if nutrient_totals else None
+        self._food_identity_map = food_identity_map
+
+    # The ingredients are stored as a tuple so they can only be changed by
+    # assigning to this property, which discards the nutrient totals. Ingredient
+    # dicts are as stored in recipe documents, whether read by pymongo or
+    # djongo, and are read directly; see Ingredient_Detailed.from_mongo_doc().
+    # Reference ingredients are given the food as it is now; if any has
+    # changed since it was added, the stored totals are out of date and are
+    # summed again.
+    @property
+    def ingredients(self):
+        if self._ingredients is None:
+            ingredient_list = list()
+            food_docs = self._referenced_food_docs()
+            for ingredient_obj in self._unhydrated_ingredients:
+                if isinstance(ingredient_obj, dict):
+                    ingredient_list.append(Ingredient_Detailed.from_mongo_doc(ingredient_obj, food_docs))
+                elif isinstance(ingredient_obj, Ingredient_Detailed):
+                    ingredient_list.append(ingredient_obj)
+                else:
+                    raise ValueError(f"Recipe_Detailed.__init__ unable to import ingredient object of type '{ingredient_obj.__class__.__name__}'")
+            self._ingredients = tuple(ingredient_list)
+            self._unhydrated_ingredients = None
+            if any(ingredient_obj.food_changed for ingredient_obj in self._ingredients):
+                self._nutrient_totals = None
+        return self._ingredients
+
+    @ingredients.setter
+    def ingredients(self, ingredients):
+        self._ingredients = tuple(ingredients)
+        self._unhydrated_ingredients = None
+        self._nutrient_totals = None
+
+    def _referenced_fdc_ids(self):
+        if self._unhydrated_ingredients is None:
+            return []
+        return [ingredient_obj['fdc_id'] for ingredient_obj in self._unhydrated_ingredients
+                if isinstance(ingredient_obj, dict) and not ingredient_obj.get('food')]
+
+    def _referenced_food_docs(self):
+        fdc_ids = self._referenced_fdc_ids()
+        if not fdc_ids:
+            return {}
+        if self._food_identity_map is None:
+            raise ValueError(f"recipe '{self.recipe_name}' has reference ingredients but no food identity map "
+                             "to look their foods up in")
+        return self._food_identity_map.get_many(fdc_ids)
+
+    # Looks up the foods for the reference ingredients of every recipe given,
+    # typically a page of them, in one query per identity map, so hydrating
+    # each recipe's ingredients afterward finds its foods already fetched.
     @classmethod
-    def from_json_obj(self, recipe_json_obj):
-        return self(recipe_name=recipe_json_obj["recipe_name"], complete=recipe_json_obj["complete"], mongodb_id=recipe_json_obj["_id"], ingredients=recipe_json_obj["ingredients"])
+    def resolve_foods(self, recipe_objs):
+        fdc_ids_by_map = dict()
+        for recipe_obj in recipe_objs:
+            fdc_ids = recipe_obj._referenced_fdc_ids()
+            if fdc_ids and recipe_obj._food_identity_map is not None:
+                fdc_ids_by_map.setdefault(id(recipe_obj._food_identity_map),
+                                          (recipe_obj._food_identity_map, list()))[1].extend(fdc_ids)
+        for food_identity_map, fdc_ids in fdc_ids_by_map.values():
+            food_identity_map.get_many(fdc_ids)
+        return recipe_objs
+
+    def _sum_nutrients(self):
+        nutrient_totals = Nutrient_Vector()
+        for ingr_obj in self.ingredients:
+            nutrient_totals += ingr_obj.nutrients
+        return nutrient_totals
 
     @classmethod
-    def from_model_obj(self, recipe_model_obj):
-        return self(recipe_name=recipe_model_obj.recipe_name, complete=bool(recipe_model_obj.complete), mongodb_id=recipe_model_obj._id, ingredients=recipe_model_obj.ingredients)
+    def from_json_obj(self, recipe_json_obj, food_identity_map=None):
+        return self(recipe_name=recipe_json_obj["recipe_name"], complete=recipe_json_obj["complete"], mongodb_id=recipe_json_obj["_id"], ingredients=recipe_json_obj["ingredients"],
+                    nutrient_totals=recipe_json_obj.get("nutrient_totals"), display_name=recipe_json_obj.get("display_name"),
+                    food_identity_map=food_identity_map)
+
+    # Builds the recipe straight from its document in the recipes collection,
+    # as returned by pymongo, without a model object or a serialize() copy in
+    # between. Each ingredient and food is built once, when the ingredients are
+    # first used.
+    @classmethod
+    def from_mongo_doc(self, recipe_doc, food_identity_map=None):
+        return self(recipe_name=recipe_doc["recipe_name"], complete=bool(recipe_doc.get("complete")), mongodb_id=recipe_doc["_id"],
+                    ingredients=recipe_doc.get("ingredients") or [], nutrient_totals=recipe_doc.get("nutrient_totals"),
+                    display_name=recipe_doc.get("display_name"), food_identity_map=food_identity_map)
+
+    # A model object read with .only() and without its ingredients, as the
+    # recipe lists read them, gives a recipe with none rather than reading
+    # them in a query of its own.
+    @classmethod
+    def from_model_obj(self, recipe_model_obj, food_identity_map=None):
+        ingredients = recipe_model_obj.ingredients if 'ingredients' not in recipe_model_obj.get_deferred_fields() else ()
+        return self(recipe_name=recipe_model_obj.recipe_name, complete=bool(recipe_model_obj.complete), mongodb_id=recipe_model_obj._id, ingredients=ingredients,
+                    nutrient_totals=recipe_model_obj.nutrient_totals, display_name=recipe_model_obj.display_name,
+                    food_identity_map=food_identity_map)
 
     biotin_B7_mcg          = Summing_Property('biotin_B7_mcg')
     calcium_mg             = Summing_Property('calcium_mg')
@@ -368,6 +1004,95 @@ class Nutrient:
         return serialized
 
 
+# A view of one nutrient's amount in a Nutrient_Vector, which behaves like a
+# Nutrient for templates and serialization but takes its name, units, etc.
+# from the shared Nutrient.nutrient_argds table instead of storing its own.
+# Setting its amount writes through to the vector.
+class Nutrient_View(Nutrient):
+    __slots__ = 'vector', 'index'
+
+    def __init__(self, vector, index):
+        self.vector = vector
+        self.index = index
+
+    @property
+    def _argd(self):
+        return Nutrient.nutrient_argds[Nutrient_Vector.fdc_codes[self.index]]
+
+    name = property(lambda self: self._argd["name"])
+    units = property(lambda self: self._argd["units"])
+    fdc_code = property(lambda self: self._argd["fdc_code"])
+    symbol = property(lambda self: self._argd["symbol"])
+
+    @property
+    def amount(self):
+        return self.vector.amounts[self.index]
+
+    @amount.setter
+    def amount(self, amount):
+        self.vector.amounts[self.index] = amount
+
+
+# The amounts of all 26 tracked nutrients in a food, ingredient or recipe,
+# stored as one array of doubles in the order of Nutrient.nutrient_argds.
+class Nutrient_Vector:
+    __slots__ = 'amounts',
+
+    fdc_codes = tuple(Nutrient.nutrient_argds)
+    symbols = tuple(nutrient_argd["symbol"] for nutrient_argd in Nutrient.nutrient_argds.values())
+    symbol_indexes = {symbol: index for index, symbol in enumerate(symbols)}
+
+    def __init__(self, amounts=None):
+        if amounts is None:
+            self.amounts = array.array('d', bytes(8 * len(self.symbols)))
+        else:
+            self.amounts = array.array('d', amounts)
+
+    @classmethod
+    def from_dict(self, symbols_to_amounts):
+        return self((symbols_to_amounts.get(symbol) or 0) for symbol in self.symbols)
+
+    def to_dict(self):
+        return dict(zip(self.symbols, self.amounts))
+
+    def __getitem__(self, symbol):
+        return self.amounts[self.symbol_indexes[symbol]]
+
+    def __setitem__(self, symbol, amount):
+        self.amounts[self.symbol_indexes[symbol]] = amount
+
+    def __add__(self, other):
+        return Nutrient_Vector(map(operator.add, self.amounts, other.amounts))
+
+    def __iadd__(self, other):
+        for index, amount in enumerate(other.amounts):
+            self.amounts[index] += amount
+        return self
+
+    def __mul__(self, factor):
+        return Nutrient_Vector(amount * factor for amount in self.amounts)
+
+    def nutrient(self, symbol):
+        return Nutrient_View(self, self.symbol_indexes[symbol])
+
+
+# Exposes one entry in a Food_Detailed's nutrient vector as an attribute named
+# for its symbol. Assigning a Nutrient or a number sets the amount.
+class Nutrient_Property:
+    __slots__ = 'symbol',
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def __get__(self, instance, instancetype=None):
+        if instance is None:
+            return self
+        return instance.nutrients.nutrient(self.symbol)
+
+    def __set__(self, instance, value):
+        instance.nutrients[self.symbol] = value.amount if isinstance(value, Nutrient) else value
+
+
 class Abstract_Food(metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
@@ -385,12 +1110,13 @@ class Abstract_Food(metaclass=abc.ABCMeta):
 
 
 class Food_Stub(Abstract_Food):
-    __slots__ = ('fdc_id', 'food_name', 'calories', 'in_db_already')
+    __slots__ = ('fdc_id', 'food_name', 'calories', 'in_db_already', 'food_detailed')
 
     def __init__(self, fdc_id, food_name):
         self.fdc_id = fdc_id
         self.food_name = title_case(food_name.lower())
         self.in_db_already = False
+        self.food_detailed = None
 
     @classmethod
     def from_fdc_json_obj(self, food_json_obj):
@@ -406,19 +1132,61 @@ class Food_Stub(Abstract_Food):
             food_obj.calories = None
         return food_obj
 
+    @classmethod
+    def from_nt_json_obj(self, food_json_obj):
+        food_obj = Food_Stub(food_json_obj['fdc_id'], food_json_obj['food_name'])
+        food_obj.calories = food_json_obj['calories']
+        return food_obj
+
     def serialize(self):
         return {'fdc_id': self.fdc_id, 'food_name': self.food_name, 'calories': self.calories}
 
 
+# A food as a row in a list of local foods, with only the fields the listing
+# templates show. It's built from a model object fetched with
+# only(*Food_Row.fields), so the rest of the document is never transferred,
+# and it doesn't allocate nutrients as Food_Detailed does. Foods store their
+# title cased name as display_name, so it doesn't run title_case() either;
+# foods stored before that fall back on food_name, which was title cased
+# before it was stored.
+class Food_Row:
+    __slots__ = 'mongodb_id', 'fdc_id', 'food_name', 'serving_size', 'serving_units', 'calories'
+
+    fields = ('_id', 'fdc_id', 'food_name', 'display_name', 'serving_size', 'serving_units', 'energy_kcal')
+
+    def __init__(self, mongodb_id, fdc_id, food_name, serving_size, serving_units, calories):
+        self.mongodb_id = mongodb_id
+        self.fdc_id = fdc_id
+        self.food_name = food_name
+        self.serving_size = serving_size
+        self.serving_units = serving_units
+        self.calories = calories
+
+    @classmethod
+    def from_model_obj(self, food_model_obj):
+        return self(food_model_obj._id, food_model_obj.fdc_id, food_model_obj.display_name or food_model_obj.food_name,
+                    food_model_obj.serving_size, food_model_obj.serving_units, food_model_obj.energy_kcal)
+
+
 class Ingredient_Detailed:
-    __slots__ = 'servings_number', 'food'
+    __slots__ = 'servings_number', 'food', 'food_changed'
 
-    def __init__(self, servings_number, food):
+    # food_changed is True for a reference ingredient whose food no longer
+    # matches the hash it was stored with.
+    def __init__(self, servings_number, food, food_changed=False):
         self.servings_number = servings_number
+        self.food_changed = food_changed
+        if isinstance(food, Food_Detailed):
+            self.food = food
+            return
         if hasattr(food, 'serialize'):
             food = food.serialize()
         self.food = Food_Detailed.from_nt_json_obj(food)
 
+    @property
+    def nutrients(self):
+        return self.food.nutrients * self.servings_number
+
     @classmethod
     def from_json_obj(self, ingredient_json_obj):
         return self(servings_number=ingredient_json_obj["servings_number"], food=ingredient_json_obj["food"])
@@ -427,21 +1195,30 @@ class Ingredient_Detailed:
     def from_model_obj(self, ingredient_model_obj):
         return self(servings_number=ingredient_model_obj.servings_number, food=ingredient_model_obj.food.serialize())
 
+    # A reference ingredient's food is taken from food_docs, a dict of food
+    # documents by fdc_id.
+    @classmethod
+    def from_mongo_doc(self, ingredient_doc, food_docs=None):
+        if ingredient_doc.get("food"):
+            return self(ingredient_doc["servings_number"], Food_Detailed.from_mongo_doc(ingredient_doc["food"]))
+        food_doc = (food_docs or {}).get(ingredient_doc["fdc_id"])
+        if food_doc is None:
+            raise ValueError(f"no food with FDC ID {ingredient_doc['fdc_id']} to resolve ingredient with")
+        food_changed = bool(ingredient_doc.get("food_hash")) and ingredient_doc["food_hash"] != food_content_hash(food_doc)
+        return self(ingredient_doc["servings_number"], Food_Detailed.from_mongo_doc(food_doc), food_changed)
+
 
 class Food_Detailed(Abstract_Food):
-    __slots__ = ('fdc_id', 'food_name', 'serving_size', 'serving_units', 'in_db_already', 'biotin_B7_mcg', 'calcium_mg',
-                 'cholesterol_mg', 'copper_mg', 'dietary_fiber_g', 'energy_kcal', 'folate_B9_mcg', 'iodine_mcg',
-                 'iron_mg', 'magnesium_mg', 'niacin_B3_mg', 'pantothenic_acid_B5_mg', 'phosphorous_mg', 'potassium_mg',
-                 'protein_g', 'riboflavin_B2_mg', 'saturated_fat_g', 'sodium_mg', 'sugars_g', 'thiamin_B1_mg',
-                 'total_carbohydrates_g', 'total_fat_g', 'trans_fat_g', 'vitamin_D_mcg', 'vitamin_E_mg', 'zinc_mg')
+    __slots__ = ('fdc_id', 'food_name', 'serving_size', 'serving_units', 'in_db_already', 'nutrients')
 
-    def __init__(self, fdc_id, food_name, serving_size, serving_units):
+    # A display_name is a food_name that's already title cased, such as one
+    # read back from the foods collection.
+    def __init__(self, fdc_id, food_name, serving_size, serving_units, display_name=None):
         self.fdc_id = fdc_id
-        self.food_name = title_case(food_name.lower())
+        self.food_name = display_name if display_name else title_case(food_name.lower())
         self.serving_size = serving_size
         self.serving_units = serving_units
-        for nutrient_argd in Nutrient.nutrient_argds.values():
-            setattr(self, nutrient_argd['symbol'], None)
+        self.nutrients = Nutrient_Vector()
         self.in_db_already = False
 
     @classmethod
@@ -453,11 +1230,14 @@ class Food_Detailed(Abstract_Food):
                 continue
             elif "amount" not in nutrient_json_obj:
                 continue
-            nutrient_table[fdc_code] = Nutrient(nutrient_json_obj["nutrient"]["name"],
-                                                nutrient_json_obj["nutrient"]["unitName"].lower(),
-                                                fdc_code=fdc_code,
-                                                amount=float(nutrient_json_obj["amount"]),
-                                                symbol=Nutrient.nutrient_argds[fdc_code]["symbol"])
+            amount = float(nutrient_json_obj["amount"])
+            if fdc_code == 324 and nutrient_json_obj["nutrient"]["unitName"].upper() == 'IU':
+                # The FDC uses IU for vitamin D, but this program stores vitamin
+                # D amounts in micrograms. Converting from IU to mg/mcg is
+                # different for every substance that IU are used with. For
+                # vitamin D, 40 IU == 1 mcg.
+                amount /= 40
+            nutrient_table[Nutrient.nutrient_argds[fdc_code]["symbol"]] = amount
         return nutrient_table
 
     @classmethod
@@ -466,14 +1246,19 @@ class Food_Detailed(Abstract_Food):
         food_name = food_model_obj.food_name
         serving_size = food_model_obj.serving_size
         serving_units = food_model_obj.serving_units
-        food_obj = self(fdc_id, food_name, serving_size, serving_units)
-        for fdc_id, nutrient_argd in Nutrient.nutrient_argds.items():
-            nutrient_in_food = Nutrient(**nutrient_argd)
-            if hasattr(food_model_obj, nutrient_in_food.symbol):
-                nutrient_in_food.amount = getattr(food_model_obj, nutrient_in_food.symbol)
-            else:
-                nutrient_in_food.amount = 0
-            setattr(food_obj, nutrient_in_food.symbol, nutrient_in_food)
+        display_name = getattr(food_model_obj, 'display_name', None)
+        food_obj = self(fdc_id, food_name, serving_size, serving_units, display_name)
+        food_obj.nutrients = Nutrient_Vector(getattr(food_model_obj, symbol, 0) or 0 for symbol in Nutrient_Vector.symbols)
+        return food_obj
+
+    # Reads a food document, from the foods collection or embedded in a recipe
+    # ingredient, where nutrient amounts are plain numbers, into the nutrient
+    # vector in one pass.
+    @classmethod
+    def from_mongo_doc(self, food_doc):
+        food_obj = self(food_doc.get("fdc_id", 0), food_doc["food_name"], food_doc.get("serving_size", 1),
+                        food_doc.get("serving_units", ""), food_doc.get("display_name"))
+        food_obj.nutrients = Nutrient_Vector.from_dict(food_doc)
         return food_obj
 
     @classmethod
@@ -501,22 +1286,7 @@ class Food_Detailed(Abstract_Food):
         else:
             raise Exception(f'while processing a food JSON object, unsupported value for property \'dataType\': {food_json_obj["dataType"]}')
         food_obj = self(fdc_id, food_name, serving_size, serving_units)
-        nutrient_table = self._food_json_obj_to_nutrient_table(food_json_obj)
-        for fdc_code, nutrient_argd in Nutrient.nutrient_argds.items():
-            if fdc_code in nutrient_table:
-                nutrient_in_food = nutrient_table[fdc_code]
-                if nutrient_in_food.symbol == "vitamin_D_mcg" and nutrient_in_food.units.upper() == 'IU':
-                    # The FDC uses IU for vitamin D, but this program stores vitamin
-                    # D amounts in micrograms. Converting from IU to mg/mcg is
-                    # different for every substance that IU are used with. For
-                    # vitamin D, 40 IU == 1 mcg.
-                    nutrient_in_food.amount /= 40
-                    nutrient_in_food.units = 'mcg'
-                setattr(food_obj, nutrient_argd["symbol"], nutrient_in_food)
-            else:
-                nutrient_in_food = Nutrient(**nutrient_argd)
-                nutrient_in_food.amount = 0
-                setattr(food_obj, nutrient_in_food.symbol, nutrient_in_food)
+        food_obj.nutrients = Nutrient_Vector.from_dict(self._food_json_obj_to_nutrient_table(food_json_obj))
         return food_obj
 
     def to_nt_json_code(self):
@@ -524,44 +1294,348 @@ class Food_Detailed(Abstract_Food):
 
     @classmethod
     def from_nt_json_obj(self, json_content):
-        const_args = {'fdc_id', 'food_name', 'serving_size', 'serving_units'}
+        const_args = {'fdc_id', 'food_name', 'serving_size', 'serving_units', 'display_name'}
         const_argd = {key: value for key, value in filter(lambda pair: pair[0] in const_args, json_content.items())}
         food_obj = self(**const_argd)
         for key, value in json_content.items():
-            if key in const_args or key == '_id':
+            if key not in Nutrient_Vector.symbol_indexes:
                 continue
-            if isinstance(value, dict):
-                nutrient_argd = value.copy()
-                if 'dv_perc' in nutrient_argd:
-                    del nutrient_argd['dv_perc']
-                nutrient_in_food = Nutrient(**nutrient_argd)
-            else:
-                nutrient_in_food = Nutrient(**Nutrient.nutrient_argds[Nutrient.nutrient_symbols_to_numbers[key]])
-                nutrient_in_food.amount = value
-            setattr(food_obj, key, nutrient_in_food)
+            food_obj.nutrients[key] = value["amount"] if isinstance(value, dict) else value
         return food_obj
 
     def serialize(self):
         serialized = dict()
-        for attr_name in self.__slots__:
+        for attr_name in ('fdc_id', 'food_name', 'serving_size', 'serving_units', 'in_db_already'):
             attr_val = getattr(self, attr_name)
             if attr_val == 0 or attr_val is None:
                 continue
-            if hasattr(attr_val, 'serialize'):
-                serialized[attr_name] = attr_val.serialize()
-            else:
-                serialized[attr_name] = attr_val
+            serialized[attr_name] = attr_val
+        for symbol in Nutrient_Vector.symbols:
+            serialized[symbol] = self.nutrients.nutrient(symbol).serialize()
         return serialized
 
     def to_model_cls_args(self):
-        return {property_key: (property_val["amount"] if isinstance(property_val, dict) else property_val)
-                for property_key, property_val in self.serialize().items()}
+        model_cls_args = {property_key: (property_val["amount"] if isinstance(property_val, dict) else property_val)
+                          for property_key, property_val in self.serialize().items()}
+        model_cls_args['display_name'] = self.food_name
+        return model_cls_args
+
+    biotin_B7_mcg          = Nutrient_Property('biotin_B7_mcg')
+    calcium_mg             = Nutrient_Property('calcium_mg')
+    cholesterol_mg         = Nutrient_Property('cholesterol_mg')
+    copper_mg              = Nutrient_Property('copper_mg')
+    dietary_fiber_g        = Nutrient_Property('dietary_fiber_g')
+    energy_kcal            = Nutrient_Property('energy_kcal')
+    folate_B9_mcg          = Nutrient_Property('folate_B9_mcg')
+    iodine_mcg             = Nutrient_Property('iodine_mcg')
+    iron_mg                = Nutrient_Property('iron_mg')
+    magnesium_mg           = Nutrient_Property('magnesium_mg')
+    niacin_B3_mg           = Nutrient_Property('niacin_B3_mg')
+    pantothenic_acid_B5_mg = Nutrient_Property('pantothenic_acid_B5_mg')
+    phosphorous_mg         = Nutrient_Property('phosphorous_mg')
+    potassium_mg           = Nutrient_Property('potassium_mg')
+    protein_g              = Nutrient_Property('protein_g')
+    riboflavin_B2_mg       = Nutrient_Property('riboflavin_B2_mg')
+    saturated_fat_g        = Nutrient_Property('saturated_fat_g')
+    sodium_mg              = Nutrient_Property('sodium_mg')
+    sugars_g               = Nutrient_Property('sugars_g')
+    thiamin_B1_mg          = Nutrient_Property('thiamin_B1_mg')
+    total_carbohydrates_g  = Nutrient_Property('total_carbohydrates_g')
+    total_fat_g            = Nutrient_Property('total_fat_g')
+    trans_fat_g            = Nutrient_Property('trans_fat_g')
+    vitamin_D_mcg          = Nutrient_Property('vitamin_D_mcg')
+    vitamin_E_mg           = Nutrient_Property('vitamin_E_mg')
+    zinc_mg                = Nutrient_Property('zinc_mg')
+
+
+# A cache of FDC API response bodies: an in-memory LRU dict in front of an
+# optional backing store shared between processes. Entries expire after the
+# TTL for their endpoint, so foods edited at the FDC are picked up eventually.
+class Fdc_Response_Cache:
+    __slots__ = 'max_entries', 'ttls', 'backing_store', 'entries', 'lock', 'counters'
+
+    default_ttls = {'lookup': 7 * 24 * 60 * 60, 'search': 24 * 60 * 60}
+
+    def __init__(self, max_entries=1000, ttls=None, backing_store=None):
+        self.max_entries = max_entries
+        self.ttls = {**self.default_ttls, **(ttls or {})}
+        self.backing_store = backing_store
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'store_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    # Keys are strings, so they can serve as _ids in the backing store.
+    # Queries are normalized so differences in case and spacing don't miss.
+    @staticmethod
+    def lookup_key(fdc_id):
+        return f"lookup:{int(fdc_id)}"
+
+    @staticmethod
+    def search_key(query, page_size, page_number, data_types):
+        return "search:" + json.dumps([' '.join(query.lower().split()), page_size, page_number, sorted(data_types)])
+
+    # Returns a (found, value) tuple, since None is a cacheable value.
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                expires_at, value = self.entries[key]
+                if expires_at > time.time():
+                    self.entries.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return True, value
+                del self.entries[key]
+                self.counters['expirations'] += 1
+        if self.backing_store is not None:
+            stored_entry = self.backing_store.get(key)
+            if stored_entry is not None:
+                expires_at, value = stored_entry
+                self._store_in_memory(key, value, expires_at)
+                with self.lock:
+                    self.counters['store_hits'] += 1
+                return True, value
+        with self.lock:
+            self.counters['misses'] += 1
+        return False, None
+
+    def set(self, endpoint, key, value):
+        expires_at = time.time() + self.ttls[endpoint]
+        self._store_in_memory(key, value, expires_at)
+        if self.backing_store is not None:
+            self.backing_store.set(key, value, expires_at)
+
+    def _store_in_memory(self, key, value, expires_at):
+        with self.lock:
+            self.entries[key] = expires_at, value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if self.backing_store is not None:
+            self.backing_store.clear()
+
+    def statistics(self):
+        with self.lock:
+            return {'entries': len(self.entries), **self.counters}
+
+
+# A backing store for Fdc_Response_Cache in a MongoDB collection, accessed
+# through a model with a DjongoManager whose documents have a string _id, a
+# response value and an expires_at datetime. A TTL index on expires_at lets
+# the server delete expired documents; it only does so once a minute, so
+# expiry is checked on read too.
+class Mongo_Response_Store:
+    __slots__ = 'model_cls',
+
+    def __init__(self, model_cls):
+        self.model_cls = model_cls
+
+    def get(self, key):
+        response_doc = self.model_cls.objects.mongo_find_one({'_id': key})
+        if response_doc is None:
+            return None
+        expires_at = response_doc['expires_at'].replace(tzinfo=datetime.timezone.utc).timestamp()
+        if expires_at <= time.time():
+            return None
+        return expires_at, response_doc['response']
+
+    def set(self, key, value, expires_at):
+        expires_at = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc).replace(tzinfo=None)
+        self.model_cls.objects.mongo_replace_one({'_id': key}, {'response': value, 'expires_at': expires_at},
+                                                 upsert=True)
+
+    def clear(self):
+        self.model_cls.objects.mongo_delete_many({})
+
+
+# Counts of the documents matching a query, for paginating its results, so
+# paging through them doesn't recount on every page. Counts are cached per
+# collection and normalized filter, and are good until the collection's
+# generation number changes; every write to a collection is followed by
+# invalidate(), which bumps it. With a generation store the numbers are kept
+# in MongoDB, so writes by other processes, such as the import commands, are
+# seen too; without one only this process's writes are.
+class Result_Count_Cache:
+    __slots__ = 'max_entries', 'generation_store', 'entries', 'generations', 'lock', 'counters'
+
+    def __init__(self, max_entries=1000, generation_store=None):
+        self.max_entries = max_entries
+        self.generation_store = generation_store
+        self.entries = collections.OrderedDict()
+        self.generations = collections.Counter()
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def filter_key(filter_doc):
+        return json.dumps(filter_doc, sort_keys=True, default=str)
+
+    def _generation(self, collection_name):
+        if self.generation_store is not None:
+            return self.generation_store.get(collection_name)
+        with self.lock:
+            return self.generations[collection_name]
+
+    # Takes a model with a DjongoManager and a pymongo filter. With no filter,
+    # the count is the collection's estimated count, which the server reads
+    # from its metadata rather than counting anything.
+    def count(self, model_cls, filter_doc=None):
+        collection_name = model_cls._meta.db_table
+        key = collection_name, self.filter_key(filter_doc or {})
+        generation = self._generation(collection_name)
+        with self.lock:
+            if key in self.entries and self.entries[key][0] == generation:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return self.entries[key][1]
+        if filter_doc:
+            count = model_cls.objects.mongo_count_documents(filter_doc)
+        else:
+            count = model_cls.objects.mongo_estimated_document_count()
+        with self.lock:
+            self.counters['misses'] += 1
+            self.entries[key] = generation, count
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+        return count
+
+    # Returns the collection's new generation.
+    def invalidate(self, model_cls):
+        collection_name = model_cls._meta.db_table
+        with self.lock:
+            self.generations[collection_name] += 1
+            generation = self.generations[collection_name]
+        if self.generation_store is not None:
+            generation = self.generation_store.increment(collection_name)
+        return generation
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def statistics(self):
+        with self.lock:
+            return {'entries': len(self.entries), **self.counters}
+
+
+# A generation store for Result_Count_Cache in a MongoDB collection, accessed
+# through a model with a DjongoManager whose documents have the collection
+# name as their _id and an integer generation. Reading one is a lookup by _id.
+class Mongo_Generation_Store:
+    __slots__ = 'model_cls',
+
+    def __init__(self, model_cls):
+        self.model_cls = model_cls
+
+    def get(self, collection_name):
+        generation_doc = self.model_cls.objects.mongo_find_one({'_id': collection_name})
+        return generation_doc['generation'] if generation_doc is not None else 0
+
+    def increment(self, collection_name):
+        generation_doc = self.model_cls.objects.mongo_find_one_and_update(
+            {'_id': collection_name}, {'$inc': {'generation': 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+        return generation_doc['generation']
+
+
+# Holds the objects looked up by some key during one request, so each is
+# fetched at most once however many times it's asked for, and the ones asked
+# for together are fetched together, in a single __in query. Keys missing
+# from the collection are remembered as None. Every key asked for would
+# otherwise have been a query of its own, so the number of queries saved is
+# the number of keys asked for less the number of queries made. Takes a model
+# with a DjongoManager and holds its model objects.
+class Identity_Map:
+    __slots__ = 'model_cls', 'key_field', 'objs', 'counters'
+
+    def __init__(self, model_cls, key_field='_id'):
+        self.model_cls = model_cls
+        self.key_field = key_field
+        self.objs = dict()
+        self.counters = {'queries': 0, 'hits': 0, 'misses': 0}
+
+    def _fetch(self, keys):
+        return self.model_cls.objects.filter(**{f"{self.key_field}__in": keys})
+
+    def _key(self, obj):
+        return getattr(obj, self.key_field)
+
+    # Returns a dict of objects by key, fetching all the ones not already held
+    # in one query.
+    def get_many(self, keys):
+        keys = set(keys)
+        missing_keys = [key for key in keys if key not in self.objs]
+        if missing_keys:
+            self.counters['queries'] += 1
+            for obj in self._fetch(missing_keys):
+                self.objs[self._key(obj)] = obj
+            for key in missing_keys:
+                self.objs.setdefault(key, None)
+        self.counters['hits'] += len(keys) - len(missing_keys)
+        self.counters['misses'] += len(missing_keys)
+        return {key: self.objs[key] for key in keys}
+
+    def get(self, key):
+        return self.get_many((key,))[key]
+
+    # For an object fetched some other way, or saved, so later lookups of it
+    # get it rather than fetching it again.
+    def prime(self, obj):
+        self.objs[self._key(obj)] = obj
+
+    def discard(self, key):
+        self.objs.pop(key, None)
+
+    def statistics(self):
+        return {'held': len(self.objs), **self.counters,
+                'saved': self.counters['hits'] + self.counters['misses'] - self.counters['queries']}
+
+
+# An identity map of food documents by fdc_id, as pymongo returns them, for
+# hydrating reference ingredients (see food_content_hash()) without model
+# objects. The $gt matches the fdc_id index's partial filter, which MongoDB
+# requires to use it; see foods.models.fdc_ids_in_db().
+class Food_Identity_Map(Identity_Map):
+    __slots__ = ()
+
+    def __init__(self, model_cls):
+        super().__init__(model_cls, 'fdc_id')
+
+    def _fetch(self, fdc_ids):
+        return self.model_cls.objects.mongo_find({'fdc_id': {'$in': fdc_ids, '$gt': 0}})
+
+    def _key(self, food_doc):
+        return food_doc['fdc_id']
+
+
+# A request's identity maps, by name, as attributes; see
+# nutritracker.middleware.
+class Request_Loader:
+    __slots__ = 'identity_maps',
+
+    def __init__(self, **identity_maps):
+        self.identity_maps = identity_maps
+
+    def __getattr__(self, name):
+        try:
+            return self.identity_maps[name]
+        except KeyError:
+            raise AttributeError(f"'{self.__class__.__name__}' object has no identity map '{name}'") from None
+
+    def statistics(self):
+        statistics = {name: identity_map.statistics() for name, identity_map in self.identity_maps.items()}
+        statistics['saved'] = sum(map_statistics['saved'] for map_statistics in statistics.values())
+        return statistics
 
 
 class Fdc_Api_Contacter:
-    __slots__ = 'api_key',
+    __slots__ = 'api_key', 'api_url', 'use_cache'
 
-    api_url = "https://api.nal.usda.gov/fdc/v1"
+    default_api_url = "https://api.nal.usda.gov/fdc/v1"
 
     get_fdc_lookup_url = lambda self, fdc_id: f"{self.api_url}/food/{fdc_id}?api_key={self.api_key}"
 
@@ -569,65 +1643,311 @@ class Fdc_Api_Contacter:
 
     get_food_list_url = lambda self: f"{self.api_url}/foods/list?api_key={self.api_key}"
 
-    def __init__(self, api_key):
+    get_fdc_foods_url = lambda self: f"{self.api_url}/foods?api_key={self.api_key}"
+
+    # The most fdcIds the FDC accepts in one /foods request.
+    fdc_ids_per_request = 20
+
+    # Views instance a contacter per request, so the HTTP session lives on the
+    # class, where every contacter in the process shares its pool of
+    # keep-alive connections instead of paying for a new TCP and TLS handshake
+    # per call. It's created on first use from these settings; call
+    # configure() to change them.
+    session_settings = {'pool_size': 10, 'timeout': (5, 30), 'retries': 3, 'backoff_factor': 0.5}
+    session = None
+    session_lock = threading.Lock()
+    session_counters = {'requests': 0, 'retries': 0}
+
+    # Like the session, the response cache is shared by every contacter. It's
+    # memory-only until a backing store is configured. Contacters instanced
+    # with use_cache=False neither read from it nor write to it.
+    response_cache = Fdc_Response_Cache()
+
+    search_data_types = ("Branded", "SR Legacy")
+
+    def __init__(self, api_key, api_url=None, use_cache=True):
         self.api_key = api_key
+        self.api_url = api_url if api_url is not None else self.default_api_url
+        self.use_cache = use_cache
 
-    def _keyword_search(self, query, page_size=None, page_number=None):
+    @classmethod
+    def configure(self, **session_settings):
+        unknown_settings = set(session_settings) - set(self.session_settings)
+        if unknown_settings:
+            raise ValueError(f"unknown session settings: {', '.join(sorted(unknown_settings))}")
+        with self.session_lock:
+            self.session_settings = {**self.session_settings, **session_settings}
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    @classmethod
+    def get_session(self):
+        with self.session_lock:
+            if self.session is None:
+                # The FDC's POST endpoints only read, so they're as safe to
+                # retry as GETs. 429 responses' Retry-After headers are
+                # honored.
+                retry = Retry(total=self.session_settings['retries'],
+                              backoff_factor=self.session_settings['backoff_factor'],
+                              status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(('GET', 'POST')),
+                              raise_on_status=False)
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.session_settings['pool_size'],
+                                                        pool_maxsize=self.session_settings['pool_size'],
+                                                        max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.session = session
+            return self.session
+
+    # Counts of requests made and retries needed through the shared session,
+    # plus the state of its connection pools, for monitoring.
+    @classmethod
+    def pool_statistics(self):
+        statistics = {'pools': 0, 'connections_opened': 0, 'idle_connections': 0, 'pool_requests': 0}
+        with self.session_lock:
+            statistics.update(self.session_counters)
+            if self.session is None:
+                return statistics
+            for adapter in set(self.session.adapters.values()):
+                for pool_key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools[pool_key]
+                    statistics['pools'] += 1
+                    statistics['connections_opened'] += pool.num_connections
+                    statistics['pool_requests'] += pool.num_requests
+                    statistics['idle_connections'] += sum(conn is not None for conn in list(pool.pool.queue))
+        return statistics
+
+    def _request(self, method, url, **kwargs):
+        response = self.get_session().request(method, url, timeout=self.session_settings['timeout'], **kwargs)
+        retries = response.raw.retries
+        with self.session_lock:
+            self.session_counters['requests'] += 1
+            self.session_counters['retries'] += len(retries.history) if retries is not None else 0
+        return response
+
+    # Requests are made with stream=True and their bodies parsed with
+    # iterate_json_array(), so foods are built as they arrive and at most one
+    # food's JSON is held in memory at a time.
+    def _iterate_response_array(self, response, array_key=None, other_values=None):
+        response.raw.decode_content = True
+        try:
+            yield from iterate_json_array(io.TextIOWrapper(response.raw, encoding=response.encoding or 'utf-8'),
+                                          array_key, other_values)
+        finally:
+            # Whatever follows the array has to be read off the connection
+            # before it can go back into the pool for reuse.
+            response.raw.drain_conn()
+            response.close()
+
+    def _keyword_search(self, query, page_size=None, page_number=None, other_values=None):
         search_url = self.get_fdc_search_url()
-        json_argd = {'dataType': ["Branded", "SR Legacy"], 'query': query}
+        json_argd = {'dataType': list(self.search_data_types), 'query': query}
         if page_size is not None:
             json_argd['pageSize'] = page_size
         if page_number is not None:
             json_argd['pageNumber'] = page_number
-        response = requests.post(search_url, json=json_argd)
-        return json.loads(response.content)
+        response = self._request('POST', search_url, json=json_argd, stream=True)
+        return self._iterate_response_array(response, 'foods', other_values)
 
-    def search_by_keywords(self, query, page_size=25, page_number=1):
-        json_content = self._keyword_search(query, page_size, page_number)
-        results_list = list()
-        for result_obj in json_content['foods']:
-            results_list.append(Food_Stub.from_fdc_json_obj(result_obj))
-        return results_list
+    def iterate_search_results(self, query, page_size=25, page_number=1, other_values=None):
+        for result_obj in self._keyword_search(query, page_size, page_number, other_values):
+            yield Food_Stub.from_fdc_json_obj(result_obj)
 
-    def number_of_search_results(self, query):
-        return len(self._keyword_search(query)['foods'])
+    def search_by_keywords(self, query, page_size=25, page_number=1):
+        return self.search_with_total(query, page_size, page_number)[0]
+
+    # Returns a page of results along with the total number of matches, which
+    # the FDC reports as totalHits ahead of the foods array, so one request
+    # gets both.
+    def search_with_total(self, query, page_size=25, page_number=1):
+        cache_key = Fdc_Response_Cache.search_key(query, page_size, page_number, self.search_data_types)
+        if self.use_cache:
+            found, search_json_obj = self.response_cache.get(cache_key)
+            if found:
+                return ([Food_Stub.from_nt_json_obj(food_json_obj) for food_json_obj in search_json_obj['foods']],
+                        search_json_obj['totalHits'])
+        other_values = dict()
+        food_stubs = list(self.iterate_search_results(query, page_size, page_number, other_values))
+        total_hits = other_values.get('totalHits', len(food_stubs))
+        if self.use_cache:
+            # The stubs are cached rather than the FDC's foods, which carry
+            # every nutrient and are many times the size.
+            self.response_cache.set('search', cache_key, {'foods': [food_stub.serialize() for food_stub in food_stubs],
+                                                          'totalHits': total_hits})
+        return food_stubs, total_hits
 
     def look_up_fdc_id(self, fdc_id):
-        lookup_url = self.get_fdc_lookup_url(fdc_id)
-        response = requests.get(lookup_url)
-        if response.status_code == 404:
+        return self._json_content_to_food_obj(self._look_up_fdc_id_json(fdc_id))
+
+    # Returns a dict from each of fdc_ids to what look_up_fdc_id() would
+    # return for it: its Food_Detailed, or None if the FDC has no such food, or
+    # False if it isn't usable. Uncached ids are requested from the /foods
+    # endpoint fdc_ids_per_request at a time rather than one per request.
+    def look_up_fdc_ids(self, fdc_ids):
+        fdc_ids = list(dict.fromkeys(map(int, fdc_ids)))
+        json_contents = dict()
+        uncached_fdc_ids = list()
+        for fdc_id in fdc_ids:
+            if self.use_cache:
+                found, json_content = self.response_cache.get(Fdc_Response_Cache.lookup_key(fdc_id))
+                if found:
+                    json_contents[fdc_id] = json_content
+                    continue
+            uncached_fdc_ids.append(fdc_id)
+        for index in range(0, len(uncached_fdc_ids), self.fdc_ids_per_request):
+            fdc_ids_chunk = uncached_fdc_ids[index:index + self.fdc_ids_per_request]
+            response = self._request('POST', self.get_fdc_foods_url(), json={'fdcIds': fdc_ids_chunk, 'format': 'full'},
+                                     stream=True)
+            if not response.ok:
+                response.close()
+                response.raise_for_status()
+            # Ids the FDC has no food for are left out of the response.
+            chunk_json_contents = {json_content['fdcId']: json_content
+                                   for json_content in self._iterate_response_array(response)}
+            for fdc_id in fdc_ids_chunk:
+                json_contents[fdc_id] = chunk_json_contents.get(fdc_id)
+                if self.use_cache:
+                    self.response_cache.set('lookup', Fdc_Response_Cache.lookup_key(fdc_id), json_contents[fdc_id])
+        return {fdc_id: self._json_content_to_food_obj(json_contents[fdc_id]) for fdc_id in fdc_ids}
+
+    @staticmethod
+    def _json_content_to_food_obj(json_content):
+        if json_content is None:
             return None
-        json_content = json.loads(response.content)
         if not Food_Detailed.is_usable_json_object(json_content):
             return False
         return Food_Detailed.from_fdc_json_obj(json_content)
 
-    def retrieve_foods_list(self, food_list_page=1):
+    # Not-found responses are cached too, as None.
+    def _look_up_fdc_id_json(self, fdc_id):
+        cache_key = Fdc_Response_Cache.lookup_key(fdc_id)
+        if self.use_cache:
+            found, json_content = self.response_cache.get(cache_key)
+            if found:
+                return json_content
+        lookup_url = self.get_fdc_lookup_url(fdc_id)
+        response = self._request('GET', lookup_url)
+        json_content = None if response.status_code == 404 else json.loads(response.content)
+        if self.use_cache and response.status_code in (200, 404):
+            self.response_cache.set('lookup', cache_key, json_content)
+        return json_content
+
+    def iterate_foods_list(self, food_list_page=1):
         food_list_url = self.get_food_list_url()
         json_argd = dict(dataType=["Branded", "SR Legacy"])
         if food_list_page:
             json_argd["pageNumber"] = food_list_page
-        response = requests.post(food_list_url, json=json_argd)
-        results_list = list()
-        for response_obj in json.loads(response.content):
-            food_stub_obj = Food_Stub.from_fdc_json_obj(response_obj)
-            results_list.append(food_stub_obj.serialize())
-        return results_list
-
+        response = self._request('POST', food_list_url, json=json_argd, stream=True)
+        for response_obj in self._iterate_response_array(response):
+            yield Food_Stub.from_fdc_json_obj(response_obj)
 
-def generate_pagination_links(url_base, results_count, page_size, current_page, search_query=None):
+    def retrieve_foods_list(self, food_list_page=1):
+        return [food_stub_obj.serialize() for food_stub_obj in self.iterate_foods_list(food_list_page)]
+
+
+# An asyncio counterpart to Fdc_Api_Contacter, for async views. There's no
+# async HTTP client among the project's dependencies, so each call runs a
+# Fdc_Api_Contacter method in a worker thread, which keeps the shared session's
+# connection pool, retries and response cache. A semaphore bounds how many
+# calls are in flight at once, by default to the pool size, so concurrent calls
+# don't open connections the pool can't keep.
+class Async_Fdc_Api_Contacter:
+    __slots__ = 'api_contacter', 'semaphore', 'call_timeout'
+
+    def __init__(self, api_key, api_url=None, use_cache=True, max_concurrency=None, call_timeout=60):
+        self.api_contacter = Fdc_Api_Contacter(api_key, api_url, use_cache)
+        if max_concurrency is None:
+            max_concurrency = Fdc_Api_Contacter.session_settings['pool_size']
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.call_timeout = call_timeout
+
+    # The timeout covers the whole call, retries included. A call that times
+    # out raises asyncio.TimeoutError, though its thread runs on until the
+    # session's own timeouts end it.
+    async def _call(self, method, *args):
+        async with self.semaphore:
+            return await asyncio.wait_for(asyncio.to_thread(method, *args), self.call_timeout)
+
+    async def search_with_total(self, query, page_size=25, page_number=1):
+        return await self._call(self.api_contacter.search_with_total, query, page_size, page_number)
+
+    async def look_up_fdc_id(self, fdc_id):
+        return await self._call(self.api_contacter.look_up_fdc_id, fdc_id)
+
+    # Splits fdc_ids into as many /foods requests as the FDC's per-request
+    # limit calls for, and makes them concurrently.
+    async def look_up_fdc_ids(self, fdc_ids):
+        fdc_ids = list(dict.fromkeys(map(int, fdc_ids)))
+        chunk_size = Fdc_Api_Contacter.fdc_ids_per_request
+        chunk_results = await asyncio.gather(*(self._call(self.api_contacter.look_up_fdc_ids,
+                                                          fdc_ids[index:index + chunk_size])
+                                               for index in range(0, len(fdc_ids), chunk_size)))
+        return {fdc_id: food_obj for chunk_result in chunk_results for fdc_id, food_obj in chunk_result.items()}
+
+
+# Only a window of pages around the current one is linked, plus the first and
+# last pages, previous & next links, and a form to jump to any page, so the
+# output is the same size however many pages there are.
+def generate_pagination_links(url_base, results_count, page_size, current_page, search_query=None, cursors=None,
+                              window=None):
+    if cursors is not None:
+        return _generate_cursor_pagination_links(url_base, page_size, *cursors, search_query=search_query)
     if results_count < page_size:
         return ''
+    if window is None:
+        window = settings.PAGINATION_WINDOW
     number_of_pages = math.ceil(results_count / page_size)
+
+    def page_link(page_number, link_text):
+        url_params = {'page_size': page_size, 'page_number': page_number}
+        if search_query is not None:
+            url_params['search_query'] = search_query
+        params = urllib.parse.urlencode(url_params)
+        return f'<a href="{url_base}?{params}">{link_text}</a>'
+
+    # Past the last page, the window is of the last pages, the way back.
+    window_center = min(current_page, number_of_pages)
+    page_numbers = {1, number_of_pages}
+    page_numbers.update(range(max(1, window_center - window), min(number_of_pages, window_center + window) + 1))
+    page_numbers = sorted(page_numbers)
+
+    page_links = [page_link(min(current_page - 1, number_of_pages), "« Previous") if current_page > 1
+                  else "« Previous"]
+    for index, page_number in enumerate(page_numbers):
+        # A gap of one page is filled in rather than elided, since the
+        # ellipsis would take as much room as the link.
+        if index and page_number - page_numbers[index - 1] == 2:
+            page_links.append(page_link(page_number - 1, page_number - 1))
+        elif index and page_number - page_numbers[index - 1] > 2:
+            page_links.append("…")
+        page_links.append(str(page_number) if page_number == current_page else page_link(page_number, page_number))
+    page_links.append(page_link(current_page + 1, "Next »") if current_page < number_of_pages else "Next »")
+    pagination_links = " • ".join(page_links)
+
+    if number_of_pages > len(page_numbers):
+        hidden_inputs = f'<input type="hidden" name="page_size" value="{page_size}">'
+        if search_query is not None:
+            hidden_inputs += f'<input type="hidden" name="search_query" value="{html.escape(search_query, quote=True)}">'
+        pagination_links += (f'\n<form action="{url_base}" method="get">{hidden_inputs}'
+                             f'<label>Page <input type="number" name="page_number" min="1" max="{number_of_pages}" '
+                             f'value="{window_center}"> of {number_of_pages}</label> '
+                             '<input type="submit" value="Go"></form>')
+    return pagination_links
+
+
+# In cursor mode there's no page count, so only previous & next links are
+# generated; either one is plain text if there's no page in that direction.
+def _generate_cursor_pagination_links(url_base, page_size, prev_cursor, next_cursor, search_query=None):
     page_links = list()
-    for page_number in range(1, number_of_pages + 1):
-        if page_number == current_page:
-            page_links.append(str(page_number))
+    for cursor_param, cursor, link_text in (("before", prev_cursor, "« Previous"), ("after", next_cursor, "Next »")):
+        if cursor is None:
+            page_links.append(link_text)
         else:
-            url_params = {'page_size': page_size, 'page_number': page_number}
+            url_params = {'page_size': page_size, cursor_param: cursor}
             if search_query is not None:
                 url_params['search_query'] = search_query
             params = urllib.parse.urlencode(url_params)
-            page_links.append(f'<a href="{url_base}?{params}">{page_number}</a>')
+            page_links.append(f'<a href="{url_base}?{params}">{link_text}</a>')
     return " • ".join(page_links)
-
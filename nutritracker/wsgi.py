@@ -13,6 +13,19 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from nutritracker.indexes import verify_indexes
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nutritracker.settings')
 
 application = get_wsgi_application()
+
+# In production, refuses to start if the MongoDB indexes the app's queries rely
+# on are missing.
+verify_indexes()
+
+# Starts building the local food search index in the background, so the first
+# search doesn't have to wait for it; see foods.models.food_name_index. The
+# models can only be imported once the application has loaded the apps.
+from foods.models import food_name_index
+
+food_name_index.start_build()
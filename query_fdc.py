@@ -31,10 +31,10 @@ def main(search_kw=[], fdc_ids=[], save_to_db=False, food_list=False, food_list_
         username = decouple.config("DB_USERNAME")
         password = decouple.config("DB_PASSWORD")
         db_conx = Db_Connection(username, password)
-        food_objs = api_contacter.look_up_fdc_ids(fdc_ids)
+        food_objs = retrieve_usable_food_objects(api_contacter, fdc_ids)
         results_list = [db_conx.save_food_object(food_obj) for food_obj in food_objs]
     elif fdc_ids:
-        food_objs = [api_contacter.look_up_fdc_id(fdc_id) for fdc_id in fdc_ids]
+        food_objs = retrieve_usable_food_objects(api_contacter, fdc_ids)
         results_list = [food_obj.serialize() for food_obj in food_objs]
     elif search_kw:
         results_list = api_contacter.search_by_keywords(' '.join(search_kw))
@@ -49,6 +49,20 @@ def main(search_kw=[], fdc_ids=[], save_to_db=False, food_list=False, food_list_
     print(formatted_json)
 
 
+# Looks the FDC IDs up in batches, and reports any that the FDC doesn't have or
+# that lack the serving size data needed to use them.
+def retrieve_usable_food_objects(api_contacter, fdc_ids):
+    food_objs = list()
+    for fdc_id, food_obj in api_contacter.look_up_fdc_ids(fdc_ids).items():
+        if food_obj is None:
+            print(f"No such FDC ID in the FoodData Central database: {fdc_id}", file=sys.stderr)
+        elif food_obj is False:
+            print(f"The food with FDC ID {fdc_id} has no usable serving size data, skipping", file=sys.stderr)
+        else:
+            food_objs.append(food_obj)
+    return food_objs
+
+
 class Db_Connection:
     __slots__ = 'username', 'password', 'client', 'db'
 
@@ -73,7 +87,11 @@ class Db_Connection:
         for property_key, property_value in food_obj_serialized.items():
             if isinstance(property_value, dict):
                 food_obj_serialized[property_key] = property_value["amount"]
+        food_obj_serialized['display_name'] = food_obj.food_name
         object_id = foods_coll.insert_one(food_obj_serialized).inserted_id
+        # Tells the web app to recount the foods collection; see
+        # nutritracker.utils.Result_Count_Cache.
+        self.db['result_count_generations'].update_one({'_id': 'foods'}, {'$inc': {'generation': 1}}, upsert=True)
         return str(object_id)
 
 
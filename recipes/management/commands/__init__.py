@@ -0,0 +1,3 @@
+#!/usr/bin/python
+
+
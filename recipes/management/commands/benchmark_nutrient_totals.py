@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from nutritracker.utils import Nutrient_Vector, sum_nutrient_totals
+from nutritracker import nutrition_engine
+
+
+class Command(BaseCommand):
+    help = ("Times totaling the nutrients of a synthetic workload of ingredients split among recipes: summing food "
+            "dicts one at a time, adding Nutrient_Vectors one at a time, and one grouped nutrition_engine call. Runs "
+            "entirely in memory; no database access.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ingredients", type=int, default=10000, help="total number of ingredients")
+        parser.add_argument("--recipes", type=int, default=500, help="number of recipes to split them among")
+        parser.add_argument("--repetitions", type=int, default=5, help="number of times to run each method")
+
+    def handle(self, *args, **options):
+        number_of_ingredients = options["ingredients"]
+        number_of_recipes = options["recipes"]
+        repetitions = options["repetitions"]
+
+        random_obj = random.Random(0)
+        food_dicts = [{symbol: random_obj.uniform(0, 100) for symbol in Nutrient_Vector.symbols}
+                      for _ in range(number_of_ingredients)]
+        food_vectors = [Nutrient_Vector.from_dict(food_dict) for food_dict in food_dicts]
+        servings_numbers = [random_obj.uniform(0.25, 4) for _ in range(number_of_ingredients)]
+        group_ids = [index % number_of_recipes for index in range(number_of_ingredients)]
+
+        def per_dict():
+            recipes_ingredients = [list() for _ in range(number_of_recipes)]
+            for food_dict, servings_number, group_id in zip(food_dicts, servings_numbers, group_ids):
+                recipes_ingredients[group_id].append({'food': food_dict, 'servings_number': servings_number})
+            return [sum_nutrient_totals(ingredient_dicts) for ingredient_dicts in recipes_ingredients]
+
+        def per_vector():
+            recipe_totals = [Nutrient_Vector() for _ in range(number_of_recipes)]
+            for food_vector, servings_number, group_id in zip(food_vectors, servings_numbers, group_ids):
+                recipe_totals[group_id] += food_vector * servings_number
+            return recipe_totals
+
+        def batched():
+            matrix = nutrition_engine.nutrient_matrix(food_dicts)
+            totals_matrix = nutrition_engine.totals(matrix, servings_numbers, group_ids, number_of_recipes)
+            return totals_matrix, nutrition_engine.dv_percentages(totals_matrix)
+
+        def batched_prebuilt_matrix(matrix=nutrition_engine.nutrient_matrix(food_dicts)):
+            totals_matrix = nutrition_engine.totals(matrix, servings_numbers, group_ids, number_of_recipes)
+            return totals_matrix, nutrition_engine.dv_percentages(totals_matrix)
+
+        self.stdout.write(f"{number_of_ingredients} ingredients in {number_of_recipes} recipes, "
+                          f"{len(Nutrient_Vector.symbols)} nutrients each")
+        self.stdout.write(f"{'method':<36}{'ms/run':>10}{'ingredients/s':>16}")
+        for method_name, method_callable in (("food dicts, one at a time", per_dict),
+                                             ("Nutrient_Vector, one at a time", per_vector),
+                                             ("nutrition_engine incl. matrix build", batched),
+                                             ("nutrition_engine, matrix prebuilt", batched_prebuilt_matrix)):
+            start_time = time.perf_counter()
+            for _ in range(repetitions):
+                method_callable()
+            elapsed = (time.perf_counter() - start_time) / repetitions
+            self.stdout.write(f"{method_name:<36}{elapsed * 1000:>10.2f}{number_of_ingredients / elapsed:>16,.0f}")
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+import random
+import time
+
+from bson.objectid import ObjectId
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from nutritracker.utils import Ingredient_Detailed, Nutrient_Vector, Recipe_Detailed, sum_nutrient_totals
+
+
+class Command(BaseCommand):
+    help = ("Times loading a synthetic recipe into a Recipe_Detailed with its ingredients built: by way of a model "
+            "object's serialize() copy and the ingredient and food JSON decoders, as recipes_mongodb_id used to, and "
+            "straight from the recipe document with Recipe_Detailed.from_mongo_doc(). Runs in memory unless --with-db "
+            "is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ingredients", type=int, default=50, help="number of ingredients in the recipe")
+        parser.add_argument("--repetitions", type=int, default=1000, help="number of times to load it each way")
+        parser.add_argument("--with-db", action="store_true",
+                            help="also time fetching the recipe, by saving it to the recipes collection for the "
+                                 "duration; it's deleted afterward")
+
+    def handle(self, *args, **options):
+        repetitions = options["repetitions"]
+        recipe_doc = self._synthetic_recipe_doc(options["ingredients"])
+        recipe_model_obj = Recipe(**recipe_doc)
+
+        def serialize_round_trip(recipe_model_obj=recipe_model_obj):
+            recipe_json_obj = recipe_model_obj.serialize()
+            recipe_obj = Recipe_Detailed.from_json_obj(recipe_json_obj)
+            recipe_obj.ingredients = [Ingredient_Detailed.from_json_obj(ingredient_json_obj)
+                                      for ingredient_json_obj in recipe_json_obj["ingredients"]]
+            return recipe_obj
+
+        def from_mongo_doc(recipe_doc=recipe_doc):
+            recipe_obj = Recipe_Detailed.from_mongo_doc(recipe_doc)
+            recipe_obj.ingredients
+            return recipe_obj
+
+        methods = [("serialize() round trip", serialize_round_trip), ("from_mongo_doc()", from_mongo_doc)]
+        if options["with_db"]:
+            Recipe.objects.mongo_insert_one(recipe_doc)
+            mongodb_id = recipe_doc["_id"]
+            methods.append(("djongo get(), round trip",
+                            lambda: serialize_round_trip(Recipe.objects.get(_id=mongodb_id))))
+            methods.append(("find_one(), from_mongo_doc()",
+                            lambda: from_mongo_doc(Recipe.objects.mongo_find_one({'_id': mongodb_id}))))
+        try:
+            self.stdout.write(f"recipe of {options['ingredients']} ingredients, {repetitions} loads each way")
+            self.stdout.write(f"{'method':<32}{'ms/load':>10}{'loads/s':>12}")
+            for method_name, method_callable in methods:
+                start_time = time.perf_counter()
+                for _ in range(repetitions):
+                    method_callable()
+                elapsed = (time.perf_counter() - start_time) / repetitions
+                self.stdout.write(f"{method_name:<32}{elapsed * 1000:>10.3f}{1 / elapsed:>12,.0f}")
+        finally:
+            if options["with_db"]:
+                Recipe.objects.mongo_delete_one({'_id': recipe_doc["_id"]})
+
+    def _synthetic_recipe_doc(self, number_of_ingredients):
+        random_obj = random.Random(0)
+        ingredients = list()
+        for index in range(number_of_ingredients):
+            food_doc = {'_id': ObjectId(), 'fdc_id': 100000 + index, 'food_name': f"Benchmark Food {index}",
+                        'serving_size': random_obj.uniform(10, 250), 'serving_units': 'g'}
+            food_doc.update({symbol: random_obj.uniform(0, 100) for symbol in Nutrient_Vector.symbols})
+            ingredients.append({'_id': ObjectId(), 'servings_number': random_obj.uniform(0.25, 4), 'food': food_doc})
+        return {'_id': ObjectId(), 'owner': '', 'recipe_name': "Benchmark Recipe", 'display_name': "Benchmark Recipe",
+                'complete': True, 'ingredients': ingredients, 'nutrient_totals': sum_nutrient_totals(ingredients)}
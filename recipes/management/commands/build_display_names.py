@@ -0,0 +1,33 @@
+#!/usr/bin/python
+
+from pymongo import UpdateOne
+
+from django.core.management.base import BaseCommand
+
+from foods.models import Food
+from recipes.models import Recipe
+from nutritracker.utils import title_case
+
+
+class Command(BaseCommand):
+    help = ("Computes the display_name field, the title cased name, of every document in the foods and recipes "
+            "collections. Foods and recipes saved through their models get it automatically; this backfills ones "
+            "stored before that or inserted directly.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="number of updates per bulk write")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        for model_cls, name_field in ((Food, 'food_name'), (Recipe, 'recipe_name')):
+            updates = list()
+            updated_count = 0
+            for doc in model_cls.objects.mongo_find({}, {name_field: True}):
+                updates.append(UpdateOne({'_id': doc['_id']},
+                                         {'$set': {'display_name': title_case(doc.get(name_field, '').lower())}}))
+                if len(updates) == batch_size:
+                    updated_count += model_cls.objects.mongo_bulk_write(updates, ordered=False).matched_count
+                    updates = list()
+            if updates:
+                updated_count += model_cls.objects.mongo_bulk_write(updates, ordered=False).matched_count
+            self.stdout.write(f"computed display names for {updated_count} {model_cls._meta.db_table}")
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+from pymongo import UpdateOne
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Food, Recipe
+from nutritracker.utils import Nutrient_Vector, Food_Identity_Map
+from nutritracker import nutrition_engine
+
+
+class Command(BaseCommand):
+    help = ("Sums the nutrient_totals subdocument of every document in the recipes collection from its ingredients. "
+            "Adding and removing ingredients keeps it current; this backfills recipes saved before it existed and "
+            "repairs any that have drifted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="number of recipes per bulk write")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        recipe_docs = list()
+        updated_count = 0
+        for recipe_doc in Recipe.objects.mongo_find({}, {'ingredients': True}):
+            recipe_docs.append(recipe_doc)
+            if len(recipe_docs) == batch_size:
+                updated_count += self._update_batch(recipe_docs)
+                recipe_docs = list()
+        if recipe_docs:
+            updated_count += self._update_batch(recipe_docs)
+        self.stdout.write(f"computed nutrient totals for {updated_count} recipes")
+
+    # Totals the whole batch in one call, with each ingredient's row grouped
+    # under the index of the recipe it belongs to. The foods of reference
+    # ingredients are looked up for the whole batch in one query; one that's
+    # gone from the foods collection counts for nothing.
+    def _update_batch(self, recipe_docs):
+        food_docs = Food_Identity_Map(Food).get_many(ingredient_dict['fdc_id'] for recipe_doc in recipe_docs
+                                                     for ingredient_dict in recipe_doc.get('ingredients', ())
+                                                     if not ingredient_dict.get('food'))
+        for fdc_id in sorted(fdc_id for fdc_id, food_doc in food_docs.items() if food_doc is None):
+            self.stderr.write(f"No food with FDC ID {fdc_id} in the foods collection, left out of the totals")
+        food_dicts = list()
+        servings_numbers = list()
+        group_ids = list()
+        for recipe_index, recipe_doc in enumerate(recipe_docs):
+            for ingredient_dict in recipe_doc.get('ingredients', ()):
+                food_dicts.append(ingredient_dict.get('food') or food_docs[ingredient_dict['fdc_id']] or {})
+                servings_numbers.append(ingredient_dict['servings_number'])
+                group_ids.append(recipe_index)
+        totals_matrix = nutrition_engine.totals(nutrition_engine.nutrient_matrix(food_dicts), servings_numbers,
+                                                group_ids, len(recipe_docs))
+        updates = [UpdateOne({'_id': recipe_doc['_id']},
+                             {'$set': {'nutrient_totals': dict(zip(Nutrient_Vector.symbols, map(float, totals_row)))}})
+                   for recipe_doc, totals_row in zip(recipe_docs, totals_matrix)]
+        return Recipe.objects.mongo_bulk_write(updates, ordered=False).matched_count
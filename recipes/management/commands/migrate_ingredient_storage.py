@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+from pymongo import UpdateOne
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Food, Recipe
+from nutritracker.utils import Food_Identity_Map, reference_ingredient
+
+
+class Command(BaseCommand):
+    help = ("Converts the ingredients of every document in the recipes collection between the two storage modes of "
+            "settings.RECIPE_INGREDIENT_STORAGE: 'reference', where an ingredient stores its food's fdc_id and a "
+            "content hash, and 'embedded', where it stores a copy of the food. Ingredients whose food isn't in the "
+            "foods collection are left embedded, or left as references, since there's nothing to convert them to.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=("reference", "embedded"), required=True,
+                            help="storage mode to convert ingredients to")
+        parser.add_argument("--batch-size", type=int, default=1000, help="number of recipes per bulk write")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        convert_batch = self._to_reference if options["to"] == "reference" else self._to_embedded
+        counts = {'recipes': 0, 'converted': 0, 'unresolved': 0}
+        recipe_docs = list()
+        for recipe_doc in Recipe.objects.mongo_find({}, {'ingredients': True}):
+            recipe_docs.append(recipe_doc)
+            if len(recipe_docs) == batch_size:
+                self._update_batch(convert_batch, recipe_docs, counts)
+                recipe_docs = list()
+        if recipe_docs:
+            self._update_batch(convert_batch, recipe_docs, counts)
+        self.stdout.write(f"{counts['converted']} ingredients in {counts['recipes']} recipes converted to "
+                          f"{options['to']} storage, {counts['unresolved']} left as they were with no such food "
+                          "in the foods collection")
+
+    # The foods for a whole batch are looked up in one query, and only the
+    # recipes with an ingredient that changed are written.
+    def _update_batch(self, convert_batch, recipe_docs, counts):
+        food_docs = Food_Identity_Map(Food).get_many(self._fdc_id(ingredient_dict) for recipe_doc in recipe_docs
+                                                     for ingredient_dict in recipe_doc.get('ingredients') or ())
+        updates = list()
+        for recipe_doc in recipe_docs:
+            ingredient_dicts, converted_count = convert_batch(recipe_doc.get('ingredients') or (), food_docs, counts)
+            if converted_count:
+                counts['recipes'] += 1
+                counts['converted'] += converted_count
+                updates.append(UpdateOne({'_id': recipe_doc['_id']}, {'$set': {'ingredients': ingredient_dicts}}))
+        if updates:
+            Recipe.objects.mongo_bulk_write(updates, ordered=False)
+
+    @staticmethod
+    def _fdc_id(ingredient_dict):
+        return ingredient_dict['food']['fdc_id'] if ingredient_dict.get('food') else ingredient_dict.get('fdc_id', 0)
+
+    # The hash is of the embedded copy, not the food as it is now, so a food
+    # that's been re-imported since shows as changed when the recipe's next
+    # displayed, and its totals are summed again.
+    def _to_reference(self, ingredient_dicts, food_docs, counts):
+        converted_dicts = list()
+        converted_count = 0
+        for ingredient_dict in ingredient_dicts:
+            if ingredient_dict.get('food'):
+                if food_docs.get(ingredient_dict['food']['fdc_id']) is None:
+                    counts['unresolved'] += 1
+                else:
+                    ingredient_dict = reference_ingredient(ingredient_dict)
+                    converted_count += 1
+            converted_dicts.append(ingredient_dict)
+        return converted_dicts, converted_count
+
+    # Embedded foods have exactly the fields recipes.models.Food declares,
+    # which every embedded food must have.
+    def _to_embedded(self, ingredient_dicts, food_docs, counts):
+        converted_dicts = list()
+        converted_count = 0
+        for ingredient_dict in ingredient_dicts:
+            if not ingredient_dict.get('food'):
+                food_doc = food_docs.get(ingredient_dict.get('fdc_id', 0))
+                if food_doc is None:
+                    counts['unresolved'] += 1
+                else:
+                    embedded_food = {column: food_doc.get(column, Food._meta.get_field(column).default)
+                                     for column in Food.__columns__}
+                    ingredient_dict = dict(ingredient_dict, fdc_id=food_doc['fdc_id'], food_hash="", food=embedded_food)
+                    converted_count += 1
+            converted_dicts.append(ingredient_dict)
+        return converted_dicts, converted_count
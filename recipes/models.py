@@ -2,10 +2,18 @@
 
 import codecs
 
+import pymongo
+
 from bson.objectid import ObjectId
 
+from django.conf import settings
+
 from djongo import models
 
+from foods.models import food_name_index, result_counts, food_content_tracking
+from nutritracker.utils import (title_case, update_nutrient_totals, sum_nutrient_totals,
+                                food_content_hash, reference_ingredient, resolve_ingredient_foods, Food_Identity_Map)
+
 # Create your models here.
 
 
@@ -33,7 +41,7 @@ class serializable:
         return serialization
 
 
-class Food(models.Model, serializable):
+class Food(food_content_tracking, models.Model, serializable):
     __columns__ = ('_id', 'fdc_id', 'food_name', 'serving_size', 'serving_units', 'energy_kcal', 'total_fat_g',
                    'saturated_fat_g', 'trans_fat_g', 'cholesterol_mg', 'sodium_mg', 'total_carbohydrates_g',
                    'dietary_fiber_g', 'sugars_g', 'protein_g', 'vitamin_D_mcg', 'potassium_mg', 'iron_mg', 'calcium_mg',
@@ -73,18 +81,51 @@ class Food(models.Model, serializable):
     zinc_mg                = models.PositiveSmallIntegerField(default=0,  verbose_name="Zinc (mg)")
     copper_mg              = models.PositiveSmallIntegerField(default=0,  verbose_name="Copper (mg)")
 
+    objects = models.DjongoManager()
+
     class Meta:
         managed = False
         db_table = 'foods'
         app_label = 'recipes'
 
+    # This model is embedded in Ingredient, which requires every field it
+    # declares to be present in every embedded food, so it can't declare
+    # display_name like foods.models.Food does. Foods saved through this model
+    # still need it, so the food is written directly, with display_name set
+    # alongside its fields in the same update.
+    def save(self):
+        if self._id is None:
+            self._id = ObjectId()
+        food_doc = {field.attname: field.get_prep_value(getattr(self, field.attname))
+                    for field in self._meta.concrete_fields if not field.primary_key}
+        food_doc['display_name'] = title_case(self.food_name.lower())
+        Food.objects.mongo_update_one({'_id': self._id}, {'$set': food_doc}, upsert=True)
+        self._state.adding = False
+        food_name_index.add(self._id, self.food_name, result_counts.invalidate(Food))
+        changed_fdc_ids = self._changed_fdc_ids()
+        self._note_saved_content()
+        if changed_fdc_ids:
+            refresh_recipe_totals(changed_fdc_ids)
 
+    def delete(self, *args, **kwargs):
+        mongodb_id, fdc_id = self._id, self.fdc_id
+        retval = super().delete(*args, **kwargs)
+        food_name_index.remove(mongodb_id, result_counts.invalidate(Food))
+        refresh_recipe_totals((fdc_id,))
+        return retval
+
+
+# An ingredient either embeds a copy of its food, or, stored by reference,
+# has food set to None and only names it by fdc_id, with a food_hash of its
+# contents when it was added; see nutritracker.utils.food_content_hash().
 class Ingredient(models.Model, serializable):
-    __columns__ = '_id', 'servings_number', 'food'
+    __columns__ = '_id', 'servings_number', 'fdc_id', 'food_hash', 'food'
 
     _id                    = models.ObjectIdField(primary_key=True)
     servings_number        = models.FloatField(               default=0,  verbose_name="Servings number")
-    food                   = models.EmbeddedField(model_container=Food,   verbose_name="Food")
+    fdc_id                 = models.PositiveIntegerField(     default=0,  verbose_name="Food Data Central ID")
+    food_hash              = models.CharField(max_length=40,  default="", verbose_name="Food content hash")
+    food                   = models.EmbeddedField(model_container=Food, null=True, blank=True, verbose_name="Food")
 
     class Meta:
         managed = False
@@ -93,16 +134,130 @@ class Ingredient(models.Model, serializable):
 
 
 class Recipe(models.Model, serializable):
-    __columns__ = '_id', 'owner', 'recipe_name', 'complete', 'ingredients'
+    __columns__ = '_id', 'owner', 'recipe_name', 'display_name', 'complete', 'ingredients', 'nutrient_totals'
 
     _id                    = models.ObjectIdField(primary_key=True)
     owner                  = models.CharField(max_length=32, default="", verbose_name="Username")
     recipe_name            = models.CharField(max_length=200, default="", verbose_name="Recipe name")
+    display_name           = models.CharField(max_length=200, default="", verbose_name="Recipe name, title cased")
     complete               = models.BooleanField(default=True, verbose_name="Recipe has been completed")
     ingredients            = models.ArrayField(model_container=Ingredient, verbose_name="Recipe ingredients")
+    nutrient_totals        = models.JSONField(default=dict, verbose_name="Recipe nutrient totals")
+
+    objects = models.DjongoManager()
 
     class Meta:
         managed = False
         db_table = 'recipes'
         app_label = 'recipes'
+        # This model is unmanaged, so these are never created by a migration;
+        # `./manage.py ensure_indexes` creates them.
+        # Recipes are listed in order of their title cased display_name, as
+        # they're displayed. The owner_complete_display_name index serves both
+        # of a user's lists, their complete recipes and the ones they're
+        # building, and its owner prefix any other lookup by owner.
+        indexes = [models.Index(fields=['display_name', '_id'], name='display_name'),
+                   models.Index(fields=['owner', 'complete', 'display_name', '_id'], name='owner_complete_display_name')]
+
+    # Indexes `./manage.py ensure_indexes` creates that Django's Index can't
+    # name; refresh_recipe_totals() finds the recipes that use a food by this.
+    mongo_indexes = {'ingredients_fdc_id': [('ingredients.fdc_id', pymongo.ASCENDING)]}
+
+    # Title casing is done once here rather than every time the recipe is
+    # displayed; see Recipe_Detailed.
+    # Saving a recipe can change which counts it's in, by its name or by
+    # being completed, so it invalidates them whether or not it's new.
+    # Ingredient requires every field it declares to be present, so
+    # ingredients from before fdc_id and food_hash existed are given them.
+    def save(self, *args, **kwargs):
+        self.display_name = title_case(self.recipe_name.lower())
+        for ingredient_dict in self.ingredients:
+            ingredient_dict.setdefault('food', None)
+            ingredient_dict.setdefault('food_hash', "")
+            if ingredient_dict['food']:
+                ingredient_dict['fdc_id'] = ingredient_dict['food']['fdc_id']
+        super().save(*args, **kwargs)
+        result_counts.invalidate(Recipe)
+
+    def delete(self, *args, **kwargs):
+        retval = super().delete(*args, **kwargs)
+        result_counts.invalidate(Recipe)
+        return retval
+
+    # These keep nutrient_totals in step with the ingredients list; see
+    # nutritracker.utils.update_nutrient_totals(). Recipes saved before
+    # nutrient_totals existed have their totals summed the first time
+    # they're changed. add_ingredient() takes an ingredient with its food
+    # embedded, and stores it by reference if settings.RECIPE_INGREDIENT_STORAGE
+    # says so.
+    def add_ingredient(self, ingredient_dict):
+        self.nutrient_totals = update_nutrient_totals(self._current_nutrient_totals(), ingredient_dict["food"],
+                                                      ingredient_dict["servings_number"])
+        if settings.RECIPE_INGREDIENT_STORAGE == 'reference' and ingredient_dict["food"]["fdc_id"]:
+            ingredient_dict = reference_ingredient(ingredient_dict)
+        self.ingredients.append(ingredient_dict)
+
+    # A reference ingredient's food can have changed since it was added, in
+    # which case subtracting it as it is now would leave the totals wrong, so
+    # they're summed again from the foods as they are now instead.
+    def remove_ingredient(self, index, food_identity_map=None):
+        food_identity_map = food_identity_map or Food_Identity_Map(Food)
+        nutrient_totals = self._current_nutrient_totals(food_identity_map)
+        ingredient_dict = self.ingredients.pop(index)
+        if not self.ingredients:
+            # Starting over from zero rather than subtracting keeps float
+            # rounding error from accumulating past an emptied recipe.
+            self.nutrient_totals = sum_nutrient_totals(())
+            return ingredient_dict
+        food_dict = ingredient_dict["food"] or food_identity_map.get(ingredient_dict["fdc_id"])
+        if ingredient_dict["food"] or (food_dict is not None
+                                       and food_content_hash(food_dict) == ingredient_dict["food_hash"]):
+            self.nutrient_totals = update_nutrient_totals(nutrient_totals, food_dict,
+                                                          -ingredient_dict["servings_number"])
+        else:
+            self.nutrient_totals = sum_nutrient_totals(self.resolved_ingredients(food_identity_map))
+        return ingredient_dict
+
+    # The ingredients with every referenced food looked up, in one query.
+    def resolved_ingredients(self, food_identity_map=None):
+        return resolve_ingredient_foods(self.ingredients, food_identity_map or Food_Identity_Map(Food))
+
+    def _current_nutrient_totals(self, food_identity_map=None):
+        return self.nutrient_totals if self.nutrient_totals else sum_nutrient_totals(
+            self.resolved_ingredients(food_identity_map))
+
 
+# Listings show recipes' stored nutrient_totals, while recipe pages sum
+# reference ingredients from the foods as they are now, so when a food
+# changes or is deleted, the recipes that use it by reference have their
+# stored totals summed again, and their ingredients' hashes brought up to date
+# to match. A food that's gone counts for nothing, as in build_nutrient_totals.
+# Called by both Food models' save() and delete(), and by the FDC import
+# commands for the foods they've written. Returns the number of recipes
+# updated.
+def refresh_recipe_totals(fdc_ids):
+    fdc_ids = [fdc_id for fdc_id in set(fdc_ids) if fdc_id]
+    if not fdc_ids:
+        return 0
+    recipe_docs = list(Recipe.objects.mongo_find({'ingredients': {'$elemMatch': {'fdc_id': {'$in': fdc_ids},
+                                                                                  'food': None}}},
+                                                 {'ingredients': True}))
+    if not recipe_docs:
+        return 0
+    food_docs = Food_Identity_Map(Food).get_many(ingredient_dict['fdc_id'] for recipe_doc in recipe_docs
+                                                 for ingredient_dict in recipe_doc['ingredients']
+                                                 if not ingredient_dict.get('food'))
+    updates = list()
+    for recipe_doc in recipe_docs:
+        ingredient_dicts = list()
+        resolved_dicts = list()
+        for ingredient_dict in recipe_doc['ingredients']:
+            food_doc = ingredient_dict.get('food') or food_docs[ingredient_dict['fdc_id']]
+            if not ingredient_dict.get('food') and food_doc is not None:
+                ingredient_dict = dict(ingredient_dict, food_hash=food_content_hash(food_doc))
+            ingredient_dicts.append(ingredient_dict)
+            resolved_dicts.append(dict(ingredient_dict, food=food_doc or {}))
+        updates.append(pymongo.UpdateOne({'_id': recipe_doc['_id']},
+                                         {'$set': {'ingredients': ingredient_dicts,
+                                                   'nutrient_totals': sum_nutrient_totals(resolved_dicts)}}))
+    return Recipe.objects.mongo_bulk_write(updates, ordered=False).matched_count
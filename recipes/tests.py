@@ -1,7 +1,10 @@
 #!/usr/bin/python
 
 import random
+import re
 import html
+import math
+import io
 import faker
 import urllib.parse
 
@@ -10,12 +13,18 @@ from bson.objectid import ObjectId
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.sessions.middleware import SessionMiddleware
-from django.http import HttpResponseRedirect
+from django.core.management import call_command
+from django.http import HttpResponse, HttpResponseRedirect
 from django.test.client import RequestFactory
-from django.test import TestCase, tag
+from django.test import TestCase, override_settings, tag
 from operator import attrgetter
 
 from .models import Food, Ingredient, Recipe
+from nutritracker import nutrition_engine
+from foods.models import food_name_index
+from nutritracker.middleware import Request_Loader_Middleware, loader_statistics, request_loader
+from nutritracker.utils import Recipe_Detailed, Food_Identity_Map, Food_Detailed, Nutrient, Nutrient_Vector, \
+        Nutrient_View, sum_nutrient_totals
 from .views import recipes, recipes_mongodb_id, recipes_search, recipes_search_results, recipes_builder, \
         recipes_builder_new, recipes_builder_mongodb_id, recipes_builder_mongodb_id_delete, \
         recipes_builder_mongodb_id_remove_ingredient, recipes_builder_mongodb_id_add_ingredient
@@ -106,6 +115,8 @@ class recipes_test_case(TestCase):
             food_model_obj = Food(**food_model_argd)
             food_model_obj.save()
             self.foods[food_name] = food_model_obj
+        food_name_index.wait()
+        food_name_index.build()
 
         # Instancing every Recipe object by way of Food objects and Ingredient objects
         self.ingredients = list()
@@ -200,6 +211,90 @@ class test_recipes(recipes_test_case):
         assert '<a href="/recipes/?page_size=2&page_number=2">2</a>' in content, "calling recipes(request) with " \
                 f"cgi params '{cgi_query_string}' didn't yield content containing correct pagination links"
 
+    def test_recipes_normal_case_only_own_complete_recipes(self):
+        incomplete_recipe_name, other_owners_recipe_name = sorted(self.recipes.keys())[0:2]
+        self.recipes[incomplete_recipe_name].complete = False
+        self.recipes[incomplete_recipe_name].save()
+        self.recipes[other_owners_recipe_name].owner = self.test_username + "_other"
+        self.recipes[other_owners_recipe_name].save()
+        cgi_data = {"page_size": 2, "page_number": 1}
+        cgi_query_string = urllib.parse.urlencode(cgi_data)
+        request = self._middleware_and_user_bplate(
+            self.request_factory.get("/recipes/", data=cgi_data)
+        )
+        content = recipes(request).content.decode('utf-8')
+        for recipe_name in (incomplete_recipe_name, other_owners_recipe_name):
+            assert html.escape(recipe_name) not in content, f"calling recipes(request) with CGI params " \
+                    f"'{cgi_query_string}' yields content containing the recipe name \"{recipe_name}\" although " \
+                    "that recipe is incomplete or belongs to another user"
+        for recipe_name in sorted(self.recipes.keys())[2:4]:
+            assert html.escape(recipe_name) in content, f"calling recipes(request) with CGI params " \
+                    f"'{cgi_query_string}' does not yield content containing the recipe name \"{recipe_name}\" " \
+                    "although it's among the first two of the user's complete recipes"
+
+    def test_recipes_normal_case_cursor_pagination(self):
+        recipe_names = sorted(self.recipes.keys())
+        cgi_data = {"page_size": 2, "after": ""}
+        for page_recipe_names, other_recipe_names, link_param, link_text in (
+                (recipe_names[:2], recipe_names[2:], "after", "Next »"),
+                (recipe_names[2:], recipe_names[:2], "before", "« Previous"),
+                (recipe_names[:2], recipe_names[2:], None, None)):
+            cgi_query_string = urllib.parse.urlencode(cgi_data)
+            request = self._middleware_and_user_bplate(
+                self.request_factory.get("/recipes/", data=cgi_data)
+            )
+            content = recipes(request).content.decode('utf-8')
+            for recipe_name in page_recipe_names:
+                assert html.escape(recipe_name) in content, f"calling recipes(request) with CGI params " \
+                        f"'{cgi_query_string}' does not yield content containing the recipe name '{recipe_name}' " \
+                        "although it should be on that page"
+            for recipe_name in other_recipe_names:
+                assert html.escape(recipe_name) not in content, f"calling recipes(request) with CGI params " \
+                        f"'{cgi_query_string}' yields content containing the recipe name '{recipe_name}' although " \
+                        "it should be on another page"
+            if link_param is None:
+                break
+            link_match = re.search(f'<a href="/recipes/\\?page_size=2&{link_param}=([^"]+)">{link_text}</a>', content)
+            assert link_match, f"calling recipes(request) with CGI params '{cgi_query_string}' doesn't yield " \
+                    f"content containing a '{link_text}' pagination link"
+            cgi_data = {"page_size": 2, link_param: urllib.parse.unquote(link_match.group(1))}
+
+    def test_recipes_normal_case_mixed_case_order(self):
+        # Recipes are listed in the order of their names as they're displayed,
+        # title cased, whatever case they were entered in.
+        for recipe_name in ('zucchini bread', 'Banana Bread', 'apple pie'):
+            Recipe(owner=self.test_username, recipe_name=recipe_name, complete=True, ingredients=list()).save()
+        for cgi_data in ({"page_size": 25}, {"page_size": 25, "after": ""}):
+            cgi_query_string = urllib.parse.urlencode(cgi_data)
+            request = self._middleware_and_user_bplate(
+                self.request_factory.get("/recipes/", data=cgi_data)
+            )
+            content = recipes(request).content.decode('utf-8')
+            positions = [content.find(f">{display_name}</a>")
+                         for display_name in ('Apple Pie', 'Banana Bread', 'Zucchini Bread')]
+            assert -1 not in positions and positions == sorted(positions), f"calling recipes(request) with CGI " \
+                    f"params '{cgi_query_string}' doesn't list recipes named in mixed case in the order of their " \
+                    "title cased names"
+
+    def test_recipes_normal_case_stored_totals(self):
+        # The list reads recipes without their ingredients; ones without
+        # stored totals are read whole to sum theirs, and ones with them,
+        # even with their foods stored by reference, need no foods looked up.
+        for build_totals in (False, True):
+            if build_totals:
+                call_command("build_nutrient_totals", stdout=io.StringIO())
+                call_command("migrate_ingredient_storage", "--to", "reference", stdout=io.StringIO())
+            request = self._middleware_and_user_bplate(self.request_factory.get("/recipes/"))
+            content = recipes(request).content.decode('utf-8')
+            for recipe_name in self.recipes:
+                energy_kcal = sum(servings_number * food_model_argds[food_name]['energy_kcal']
+                                  for food_name, servings_number in recipe_ingredients[recipe_name].items())
+                assert f"Calories: {floatformat(energy_kcal)}<br/>" in content, "calling recipes(request) " \
+                        f"{'with' if build_totals else 'without'} stored nutrient totals doesn't yield content " \
+                        f"containing the total calories of the recipe '{recipe_name}', {floatformat(energy_kcal)}"
+        assert request.loader.statistics()['food_docs']['queries'] == 0, "calling recipes(request) on recipes " \
+                "with stored nutrient totals looks up the foods of their ingredients"
+
     def test_recipes_error_case_user_not_logged_in(self):
         request = self._middleware_and_user_bplate(
             self.request_factory.get("/recipes/")
@@ -237,6 +332,65 @@ class test_recipes_mongodb_id(recipes_test_case):
                 "appropriate error message"
 
 
+    def test_recipes_mongodb_id_normal_case_nutrient_totals(self):
+        # Each recipe's page must show its own totals, not ones left over from
+        # a recipe displayed earlier.
+        for recipe_name, recipe_model_obj in self.recipes.items():
+            request = self._middleware_and_user_bplate(
+                self.request_factory.get(f"/recipes/{recipe_model_obj._id}")
+            )
+            content = recipes_mongodb_id(request, recipe_model_obj._id).content.decode('utf-8')
+            energy_kcal = sum(servings_number * food_model_argds[food_name]['energy_kcal']
+                              for food_name, servings_number in recipe_ingredients[recipe_name].items())
+            assert f"<b>{floatformat(energy_kcal)}</b>" in content, f"calling recipes_mongodb_id(request, " \
+                    f"'{recipe_model_obj._id}') for the recipe '{recipe_name}' doesn't yield content containing " \
+                    f"its total calories, {floatformat(energy_kcal)}"
+
+    def test_recipes_mongodb_id_normal_case_ingredients(self):
+        # The page is built from the raw recipe document, so this checks that
+        # every ingredient shows up on it, and that reading the document
+        # directly gives the same ingredients as reading it through the model.
+        for recipe_name, recipe_model_obj in self.recipes.items():
+            request = self._middleware_and_user_bplate(
+                self.request_factory.get(f"/recipes/{recipe_model_obj._id}")
+            )
+            content = recipes_mongodb_id(request, recipe_model_obj._id).content.decode('utf-8')
+            for food_name in recipe_ingredients[recipe_name]:
+                assert html.escape(food_name) in content, f"calling recipes_mongodb_id(request, " \
+                        f"'{recipe_model_obj._id}') for the recipe '{recipe_name}' doesn't yield content containing " \
+                        f"its ingredient '{food_name}'"
+            recipe_doc = Recipe.objects.mongo_find_one({'_id': recipe_model_obj._id})
+            doc_ingredients = Recipe_Detailed.from_mongo_doc(recipe_doc).ingredients
+            model_ingredients = Recipe_Detailed.from_model_obj(Recipe.objects.get(_id=recipe_model_obj._id)).ingredients
+            assert [(ingredient.food.food_name, ingredient.servings_number, list(ingredient.food.nutrients.amounts))
+                    for ingredient in doc_ingredients] \
+                    == [(ingredient.food.food_name, ingredient.servings_number, list(ingredient.food.nutrients.amounts))
+                        for ingredient in model_ingredients], \
+                    f"Recipe_Detailed.from_mongo_doc() and Recipe_Detailed.from_model_obj() build different " \
+                    f"ingredients for the recipe '{recipe_name}'"
+
+    def test_recipes_mongodb_id_normal_case_display_name(self):
+        recipe_model_obj = Recipe(owner=self.test_username, recipe_name="my u.s.a. chili of the day", complete=True,
+                                  ingredients=list())
+        recipe_model_obj.save()
+        display_name = "My U.S.A. Chili of the Day"
+        recipe_doc = Recipe.objects.mongo_find_one({'_id': recipe_model_obj._id})
+        assert recipe_doc['display_name'] == display_name, f"saving a Recipe with recipe_name " \
+                f"'{recipe_model_obj.recipe_name}' stores display_name '{recipe_doc['display_name']}' rather than " \
+                f"'{display_name}'"
+        # Recipes stored before display_name existed are title cased when
+        # they're displayed instead.
+        for display_name_update in ({'$set': {'display_name': display_name}}, {'$unset': {'display_name': ''}}):
+            Recipe.objects.mongo_update_one({'_id': recipe_model_obj._id}, display_name_update)
+            request = self._middleware_and_user_bplate(
+                self.request_factory.get(f"/recipes/{recipe_model_obj._id}")
+            )
+            content = recipes_mongodb_id(request, recipe_model_obj._id).content.decode('utf-8')
+            assert display_name in content, f"calling recipes_mongodb_id(request, '{recipe_model_obj._id}') for " \
+                    f"the recipe '{recipe_model_obj.recipe_name}' after updating it with {display_name_update} " \
+                    f"doesn't yield content containing its title cased name '{display_name}'"
+
+
 class test_recipes_search(recipes_test_case):
 
     # recipes_search() is a static page, so all there is to test is if it returns a response with status code 200.
@@ -298,6 +452,55 @@ class test_recipes_search_results(recipes_test_case):
                 f"calling recipes_search_results(request) with CGI params '{cgi_query_string}' that should point " \
                 "to a page off the end of the search results didn't yield content containing correct pagination links"
 
+    def test_recipes_search_results_normal_case_count_after_save(self):
+        # The number of matches is cached, so this checks that saving a
+        # matching recipe invalidates it; the search is in another case and
+        # order the second time, which shares the cached count.
+        butter_recipe_names = sorted(recipe_name for recipe_name in self.recipes if "Butter" in recipe_name)
+        for search_query, expected_count in (("Butter", len(butter_recipe_names)),
+                                             ("bUTTER", len(butter_recipe_names) + 1)):
+            if expected_count > len(butter_recipe_names):
+                Recipe(owner=self.test_username, recipe_name="Zucchini Butter", complete=True,
+                       ingredients=list()).save()
+            cgi_data = {"search_query": search_query, "page_size": 1, "page_number": 1}
+            cgi_query_string = urllib.parse.urlencode(cgi_data)
+            request = self._middleware_and_user_bplate(
+                self.request_factory.get("/recipes/search_results/", data=cgi_data)
+            )
+            content = recipes_search_results(request).content.decode('utf-8')
+            last_page_link = f'<a href="/recipes/search_results/?page_size=1&page_number={expected_count}' \
+                             f'&search_query={search_query}">{expected_count}</a>'
+            assert last_page_link in content, f"calling recipes_search_results(request) with CGI params " \
+                    f"'{cgi_query_string}' when {expected_count} recipes match doesn't yield content containing a " \
+                    f"link to the last page, page {expected_count}"
+            assert html.escape(butter_recipe_names[0]) in content, f"calling recipes_search_results(request) with " \
+                    f"CGI params '{cgi_query_string}' doesn't yield content containing the first match in order, " \
+                    f"'{butter_recipe_names[0]}'"
+
+    def test_recipes_search_results_normal_case_modes_agree(self):
+        # Names with regex metacharacters in them, and in another case, are
+        # matched the same way by the page number and cursor modes.
+        for recipe_name in ("Peanut (Butter) Cookies", "Brown butter. Sauce", "HONEY-BUTTER Toast"):
+            Recipe(owner=self.test_username, recipe_name=recipe_name, complete=True, ingredients=list()).save()
+        display_names = {recipe_model_obj.recipe_name: recipe_model_obj.display_name
+                         for recipe_model_obj in Recipe.objects.all()}
+        for search_query in ("Butter", "(butter)", "butter.", "honey butter", "Butter HONEY", "pickle"):
+            matched_names = dict()
+            for mode, cgi_data in (("page number", {"search_query": search_query, "page_size": 25, "page_number": 1}),
+                                   ("cursor", {"search_query": search_query, "page_size": 25, "after": ""})):
+                request = self._middleware_and_user_bplate(
+                    self.request_factory.get("/recipes/search_results/", data=cgi_data)
+                )
+                content = recipes_search_results(request).content.decode('utf-8')
+                matched_names[mode] = {recipe_name for recipe_name, display_name in display_names.items()
+                                       if f">{html.escape(display_name)}</a>" in content}
+            expected_names = {recipe_name for recipe_name in display_names
+                              if all(keyword in recipe_name.lower() for keyword in search_query.lower().split())}
+            for mode, mode_matched_names in matched_names.items():
+                assert mode_matched_names == expected_names, f"calling recipes_search_results(request) in " \
+                        f"{mode} mode with the search query '{search_query}' yields content containing the recipes " \
+                        f"{sorted(mode_matched_names)} rather than {sorted(expected_names)}"
+
 
 class test_recipes_builder(recipes_test_case):
 
@@ -329,6 +532,29 @@ class test_recipes_builder(recipes_test_case):
                     f"recipes_builder(request) with CGI params '{cgi_query_string}' yields content containing that " \
                     "recipe_name string value"
 
+    def test_recipes_builder_normal_case_only_own_recipes(self):
+        other_owners_recipe_name, own_recipe_name = sorted(self.recipes.keys())[0:2]
+        self.recipes[other_owners_recipe_name].owner = self.test_username + "_other"
+        self.recipes[other_owners_recipe_name].save()
+        for cgi_data in ({"page_size": 25, "page_number": 1}, {"page_size": 25, "after": ""}):
+            cgi_query_string = urllib.parse.urlencode(cgi_data)
+            request = self._middleware_and_user_bplate(self.request_factory.get("/recipes/builder/", data=cgi_data))
+            content = recipes_builder(request).content.decode('utf-8')
+            assert html.escape(own_recipe_name) in content, f"calling recipes_builder(request) with CGI params " \
+                    f"'{cgi_query_string}' doesn't yield content containing the user's own incomplete recipe " \
+                    f"'{own_recipe_name}'"
+            assert html.escape(other_owners_recipe_name) not in content, "calling recipes_builder(request) with " \
+                    f"CGI params '{cgi_query_string}' yields content containing '{other_owners_recipe_name}', an " \
+                    "incomplete recipe belonging to another user"
+        cgi_data = {"page_size": 1, "page_number": 1}
+        request = self._middleware_and_user_bplate(self.request_factory.get("/recipes/builder/", data=cgi_data))
+        content = recipes_builder(request).content.decode('utf-8')
+        number_of_pages = len(self.recipes) - 1
+        assert f'page_number={number_of_pages}">{number_of_pages}</a>' in content \
+                and f'page_number={number_of_pages + 1}"' not in content, "calling recipes_builder(request) with " \
+                f"CGI params '{urllib.parse.urlencode(cgi_data)}' doesn't paginate by the count of the user's own " \
+                "incomplete recipes"
+
     def test_recipes_builder_normal_case_no_recipes_to_display(self):
         for recipe_model_obj in self.recipes.values():
             recipe_model_obj.complete = True
@@ -532,6 +758,12 @@ class test_recipes_builder_mongodb_id_remove_ingredient(recipes_test_case):
                        for serialized_ingredient_obj in recipe_model_obj.ingredients), \
                 "calling recipes_builder_mongodb_id_remove_ingredient() with a Recipe object's mongodb_id and the " \
                 "fdc_id of an ingredient in that recipe doesn't remove that ingredient from the Recipe object"
+        energy_kcal = sum(ingr_dict['servings_number'] * ingr_dict['food']['energy_kcal']
+                          for ingr_dict in recipe_model_obj.ingredients)
+        assert math.isclose(recipe_model_obj.nutrient_totals['energy_kcal'], energy_kcal), \
+                "calling recipes_builder_mongodb_id_remove_ingredient() with a Recipe object's mongodb_id and the " \
+                "fdc_id of an ingredient in that recipe doesn't leave the Recipe object's nutrient_totals in " \
+                "agreement with its remaining ingredients"
 
     def test_recipes_builder_mongodb_id_remove_ingredient_error_case_invalid_mongodb_id(self):
         bogus_mongodb_id = _generate_bogus_mongodb_id(Recipe)
@@ -614,6 +846,12 @@ class test_recipes_builder_mongodb_id_add_ingredient(recipes_test_case):
                    for serialized_ingredient_obj in recipe_model_obj.ingredients), \
                 "calling recipes_builder_mongodb_id_add_ingredient() with a Recipe object's mongodb_id and the fdc_id " \
                 "of an ingredient to add to that recipe doesn't add the ingredient to the Recipe object"
+        energy_kcal = sum(ingr_dict['servings_number'] * ingr_dict['food']['energy_kcal']
+                          for ingr_dict in recipe_model_obj.ingredients)
+        assert math.isclose(recipe_model_obj.nutrient_totals['energy_kcal'], energy_kcal), \
+                "calling recipes_builder_mongodb_id_add_ingredient() with a Recipe object's mongodb_id and the fdc_id " \
+                "of an ingredient to add to that recipe doesn't leave the Recipe object's nutrient_totals in " \
+                "agreement with its ingredients"
 
     def test_recipes_builder_mongodb_id_add_ingredient_error_case_invalid_mongodb_id(self):
         bogus_mongodb_id = _generate_bogus_mongodb_id(Recipe)
@@ -714,9 +952,314 @@ class test_recipes_builder_mongodb_id_add_ingredient(recipes_test_case):
             if 'Bread' in food_model_obj.food_name:
                 assert food_content_str in content, "calling recipes_builder_mongodb_id_add_ingredient() " \
                         f"with valid Recipe objectid and CGI params {cgi_query_string} yields content listing " \
-                        f"the matching food '{food_name}'"
+                        f"the matching food '{food_model_obj.food_name}'"
             else:
                 assert food_content_str not in content, "calling recipes_builder_mongodb_id_add_ingredient() " \
                         f"with valid Recipe objectid and CGI params {cgi_query_string} yields content listing " \
-                        f"the matching food '{food_name}' when it shouldn't"
+                        f"the matching food '{food_model_obj.food_name}' when it shouldn't"
+
+
+class test_ingredient_storage(recipes_test_case):
+
+    @override_settings(RECIPE_INGREDIENT_STORAGE='reference')
+    def test_ingredient_storage_normal_case_reference(self):
+        recipe_model_obj = self.recipes['Peanut Butter Sandwich']
+        food_model_obj = self.foods['Butter']
+        cgi_data = {'fdc_id': food_model_obj.fdc_id, 'servings_number': 2}
+        request = self._middleware_and_user_bplate(
+            self.request_factory.get(f"/recipes/builder/{recipe_model_obj._id}/add_ingredient/", data=cgi_data)
+        )
+        recipes_builder_mongodb_id_add_ingredient(request, recipe_model_obj._id)
+        recipe_model_obj.refresh_from_db()
+        ingredient_dict = recipe_model_obj.ingredients[-1]
+        assert ingredient_dict['food'] is None and ingredient_dict['fdc_id'] == food_model_obj.fdc_id \
+                and ingredient_dict['food_hash'], "adding an ingredient with RECIPE_INGREDIENT_STORAGE set to " \
+                "'reference' doesn't store it as an fdc_id and food_hash without an embedded food"
+        # The food is re-imported with twice the energy, which the recipe
+        # should reflect without being saved again.
+        Food.objects.mongo_update_one({'fdc_id': food_model_obj.fdc_id}, {'$set': {'energy_kcal': 200}})
+        recipe_obj = Recipe_Detailed.from_model_obj(recipe_model_obj, Food_Identity_Map(Food))
+        energy_kcal = sum(ingredient_obj.servings_number * ingredient_obj.food.energy_kcal.amount
+                          for ingredient_obj in recipe_obj.ingredients)
+        assert recipe_obj.ingredients[-1].food_changed and math.isclose(recipe_obj.energy_kcal.amount, energy_kcal), \
+                "a recipe with a reference ingredient whose food has changed since it was added doesn't show " \
+                "nutrient totals summed from the food as it is now"
+        cgi_data = {"fdc_id": food_model_obj.fdc_id}
+        request = self._middleware_and_user_bplate(
+            self.request_factory.get(f"/recipes/builder/{recipe_model_obj._id}/delete/", data=cgi_data)
+        )
+        recipes_builder_mongodb_id_remove_ingredient(request, recipe_model_obj._id)
+        recipe_model_obj.refresh_from_db()
+        energy_kcal = sum(ingr_dict['servings_number'] * ingr_dict['food']['energy_kcal']
+                          for ingr_dict in recipe_model_obj.ingredients)
+        assert len(recipe_model_obj.ingredients) == 2 \
+                and math.isclose(recipe_model_obj.nutrient_totals['energy_kcal'], energy_kcal), \
+                "removing a reference ingredient whose food has changed since it was added doesn't leave the " \
+                "Recipe object's nutrient_totals in agreement with its remaining ingredients"
+
+    def test_ingredient_storage_normal_case_migration(self):
+        recipe_objs_before = {recipe_name: Recipe_Detailed.from_model_obj(Recipe.objects.get(_id=recipe_model_obj._id))
+                              for recipe_name, recipe_model_obj in self.recipes.items()}
+        call_command("migrate_ingredient_storage", "--to", "reference", stdout=io.StringIO())
+        recipe_model_objs = list(Recipe.objects.filter())
+        assert all(ingredient_dict['food'] is None for recipe_model_obj in recipe_model_objs
+                   for ingredient_dict in recipe_model_obj.ingredients), \
+                "migrate_ingredient_storage --to reference leaves ingredients with embedded foods"
+        food_identity_map = Food_Identity_Map(Food)
+        recipe_objs = Recipe_Detailed.resolve_foods([Recipe_Detailed.from_model_obj(recipe_model_obj, food_identity_map)
+                                                     for recipe_model_obj in recipe_model_objs])
+        for recipe_obj in recipe_objs:
+            recipe_obj_before = recipe_objs_before[recipe_obj.recipe_name]
+            assert [(ingredient_obj.food.fdc_id, ingredient_obj.servings_number, ingredient_obj.food_changed)
+                    for ingredient_obj in recipe_obj.ingredients] \
+                    == [(ingredient_obj.food.fdc_id, ingredient_obj.servings_number, False)
+                        for ingredient_obj in recipe_obj_before.ingredients], \
+                    f"recipe '{recipe_obj.recipe_name}' doesn't resolve to the same ingredients after " \
+                    "migrate_ingredient_storage --to reference"
+        assert food_identity_map.counters['queries'] == 1, "resolving the foods of a page of recipes with " \
+                "reference ingredients takes more than one query"
+        recipe_model_obj = self.recipes['Peanut Butter & Honey Sandwich']
+        request = self._middleware_and_user_bplate(self.request_factory.get(f"/recipes/{recipe_model_obj._id}"))
+        content = recipes_mongodb_id(request, recipe_model_obj._id).content.decode('utf-8')
+        assert all(html.escape(food_name) in content for food_name in recipe_ingredients[recipe_model_obj.recipe_name]), \
+                "calling recipes_mongodb_id() on a recipe with reference ingredients doesn't yield content listing " \
+                "its ingredients' foods"
+        call_command("migrate_ingredient_storage", "--to", "embedded", stdout=io.StringIO())
+        for recipe_name, recipe_model_obj in self.recipes.items():
+            recipe_model_obj.refresh_from_db()
+            assert [ingredient_dict['food']['fdc_id'] for ingredient_dict in recipe_model_obj.ingredients] \
+                    == [ingredient_obj.food.fdc_id for ingredient_obj in recipe_objs_before[recipe_name].ingredients], \
+                    f"recipe '{recipe_name}' doesn't have its foods embedded again after " \
+                    "migrate_ingredient_storage --to embedded"
+
+    def test_ingredient_storage_normal_case_food_edited(self):
+        # The listing shows the stored totals and the recipe's page sums them
+        # from the foods, so they must agree after a referenced food changes.
+        call_command("build_nutrient_totals", stdout=io.StringIO())
+        call_command("migrate_ingredient_storage", "--to", "reference", stdout=io.StringIO())
+        food_model_obj = Food.objects.get(fdc_id=food_model_argds['Butter']['fdc_id'])
+        food_model_obj.energy_kcal = 300
+        food_model_obj.save()
+        recipe_name = 'Peanut Butter & Butter Sandwich'
+        recipe_model_obj = self.recipes[recipe_name]
+        energy_kcal = sum(servings_number * (300 if food_name == 'Butter' else food_model_argds[food_name]['energy_kcal'])
+                          for food_name, servings_number in recipe_ingredients[recipe_name].items())
+        request = self._middleware_and_user_bplate(self.request_factory.get("/recipes/"))
+        content = recipes(request).content.decode('utf-8')
+        listing_str = f'<a href="/recipes/{recipe_model_obj._id}/">{html.escape(recipe_name)}</a></b><br/>\n' \
+                f'        Calories: {floatformat(energy_kcal)}<br/>'
+        assert listing_str in content, "calling recipes() after a food used by reference has been edited doesn't " \
+                f"yield content listing the recipe '{recipe_name}' with its total calories, {floatformat(energy_kcal)}"
+        request = self._middleware_and_user_bplate(self.request_factory.get(f"/recipes/{recipe_model_obj._id}"))
+        content = recipes_mongodb_id(request, recipe_model_obj._id).content.decode('utf-8')
+        assert f"<b>{floatformat(energy_kcal)}</b>" in content, "calling recipes_mongodb_id() after a food used by " \
+                f"reference has been edited doesn't yield content containing the recipe '{recipe_name}''s total " \
+                f"calories, {floatformat(energy_kcal)}"
+
+    def test_ingredient_storage_normal_case_food_saved_unchanged(self):
+        # Saving a food whose contents are unchanged leaves the totals of the
+        # recipes that use it alone; the recipe's totals are overwritten by
+        # hand to tell whether they were refreshed.
+        call_command("migrate_ingredient_storage", "--to", "reference", stdout=io.StringIO())
+        recipe_model_obj = self.recipes['Peanut Butter & Butter Sandwich']
+        Recipe.objects.mongo_update_one({'_id': recipe_model_obj._id}, {'$set': {'nutrient_totals': {}}})
+        food_model_obj = Food.objects.get(fdc_id=food_model_argds['Butter']['fdc_id'])
+        food_model_obj.save()
+        recipe_model_obj.refresh_from_db()
+        assert not recipe_model_obj.nutrient_totals, "saving a food used by reference without changing it " \
+                "refreshes the nutrient totals of the recipes that use it"
+        display_name = Food.objects.mongo_find_one({'_id': food_model_obj._id})['display_name']
+        assert display_name == 'Butter', f"saving a food stores the display_name '{display_name}' rather than 'Butter'"
+        food_model_obj.energy_kcal = 300
+        food_model_obj.save()
+        recipe_model_obj.refresh_from_db()
+        assert recipe_model_obj.nutrient_totals, "saving a food used by reference with a changed nutrient doesn't " \
+                "refresh the nutrient totals of the recipes that use it"
+
+
+class test_request_loader(recipes_test_case):
+
+    def test_request_loader_normal_case_add_ingredient(self):
+        recipe_model_obj = self.recipes['Peanut Butter Sandwich']
+        cgi_data = {'search_query': 'Butter', 'page_size': 25, 'page_number': 1}
+        request = self._middleware_and_user_bplate(
+            self.request_factory.get(f"/recipes/builder/{recipe_model_obj._id}/add_ingredient/", data=cgi_data)
+        )
+        recipes_builder_mongodb_id_add_ingredient(request, recipe_model_obj._id)
+        recipes_statistics = request.loader.statistics()['recipes']
+        assert recipes_statistics['queries'] == 1 and recipes_statistics['saved'] == 1, \
+                "calling recipes_builder_mongodb_id_add_ingredient() with a search query fetches its recipe " \
+                "more than once"
+
+    def test_request_loader_normal_case_batching(self):
+        request = self.request_factory.get("/recipes/")
+        fdc_ids = [food_model_obj.fdc_id for food_model_obj in self.foods.values()]
+        food_model_objs = request_loader(request).foods.get_many(fdc_ids + [fdc_ids[0]])
+        request_loader(request).foods.get(fdc_ids[-1])
+        foods_statistics = request.loader.statistics()['foods']
+        assert all(food_model_objs[fdc_id].fdc_id == fdc_id for fdc_id in fdc_ids) \
+                and foods_statistics['queries'] == 1 and foods_statistics['saved'] == len(fdc_ids), \
+                "looking foods up through a request's loader doesn't fetch them in one query and then hold them"
+        assert request_loader(request).recipes.get(_generate_bogus_mongodb_id(Recipe)) is None, \
+                "looking up a nonexistent recipe through a request's loader doesn't yield None"
+
+    @override_settings(DEBUG=True)
+    def test_request_loader_normal_case_middleware(self):
+        food_model_obj = self.foods['Honey']
+
+        def view(request):
+            request.loader.foods.get(food_model_obj.fdc_id)
+            request.loader.foods.get(food_model_obj.fdc_id)
+            return HttpResponse()
+
+        queries_saved_before = loader_statistics().get('foods', 0)
+        response = Request_Loader_Middleware(view)(self.request_factory.get("/recipes/"))
+        assert response['X-Queries-Saved'] == '1', "Request_Loader_Middleware doesn't report the queries its " \
+                "request's loader saved in an X-Queries-Saved header"
+        assert loader_statistics()['foods'] == queries_saved_before + 1, "Request_Loader_Middleware doesn't " \
+                "add the queries its request's loader saved to the process's totals"
+
+
+# Nutrient_Vector doesn't touch the database, but the foods and recipes it's
+# tested against are the ones the other tests use.
+@tag("recipes")
+class test_nutrient_vector(TestCase):
+
+    def _ingredient_dicts(self, recipe_name):
+        return [{'servings_number': servings_number, 'food': food_model_argds[food_name]}
+                for food_name, servings_number in recipe_ingredients[recipe_name].items()]
+
+    def test_nutrient_vector_normal_case_adding(self):
+        peanut_butter = food_model_argds['Peanut Butter']
+        jam = food_model_argds['Strawberry Jam']
+        peanut_butter_vector = Nutrient_Vector.from_dict(peanut_butter)
+        jam_vector = Nutrient_Vector.from_dict(jam)
+        sum_vector = peanut_butter_vector + jam_vector
+        for symbol in Nutrient_Vector.symbols:
+            expected_amount = (peanut_butter.get(symbol) or 0) + (jam.get(symbol) or 0)
+            assert math.isclose(sum_vector[symbol], expected_amount), "adding the Nutrient_Vectors of Peanut " \
+                    f"Butter and Strawberry Jam gave {sum_vector[symbol]} for {symbol}, not {expected_amount}"
+        assert peanut_butter_vector.to_dict() == Nutrient_Vector.from_dict(peanut_butter).to_dict(), \
+                "adding two Nutrient_Vectors with + changed the one on the left"
+        peanut_butter_vector += jam_vector
+        assert peanut_butter_vector.to_dict() == sum_vector.to_dict(), "adding a Nutrient_Vector in place with " \
+                "+= didn't give the same amounts as adding it with +"
+
+    def test_nutrient_vector_normal_case_scaling(self):
+        butter = food_model_argds['Butter']
+        butter_vector = Nutrient_Vector.from_dict(butter)
+        scaled_vector = butter_vector * 2.5
+        for symbol in Nutrient_Vector.symbols:
+            expected_amount = 2.5 * (butter.get(symbol) or 0)
+            assert math.isclose(scaled_vector[symbol], expected_amount), "scaling the Nutrient_Vector of Butter " \
+                    f"by 2.5 gave {scaled_vector[symbol]} for {symbol}, not {expected_amount}"
+        assert butter_vector['energy_kcal'] == butter['energy_kcal'], "scaling a Nutrient_Vector changed the " \
+                "vector it was scaled from"
+        assert (Nutrient_Vector() * 3).to_dict() == dict.fromkeys(Nutrient_Vector.symbols, 0), \
+                "scaling an empty Nutrient_Vector didn't leave every amount 0"
+
+    def test_nutrient_vector_normal_case_view(self):
+        honey_vector = Nutrient_Vector.from_dict(food_model_argds['Honey'])
+        for symbol in Nutrient_Vector.symbols:
+            nutrient_view = honey_vector.nutrient(symbol)
+            nutrient_obj = Nutrient.from_symbol(symbol)
+            nutrient_obj.amount = food_model_argds['Honey'].get(symbol) or 0
+            assert isinstance(nutrient_view, Nutrient_View) and isinstance(nutrient_view, Nutrient), \
+                    f"Nutrient_Vector.nutrient('{symbol}') didn't return a Nutrient_View, which is a Nutrient"
+            assert nutrient_view.serialize() == nutrient_obj.serialize(), f"the Nutrient_View for {symbol} in " \
+                    "the Nutrient_Vector of Honey didn't serialize the same as a Nutrient with the same amount, " \
+                    "with its name, units, fdc_code, symbol and daily value percentage"
+        nutrient_view = honey_vector.nutrient('sugars_g')
+        nutrient_view.amount = 41
+        assert honey_vector['sugars_g'] == 41, "setting the amount of a Nutrient_View didn't write through to " \
+                "the Nutrient_Vector it's a view of"
+        honey_vector['sugars_g'] = 20.5
+        assert nutrient_view.amount == 20.5, "setting an amount in a Nutrient_Vector didn't show in a " \
+                "Nutrient_View of it"
+
+    # Recipe totals used to be summed as dicts by sum_nutrient_totals(), which
+    # takes units from the same table Nutrient_View does.
+    def test_nutrient_vector_normal_case_recipe_totals(self):
+        for recipe_name in recipe_ingredients:
+            ingredient_dicts = self._ingredient_dicts(recipe_name)
+            nutrient_totals = sum_nutrient_totals(ingredient_dicts)
+            recipe_obj = Recipe_Detailed(recipe_name, ingredients=ingredient_dicts)
+            for symbol in Nutrient_Vector.symbols:
+                nutrient_view = getattr(recipe_obj, symbol)
+                assert math.isclose(nutrient_view.amount, nutrient_totals[symbol], abs_tol=1e-9), \
+                        f"the {symbol} total of '{recipe_name}' summed from its ingredients' Nutrient_Vectors is " \
+                        f"{nutrient_view.amount}, but sum_nutrient_totals() gives {nutrient_totals[symbol]}"
+                assert nutrient_view.units == Nutrient.from_symbol(symbol).units, f"the {symbol} total of " \
+                        f"'{recipe_name}' has units '{nutrient_view.units}', not " \
+                        f"'{Nutrient.from_symbol(symbol).units}'"
+            stored_totals_obj = Recipe_Detailed(recipe_name, ingredients=ingredient_dicts,
+                                                nutrient_totals=nutrient_totals)
+            assert all(getattr(stored_totals_obj, symbol).amount == nutrient_totals[symbol]
+                       for symbol in Nutrient_Vector.symbols), f"a Recipe_Detailed for '{recipe_name}' given its " \
+                    "stored nutrient_totals didn't read its totals back from them unchanged"
 
+
+@tag("recipes")
+class test_nutrition_engine(TestCase):
+
+    def _assert_totals_match(self, totals_row, ingredient_dicts, description):
+        nutrient_totals = sum_nutrient_totals(ingredient_dicts)
+        for index, symbol in enumerate(Nutrient_Vector.symbols):
+            assert math.isclose(totals_row[index], nutrient_totals[symbol], abs_tol=1e-9), \
+                    f"nutrition_engine.totals() gives {totals_row[index]} for {symbol} in {description}, but " \
+                    f"sum_nutrient_totals() gives {nutrient_totals[symbol]}"
+
+    def _ingredient_dicts(self, recipe_name):
+        return [{'servings_number': servings_number, 'food': food_model_argds[food_name]}
+                for food_name, servings_number in recipe_ingredients[recipe_name].items()]
+
+    def test_nutrition_engine_normal_case_recipe(self):
+        for recipe_name in recipe_ingredients:
+            ingredient_dicts = self._ingredient_dicts(recipe_name)
+            food_dicts = [ingredient_dict['food'] for ingredient_dict in ingredient_dicts]
+            servings_numbers = [ingredient_dict['servings_number'] for ingredient_dict in ingredient_dicts]
+            self._assert_totals_match(nutrition_engine.totals(nutrition_engine.nutrient_matrix(food_dicts),
+                                                              servings_numbers),
+                                      ingredient_dicts, f"'{recipe_name}' from its food dicts")
+            food_objs = [Food_Detailed.from_mongo_doc(food_dict) for food_dict in food_dicts]
+            self._assert_totals_match(nutrition_engine.totals(nutrition_engine.nutrient_matrix(food_objs),
+                                                              servings_numbers),
+                                      ingredient_dicts, f"'{recipe_name}' from its Food_Detailed objects")
+
+    def test_nutrition_engine_normal_case_grouped(self):
+        ingredient_dicts_by_recipe = [self._ingredient_dicts(recipe_name) for recipe_name in recipe_ingredients]
+        food_dicts, servings_numbers, group_ids = list(), list(), list()
+        for group_id, ingredient_dicts in enumerate(ingredient_dicts_by_recipe):
+            for ingredient_dict in ingredient_dicts:
+                food_dicts.append(ingredient_dict['food'])
+                servings_numbers.append(ingredient_dict['servings_number'])
+                group_ids.append(group_id)
+        # One more group with no ingredients at all.
+        totals_matrix = nutrition_engine.totals(nutrition_engine.nutrient_matrix(food_dicts), servings_numbers,
+                                                group_ids, len(ingredient_dicts_by_recipe) + 1)
+        for recipe_name, totals_row, ingredient_dicts in zip(recipe_ingredients, totals_matrix,
+                                                             ingredient_dicts_by_recipe):
+            self._assert_totals_match(totals_row, ingredient_dicts, f"'{recipe_name}' totaled in a group")
+        self._assert_totals_match(totals_matrix[-1], [], "a group with no ingredients")
+
+    def test_nutrition_engine_normal_case_empty(self):
+        self._assert_totals_match(nutrition_engine.totals(nutrition_engine.nutrient_matrix([]), []), [],
+                                  "a recipe with no ingredients")
+
+    # Food dicts leave out the nutrients a food doesn't have, and foods read
+    # from some sources store them as None; both count as 0.
+    def test_nutrition_engine_normal_case_missing_nutrients(self):
+        ingredient_dicts = [
+            {'servings_number': 2, 'food': {'fdc_id': 1, 'food_name': 'Water', 'serving_size': 240,
+                                            'serving_units': 'ml'}},
+            {'servings_number': 0.5, 'food': {'fdc_id': 2, 'food_name': 'Lemon Juice', 'serving_size': 15,
+                                              'serving_units': 'ml', 'energy_kcal': 3, 'sugars_g': None,
+                                              'potassium_mg': 16}},
+            {'servings_number': 1.25, 'food': food_model_argds['Strawberry Jam']},
+        ]
+        food_dicts = [ingredient_dict['food'] for ingredient_dict in ingredient_dicts]
+        servings_numbers = [ingredient_dict['servings_number'] for ingredient_dict in ingredient_dicts]
+        totals_row = nutrition_engine.totals(nutrition_engine.nutrient_matrix(food_dicts), servings_numbers)
+        self._assert_totals_match(totals_row, ingredient_dicts, "a recipe whose foods are missing nutrients")
+        assert not any(math.isnan(amount) for amount in totals_row), "nutrition_engine.totals() gave NaN for a " \
+                "nutrient that some of a recipe's foods are missing"
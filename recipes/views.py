@@ -1,25 +1,25 @@
 #!/usr/bin/python
 
 import math
+import re
 
 from bson.objectid import ObjectId, InvalidId
 
 from decouple import config
 
-from operator import and_, attrgetter
-
-from functools import reduce
-
 from django.shortcuts import redirect
 from django.views.decorators.http import require_http_methods
 from django.http import HttpResponse
 from django.template import loader
-from django.db.models import Q
 
 from .models import Food, Recipe, Ingredient
-from nutritracker.utils import Nutrient, Recipe_Detailed, Food_Detailed, Navigation_Links_Displayer, \
+from foods import models as foods_models
+from foods.models import result_counts
+from nutritracker.utils import Recipe_Detailed, Food_Detailed, Navigation_Links_Displayer, \
         generate_pagination_links, slice_output_list_by_page, retrieve_pagination_params, get_cgi_params, \
-        cast_to_int, check_str_param
+        cast_to_int, check_str_param, slice_queryset_by_cursor, slice_collection_by_cursor, sort_by_key_order, \
+        Food_Row, ingredient_fdc_id
+from nutritracker.middleware import request_loader
 
 
 navigation_links_displayer = Navigation_Links_Displayer({'/recipes/': "Main Recipes List",
@@ -41,17 +41,60 @@ default_page_size = config("DEFAULT_PAGE_SIZE")
 _retrieve_user_obj = lambda request: request.user if request.user.is_authenticated else None
 
 
+# Recipes are fetched through the request's loader, so a view that needs
+# the same recipe twice only fetches it once; see nutritracker.middleware.
 def _fetch_recipe_or_404(mongodb_id, template, context, request):
     try:
-        recipe_model_obj = Recipe.objects.get(_id=ObjectId(mongodb_id))
-    except (Recipe.DoesNotExist, InvalidId):
-        context["error"] = True
-        context["message"] = (f"Error 404: no object in 'recipes' collection in 'nutritracker' "
-                              f"data store with _id='{mongodb_id}'")
-        return HttpResponse(template.render(context, request), status=404)
+        recipe_model_obj = request_loader(request).recipes.get(ObjectId(mongodb_id))
+    except InvalidId:
+        recipe_model_obj = None
+    if recipe_model_obj is None:
+        return _recipe_404(mongodb_id, template, context, request)
     return recipe_model_obj
 
 
+# For views that only display the recipe: its document is read with pymongo,
+# for Recipe_Detailed.from_mongo_doc(), skipping djongo's query translation
+# and the model object.
+def _fetch_recipe_doc_or_404(mongodb_id, template, context, request):
+    try:
+        recipe_doc = Recipe.objects.mongo_find_one({'_id': ObjectId(mongodb_id)})
+    except InvalidId:
+        recipe_doc = None
+    if recipe_doc is None:
+        return _recipe_404(mongodb_id, template, context, request)
+    return recipe_doc
+
+
+def _recipe_404(mongodb_id, template, context, request):
+    context["error"] = True
+    context["message"] = (f"Error 404: no object in 'recipes' collection in 'nutritracker' "
+                          f"data store with _id='{mongodb_id}'")
+    return HttpResponse(template.render(context, request), status=404)
+
+
+# The recipes list and search results only show each recipe's name and
+# calories, so recipes are read for them without their ingredients, and
+# shown with their stored nutrient_totals. Any from before nutrient_totals
+# existed are read again whole, in one query, to sum theirs.
+listing_fields = '_id', 'recipe_name', 'display_name', 'complete', 'nutrient_totals'
+
+
+def _listing_recipe_objs(request, recipe_model_objs):
+    unsummed_mongodb_ids = [recipe_model_obj._id for recipe_model_obj in recipe_model_objs
+                            if not recipe_model_obj.nutrient_totals]
+    whole_model_objs = ({recipe_model_obj._id: recipe_model_obj
+                         for recipe_model_obj in Recipe.objects.filter(_id__in=unsummed_mongodb_ids)}
+                        if unsummed_mongodb_ids else {})
+    food_docs = request_loader(request).food_docs
+    recipe_objs = [Recipe_Detailed.from_model_obj(whole_model_objs.get(recipe_model_obj._id, recipe_model_obj),
+                                                  food_docs)
+                   for recipe_model_obj in recipe_model_objs]
+    Recipe_Detailed.resolve_foods([recipe_obj for recipe_obj in recipe_objs
+                                   if recipe_obj.mongodb_id in whole_model_objs])
+    return recipe_objs
+
+
 @require_http_methods(["GET"])
 def recipes(request):
     template = loader.get_template('recipes/recipes.html')
@@ -73,11 +116,25 @@ def recipes(request):
     page_size = retval["page_size"]
     page_number = retval["page_number"]
 
-    recipe_objs = [Recipe_Detailed.from_model_obj(recipe_model_obj)
-                   for recipe_model_obj in Recipe.objects.filter(owner=user_model_obj.username)]
-    recipe_objs = list(filter(lambda recipe_obj: recipe_obj.complete is True, recipe_objs))
-    recipe_objs.sort(key=attrgetter('recipe_name'))
-    number_of_results = len(recipe_objs)
+    # djongo can't parse the WHERE NOT "complete" that filter(complete=False)
+    # compiles to, so boolean filters are written as __in lookups.
+    recipes_queryset = Recipe.objects.filter(owner=user_model_obj.username, complete__in=[True]).only(*listing_fields)
+
+    if retval["cursor_mode"]:
+        recipe_model_objs, prev_cursor, next_cursor = slice_queryset_by_cursor(
+            recipes_queryset, 'display_name', page_size, retval["after"], retval["before"])
+        if not recipe_model_objs:
+            context["message"] = "No more results"
+        context["more_than_one_page"] = prev_cursor is not None or next_cursor is not None
+        context["pagination_links"] = generate_pagination_links("/recipes/", None, page_size, None,
+                                                                cursors=(prev_cursor, next_cursor))
+        context['recipe_objs'] = _listing_recipe_objs(request, recipe_model_objs)
+        return HttpResponse(template.render(context, request))
+
+    # The database filters and counts the user's recipes, and only the ones on
+    # this page are transferred and converted to Recipe_Detailed objects. The
+    # count is cached until a recipe is saved or deleted.
+    number_of_results = result_counts.count(Recipe, {'owner': user_model_obj.username, 'complete': True})
     number_of_pages = math.ceil(number_of_results / page_size)
 
     if page_number > number_of_pages:
@@ -86,8 +143,10 @@ def recipes(request):
         context["pagination_links"] = generate_pagination_links("/recipes/", number_of_results, page_size, page_number)
         return HttpResponse(template.render(context, request))
 
-    if len(recipe_objs) > page_size:
-        recipe_objs = slice_output_list_by_page(recipe_objs, page_size, page_number)
+    recipe_model_objs = slice_output_list_by_page(recipes_queryset.order_by('display_name', '_id'), page_size,
+                                                  page_number)
+    recipe_objs = _listing_recipe_objs(request, recipe_model_objs)
+    if number_of_results > page_size:
         context["more_than_one_page"] = True
         context["pagination_links"] = generate_pagination_links("/recipes/", number_of_results, page_size, page_number)
 
@@ -101,12 +160,12 @@ def recipes_mongodb_id(request, mongodb_id):
     context = {'subordinate_navigation': navigation_links_displayer.href_list_wo_one_callable("/recipes/"),
                'error': False, 'message': ''}
 
-    retval = _fetch_recipe_or_404(mongodb_id, template, context, request)
+    retval = _fetch_recipe_doc_or_404(mongodb_id, template, context, request)
     if isinstance(retval, HttpResponse):
         return retval
-    recipe_model_obj = retval
+    recipe_doc = retval
 
-    recipe_obj = Recipe_Detailed.from_json_obj(recipe_model_obj.serialize())
+    recipe_obj = Recipe_Detailed.from_mongo_doc(recipe_doc, request_loader(request).food_docs)
     context['recipe_obj'] = context['food_or_recipe_obj'] = recipe_obj
     return HttpResponse(template.render(context, request))
 
@@ -120,6 +179,14 @@ def recipes_search(request):
     return HttpResponse(template.render(context, request))
 
 
+# The filter recipes_search_results() searches by in both its modes: recipes
+# whose names contain every keyword. The keywords are normalized so the same
+# search in another order or case shares a cached count.
+def _recipe_search_filter(search_query):
+    keywords = sorted(set(search_query.lower().split()))
+    return {'$and': [{'recipe_name': {'$regex': re.escape(keyword), '$options': 'i'}} for keyword in keywords]}
+
+
 @require_http_methods(["GET"])
 def recipes_search_results(request):
     search_url = "/recipes/search/"
@@ -134,36 +201,51 @@ def recipes_search_results(request):
     search_query = retval["search_query"]
     page_size = retval["page_size"]
     page_number = retval["page_number"]
-    kws = search_query.strip().split()
-
-    # This is equivelant to q_term = (Q(recipe_name__icontains=kws[0]) & Q(recipe_name__icontains=kws[1])
-    #                                 & ... & Q(recipe_name__icontains=kws[-1]))
-    q_term = reduce(and_, (Q(recipe_name__icontains=kw) for kw in kws))
-    recipe_model_objs = list(Recipe.objects.filter(q_term))
-    recipe_model_objs.sort(key=attrgetter('recipe_name'))
-    number_of_results = len(recipe_model_objs)
+
+    # Both modes search by the same filter: the cursor mode pages through the
+    # matches by their display_name keys, and the page number mode counts
+    # them, with the count cached, and skips to the page's matches, so neither
+    # transfers the recipes on other pages.
+    search_filter = _recipe_search_filter(search_query)
+
+    if retval["cursor_mode"]:
+        page_mongodb_ids, prev_cursor, next_cursor = slice_collection_by_cursor(
+            Recipe, search_filter, 'display_name', page_size, retval["after"], retval["before"])
+        recipe_model_objs = sort_by_key_order(Recipe.objects.filter(_id__in=page_mongodb_ids).only(*listing_fields),
+                                              page_mongodb_ids)
+        if not recipe_model_objs:
+            context["message"] = "No matches" if retval["after"] is None and retval["before"] is None \
+                                 else "No more results"
+        context["more_than_one_page"] = prev_cursor is not None or next_cursor is not None
+        context["pagination_links"] = generate_pagination_links("/recipes/search_results/", None, page_size, None,
+                                                                search_query=search_query,
+                                                                cursors=(prev_cursor, next_cursor))
+        context['recipe_objs'] = _listing_recipe_objs(request, recipe_model_objs)
+        return HttpResponse(template.render(context, request))
+
+    number_of_results = result_counts.count(Recipe, search_filter)
     number_of_pages = math.ceil(number_of_results / page_size)
 
-    if not len(recipe_model_objs):
+    if not number_of_results:
         context["message"] = "No matches"
         return HttpResponse(template.render(context, request))
 
     elif page_number > number_of_pages:
         context["more_than_one_page"] = True
         context["message"] = "No more results"
-        context["pagination_links"] = generate_pagination_links("/recipes/search_results/", len(recipe_model_objs),
+        context["pagination_links"] = generate_pagination_links("/recipes/search_results/", number_of_results,
                                                                 page_size, page_number, search_query=search_query)
         return HttpResponse(template.render(context, request))
 
-    recipe_objs = [Recipe_Detailed.from_model_obj(recipe_model_obj) for recipe_model_obj in recipe_model_objs]
-    if len(recipe_objs) > page_size:
+    page_mongodb_ids = [recipe_doc['_id'] for recipe_doc in Recipe.objects.mongo_find(search_filter, {'_id': True})
+                        .sort([('display_name', 1), ('_id', 1)]).skip((page_number - 1) * page_size).limit(page_size)]
+    recipe_model_objs = sort_by_key_order(Recipe.objects.filter(_id__in=page_mongodb_ids).only(*listing_fields),
+                                          page_mongodb_ids)
+    context['recipe_objs'] = _listing_recipe_objs(request, recipe_model_objs)
+    if number_of_results > page_size:
         context["more_than_one_page"] = True
-        context["pagination_links"] = generate_pagination_links("/recipes/search_results/", len(recipe_objs),
+        context["pagination_links"] = generate_pagination_links("/recipes/search_results/", number_of_results,
                                                                 page_size, page_number, search_query=search_query)
-        context['recipe_objs'] = slice_output_list_by_page(recipe_objs, page_size, page_number)
-    else:
-        context["more_than_one_page"] = False
-        context['recipe_objs'] = recipe_objs
     return HttpResponse(template.render(context, request))
 
 
@@ -173,33 +255,57 @@ def recipes_builder(request):
     context = {'subordinate_navigation': navigation_links_displayer.href_list_wo_one_callable("/recipes/builder/"),
                'more_than_one_page': False, 'error': False, 'message': ''}
 
+    user_model_obj = _retrieve_user_obj(request)
+
+    if user_model_obj is None:
+        context["error"] = True
+        context["message"] = "You are not logged in; no recipes to display."
+        context['recipe_objs'] = ()
+        return HttpResponse(template.render(context, request))
+
     retval = retrieve_pagination_params(template, context, request, default_page_size, query=False)
     if isinstance(retval, HttpResponse):
         return retval
     page_size = retval["page_size"]
     page_number = retval["page_number"]
 
-    recipe_objs = [Recipe_Detailed.from_model_obj(recipe_model_obj) for recipe_model_obj in Recipe.objects.filter()]
-    recipe_objs = list(filter(lambda recipe_obj: recipe_obj.complete is False, recipe_objs))
-    recipe_objs.sort(key=attrgetter('recipe_name'))
+    # Like recipes(), this lists only the user's own recipes, without their
+    # ingredients.
+    recipes_queryset = Recipe.objects.filter(owner=user_model_obj.username, complete__in=[False]).only(*listing_fields)
+
+    if retval["cursor_mode"]:
+        recipe_model_objs, prev_cursor, next_cursor = slice_queryset_by_cursor(
+            recipes_queryset, 'display_name', page_size, retval["after"], retval["before"])
+        if not recipe_model_objs:
+            context["message"] = "No recipes in the works" if retval["after"] is None and retval["before"] is None \
+                                 else "No more recipes"
+        context["more_than_one_page"] = prev_cursor is not None or next_cursor is not None
+        context["pagination_links"] = generate_pagination_links("/recipes/builder/", None, page_size, None,
+                                                                cursors=(prev_cursor, next_cursor))
+        context['recipe_objs'] = _listing_recipe_objs(request, recipe_model_objs)
+        return HttpResponse(template.render(context, request))
 
-    if len(recipe_objs) == 0:
+    number_of_results = result_counts.count(Recipe, {'owner': user_model_obj.username, 'complete': False})
+    if number_of_results == 0:
         context["message"] = "No recipes in the works"
         return HttpResponse(template.render(context, request))
 
-    number_of_results = len(recipe_objs)
     number_of_pages = math.ceil(number_of_results / page_size)
 
     if page_number > number_of_pages:
         context["more_than_one_page"] = True
         context["message"] = "No more recipes"
-        context["pagination_links"] = generate_pagination_links("/recipes/builder/", number_of_results, page_size, page_number)
+        context["pagination_links"] = generate_pagination_links("/recipes/builder/", number_of_results, page_size,
+                                                                page_number)
         return HttpResponse(template.render(context, request))
 
-    if len(recipe_objs) > page_size:
-        recipe_objs = slice_output_list_by_page(recipe_objs, page_size, page_number)
+    recipe_model_objs = slice_output_list_by_page(recipes_queryset.order_by('display_name', '_id'), page_size,
+                                                  page_number)
+    recipe_objs = _listing_recipe_objs(request, recipe_model_objs)
+    if number_of_results > page_size:
         context["more_than_one_page"] = True
-        context["pagination_links"] = generate_pagination_links("/recipes/builder/", number_of_results, page_size, page_number)
+        context["pagination_links"] = generate_pagination_links("/recipes/builder/", number_of_results, page_size,
+                                                                page_number)
 
     context['recipe_objs'] = recipe_objs
 
@@ -220,7 +326,9 @@ def recipes_builder_new(request):
     if isinstance(retval, HttpResponse):
         return retval
     recipe_name = retval
-    recipe_model_obj = Recipe(recipe_name=recipe_name, complete=False, ingredients=list())
+    user_model_obj = _retrieve_user_obj(request)
+    recipe_model_obj = Recipe(owner=user_model_obj.username if user_model_obj is not None else "",
+                              recipe_name=recipe_name, complete=False, ingredients=list())
     recipe_model_obj.save()
     mongodb_id = recipe_model_obj._id
     return redirect(f"/recipes/builder/{mongodb_id}/")
@@ -236,8 +344,10 @@ def recipes_builder_mongodb_id(request, mongodb_id):
     if isinstance(retval, HttpResponse):
         return retval
     recipe_model_obj = retval
+    loader_obj = request_loader(request)
 
-    context["food_or_recipe_obj"] = context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj)
+    context["food_or_recipe_obj"] = context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj,
+                                                                                           loader_obj.food_docs)
     return HttpResponse(template.render(context, request))
 
 
@@ -256,8 +366,10 @@ def recipes_builder_mongodb_id_delete(request, mongodb_id):
     if isinstance(retval, HttpResponse):
         return retval
     recipe_model_obj = retval
+    loader_obj = request_loader(request)
 
-    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj)
+    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj, loader_obj.food_docs)
+    loader_obj.recipes.discard(recipe_model_obj._id)
     recipe_model_obj.delete()
     return HttpResponse(template.render(context, request))
 
@@ -274,6 +386,7 @@ def recipes_builder_mongodb_id_remove_ingredient(request, mongodb_id):
     if isinstance(retval, HttpResponse):
         return retval
     recipe_model_obj = retval
+    loader_obj = request_loader(request)
 
     if not len(cgi_params.keys()):
         return redirect(f"/recipes/builder/{mongodb_id}/add_ingredient/")
@@ -286,11 +399,10 @@ def recipes_builder_mongodb_id_remove_ingredient(request, mongodb_id):
 
     found = False
     for index in range(len(recipe_model_obj.ingredients)):
-        if recipe_model_obj.ingredients[index]["food"]["fdc_id"] != fdc_id:
+        if ingredient_fdc_id(recipe_model_obj.ingredients[index]) != fdc_id:
             continue
         context["servings_number"] = recipe_model_obj.ingredients[index]["servings_number"]
-        ingredient_dict = recipe_model_obj.ingredients[index]
-        del recipe_model_obj.ingredients[index]
+        ingredient_dict = recipe_model_obj.remove_ingredient(index, loader_obj.food_docs)
         found = True
         break
     if not found:
@@ -299,13 +411,19 @@ def recipes_builder_mongodb_id_remove_ingredient(request, mongodb_id):
         return HttpResponse(template.render(context, request))
     recipe_model_obj.save()
 
-    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj)
+    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj, loader_obj.food_docs)
 
-    food_model_obj = Food.objects.get(fdc_id=fdc_id)
-    food_obj = Food_Detailed.from_model_obj(food_model_obj)
+    # Removing a reference ingredient has already looked its food up.
+    food_doc = loader_obj.food_docs.get(fdc_id)
+    if food_doc is None:
+        context["error"] = True
+        context["message"] = (f"error: no object in 'foods' collection in 'nutritracker' "
+                              f"data store with fdc_id='{fdc_id}'")
+        return HttpResponse(template.render(context, request))
+    food_obj = Food_Detailed.from_mongo_doc(food_doc)
     context["food_obj"] = food_obj
 
-    context["ingredient_serving_qty"] = ingredient_dict["servings_number"] * food_model_obj.serving_size
+    context["ingredient_serving_qty"] = ingredient_dict["servings_number"] * food_doc["serving_size"]
 
     context["mode"] = "removed"
     return HttpResponse(template.render(context, request))
@@ -324,8 +442,9 @@ def recipes_builder_mongodb_id_add_ingredient(request, mongodb_id):
     if isinstance(retval, HttpResponse):
         return retval
     recipe_model_obj = retval
+    loader_obj = request_loader(request)
 
-    recipe_obj = Recipe_Detailed.from_model_obj(recipe_model_obj)
+    recipe_obj = Recipe_Detailed.from_model_obj(recipe_model_obj, loader_obj.food_docs)
     context["recipe_obj"] = recipe_obj
 
     if "fdc_id" in cgi_params:
@@ -346,9 +465,8 @@ def recipes_builder_mongodb_id_add_ingredient(request, mongodb_id):
             context["message"] = "value for servings_number must be a floating-point number greater than zero"
             return HttpResponse(template.render(context, request))
 
-        try:
-            food_model_obj = Food.objects.get(fdc_id=fdc_id)
-        except Food.DoesNotExist:
+        food_model_obj = loader_obj.foods.get(fdc_id)
+        if food_model_obj is None:
             context["error"] = True
             context["message"] = (f"error: no object in 'foods' collection in 'nutritracker' "
                                   f"data store with fdc_id='{fdc_id}'")
@@ -359,8 +477,7 @@ def recipes_builder_mongodb_id_add_ingredient(request, mongodb_id):
         food_obj = Food_Detailed.from_model_obj(food_model_obj)
         context["food_obj"] = food_obj
         ingredient_obj = Ingredient(servings_number=servings_number, food=food_model_obj.serialize())
-        recipe_model_obj = Recipe.objects.get(_id=ObjectId(mongodb_id))
-        recipe_model_obj.ingredients.append(ingredient_obj.serialize())
+        recipe_model_obj.add_ingredient(ingredient_obj.serialize())
         recipe_model_obj.save()
         context["mode"] = "added"
         return HttpResponse(template.render(context, request))
@@ -373,41 +490,38 @@ def recipes_builder_mongodb_id_add_ingredient(request, mongodb_id):
         page_size = retval["page_size"]
         page_number = retval["page_number"]
         context["searched"] = True
-        kws = search_query.strip().split()
 
         retval = _fetch_recipe_or_404(mongodb_id, template, context, request)
         if isinstance(retval, HttpResponse):
             return retval
         recipe_model_obj = retval
 
-        context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj)
+        context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj, loader_obj.food_docs)
 
-        # This is equivelant to q_term = (Q(recipe_name__icontains=kws[0]) & Q(recipe_name__icontains=kws[1])
-        #                                 & ... & Q(recipe_name__icontains=kws[-1]))
-        q_term = reduce(and_, (Q(food_name__icontains=kw) for kw in kws))
-        food_objs = list(Food.objects.filter(q_term))
-        food_objs.sort(key=attrgetter('food_name'))
-        if not len(food_objs):
+        # A food matches if its name contains every keyword; the results are
+        # ranked by how well they match. See foods.models.search_food_ids().
+        ranked_mongodb_ids = foods_models.search_food_ids(search_query)
+        number_of_results = len(ranked_mongodb_ids)
+        if not number_of_results:
             context["message"] = "No matches"
             return HttpResponse(template.render(context, request))
-        elif len(food_objs) <= page_size and page_number > 1:
-            context["more_than_one_page"] = True
+
+        number_of_pages = math.ceil(number_of_results / page_size)
+        context["more_than_one_page"] = number_of_results > page_size or page_number > 1
+        context["pagination_links"] = generate_pagination_links(f"/recipes/builder/{mongodb_id}/add_ingredient/",
+                                                                number_of_results, page_size, page_number,
+                                                                search_query=search_query)
+        if page_number > number_of_pages:
             context["message"] = "No more results"
-            context["pagination_links"] = generate_pagination_links(f"recipes/builder/{mongodb_id}/add_ingredient/",
-                                                                    len(food_objs), page_size, page_number,
-                                                                    search_query=search_query)
             return HttpResponse(template.render(context, request))
 
-        food_objs = [Food_Detailed.from_model_obj(food_model_obj) for food_model_obj in food_objs]
-        if len(food_objs) > page_size:
-            context["more_than_one_page"] = True
-            context["pagination_links"] = generate_pagination_links(f"recipes/builder/{mongodb_id}/add_ingredient/",
-                                                                    len(food_objs), page_size, page_number,
-                                                                    search_query=search_query)
-            context['food_objs'] = slice_output_list_by_page(food_objs, page_size, page_number)
-        else:
-            context["more_than_one_page"] = False
-            context['food_objs'] = food_objs
+        # This app's Food model can't declare display_name (see its save()), so
+        # the rows are read through the foods app's model of the same
+        # collection.
+        page_mongodb_ids = slice_output_list_by_page(ranked_mongodb_ids, page_size, page_number)
+        food_model_objs = sort_by_key_order(foods_models.Food.objects.filter(_id__in=page_mongodb_ids)
+                                            .only(*Food_Row.fields), page_mongodb_ids)
+        context['food_objs'] = [Food_Row.from_model_obj(food_model_obj) for food_model_obj in food_model_objs]
 
         context["mode"] = "neutral"
         return HttpResponse(template.render(context, request))
@@ -424,8 +538,9 @@ def recipes_builder_mongodb_id_add_ingredient_fdc_id(request, mongodb_id, fdc_id
     if isinstance(retval, HttpResponse):
         return retval
     recipe_model_obj = retval
+    loader_obj = request_loader(request)
 
-    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj)
+    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj, loader_obj.food_docs)
 
     food_model_objs = Food.objects.filter(fdc_id=fdc_id)
 
@@ -457,12 +572,12 @@ def recipes_builder_mongodb_id_add_ingredient_fdc_id_confirm(request, mongodb_id
     if isinstance(retval, HttpResponse):
         return retval
     recipe_model_obj = retval
+    loader_obj = request_loader(request)
 
-    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj)
+    context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj, loader_obj.food_docs)
 
-    try:
-        food_model_obj = Food.objects.get(fdc_id=fdc_id)
-    except Food.DoesNotExist:
+    food_model_obj = loader_obj.foods.get(fdc_id)
+    if food_model_obj is None:
         context["error"] = True
         context["message"] = (f"Error 404: no object in 'foods' collection in 'nutritracker' "
                               f"data store with fdc_id={fdc_id}")
@@ -483,11 +598,7 @@ def recipes_builder_mongodb_id_add_ingredient_fdc_id_confirm(request, mongodb_id
 
     context["servings_number"] = servings_number
 
-    for nutrient_symbol in Nutrient.nutrient_symbols_to_numbers:
-        nutrient_in_food = getattr(food_obj, nutrient_symbol, None)
-        if nutrient_in_food is None:
-            continue
-        nutrient_in_food.amount *= servings_number
+    food_obj.nutrients = food_obj.nutrients * servings_number
     food_obj.serving_size *= servings_number
     context['food_or_recipe_obj'] = context['food_obj'] = food_obj
 
@@ -504,10 +615,12 @@ def recipes_builder_mongodb_id_finish(request, mongodb_id):
     if isinstance(retval, HttpResponse):
         return retval
     recipe_model_obj = retval
+    loader_obj = request_loader(request)
 
     recipe_model_obj.complete = True
     recipe_model_obj.save()
-    context["food_or_recipe_obj"] = context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj)
+    context["food_or_recipe_obj"] = context["recipe_obj"] = Recipe_Detailed.from_model_obj(recipe_model_obj,
+                                                                                           loader_obj.food_docs)
 
     return HttpResponse(template.render(context, request))
 
@@ -23,8 +23,17 @@ class Account(models.Model):
     activity_level      = models.PositiveSmallIntegerField(     default=0,   verbose_name="Activity level (1-5)")
     weight_goal         = models.SmallIntegerField(             default=0,   verbose_name="Weight goal")
 
+    objects = models.DjongoManager()
+
     class Meta:
         managed = False
         db_table = 'accounts'
         app_label = 'users'
+        # This model is unmanaged, so these are never created by a migration;
+        # `./manage.py ensure_indexes` creates them.
+        indexes = [models.Index(fields=['username'], name='username')]
+
+    # Options for `./manage.py ensure_indexes` to pass to create_index(); see
+    # nutritracker.indexes.
+    index_options = {'username': {'unique': True}}
 